@@ -3,8 +3,8 @@ from .models import UploadedFile, EquipmentData
 
 @admin.register(UploadedFile)
 class UploadedFileAdmin(admin.ModelAdmin):
-    list_display = ('file_name', 'uploaded_at')
-    list_filter = ('uploaded_at',)
+    list_display = ('file_name', 'uploaded_at', 'status', 'rows_processed')
+    list_filter = ('uploaded_at', 'status')
 
 @admin.register(EquipmentData)
 class EquipmentDataAdmin(admin.ModelAdmin):
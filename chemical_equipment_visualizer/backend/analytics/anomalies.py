@@ -0,0 +1,177 @@
+from functools import reduce
+from operator import add, or_
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .models import EquipmentData
+from .sketches import TDigest
+from .snapshots import iter_frames
+from .summaries import METRICS
+
+METHODS = ['zscore', 'iqr']
+# One bit per (metric, method): flowrate z-score = 1, flowrate IQR = 2, ...
+FLAGS = {
+    (metric, method): 1 << (2 * position + offset)
+    for position, metric in enumerate(METRICS)
+    for offset, method in enumerate(METHODS)
+}
+
+DEFAULT_SETTINGS = {
+    'Z_THRESHOLD': 3.0,
+    'IQR_FACTOR': 1.5,
+    'MIN_GROUP_SIZE': 8,
+}
+# Values a per-type sketch buffers before compressing; keeps ingest memory flat
+SKETCH_BUFFER = 8192
+
+
+def get_settings():
+    options = dict(DEFAULT_SETTINGS)
+    options.update(getattr(settings, 'ANOMALY_DETECTION', {}))
+    return options
+
+
+def flag_mask(metric=None, method=None):
+    """Bits matching a metric and/or method; every bit when both are ``None``."""
+    return sum(
+        bit for (flag_metric, flag_method), bit in FLAGS.items()
+        if metric in (None, flag_metric) and method in (None, flag_method)
+    )
+
+
+def describe_flags(flags):
+    return [f'{metric}:{method}' for (metric, method), bit in FLAGS.items() if flags & bit]
+
+
+class TypeStats:
+    """Per-type partials for the outlier bounds, folded in chunk by chunk.
+
+    Count, mean and sum of squared deviations per type and metric are
+    merged with Chan's parallel update, which gives the same mean and
+    standard deviation as one pass over all rows. A ``TDigest`` per type
+    and metric gives the quartiles. Memory grows with the number of types,
+    not rows.
+    """
+
+    def __init__(self):
+        self.rows = pd.Series(dtype='int64')
+        self.counts = pd.DataFrame(columns=METRICS, dtype='float64')
+        self.means = pd.DataFrame(columns=METRICS, dtype='float64')
+        self.m2 = pd.DataFrame(columns=METRICS, dtype='float64')
+        self.sketches = {}
+
+    def update(self, frame):
+        if not len(frame):
+            return
+        groups = frame.groupby('equipment_type')[METRICS]
+        counts = groups.count().astype('float64')
+        means = groups.mean().fillna(0)
+        m2 = (groups.var(ddof=0) * counts).fillna(0)
+
+        index = self.counts.index.union(counts.index)
+        old_counts, old_means, old_m2 = (
+            part.reindex(index, fill_value=0) for part in (self.counts, self.means, self.m2)
+        )
+        counts, means, m2 = (part.reindex(index, fill_value=0) for part in (counts, means, m2))
+        total = old_counts + counts
+        share = (counts / total.where(total > 0)).fillna(0)
+        delta = means - old_means
+        self.means = old_means + delta * share
+        self.m2 = old_m2 + m2 + delta ** 2 * old_counts * share
+        self.counts = total
+        self.rows = self.rows.add(groups.size(), fill_value=0)
+
+        for equipment_type, group in groups:
+            sketches = self.sketches.setdefault(equipment_type, {
+                metric: TDigest(buffer_size=SKETCH_BUFFER) for metric in METRICS
+            })
+            for metric in METRICS:
+                sketches[metric].update(group[metric].to_numpy())
+
+    def stds(self):
+        # Sample standard deviation, as pandas' std(); NaN below two values
+        return np.sqrt(self.m2 / (self.counts - 1).where(self.counts > 1))
+
+    def quantiles(self, q):
+        return pd.DataFrame({
+            metric: {
+                equipment_type: sketches[metric].quantile(q)
+                for equipment_type, sketches in self.sketches.items()
+            }
+            for metric in METRICS
+        }, columns=METRICS, dtype='float64').reindex(self.counts.index)
+
+
+def collect_type_stats(upload):
+    """``TypeStats`` of an ingested upload, read one batch at a time."""
+    stats = TypeStats()
+    for frame in iter_frames(upload.id, ['equipment_type'] + METRICS):
+        stats.update(frame)
+    return stats
+
+
+def type_bounds(stats, options=None):
+    """Lower and upper bounds per type, metric and method.
+
+    ``stats`` is a ``TypeStats``. Types with fewer than ``MIN_GROUP_SIZE``
+    rows get no bounds.
+    """
+    options = options or get_settings()
+    means, stds = stats.means, stats.stds()
+    q1, q3 = stats.quantiles(0.25), stats.quantiles(0.75)
+    iqr = q3 - q1
+
+    bounds = {}
+    for method, low, high in (
+        ('zscore', means - options['Z_THRESHOLD'] * stds, means + options['Z_THRESHOLD'] * stds),
+        ('iqr', q1 - options['IQR_FACTOR'] * iqr, q3 + options['IQR_FACTOR'] * iqr),
+    ):
+        keep = stats.rows.reindex(low.index, fill_value=0) >= options['MIN_GROUP_SIZE']
+        bounds[method] = (low[keep], high[keep])
+    return bounds
+
+
+def outside(metric, low, high):
+    """Q for values of ``metric`` outside [low, high], or ``None`` when both bounds are NaN."""
+    conditions = [
+        Q(**{f'{metric}__{lookup}': float(bound)})
+        for lookup, bound in (('lt', low), ('gt', high)) if not np.isnan(bound)
+    ]
+    return reduce(or_, conditions) if conditions else None
+
+
+def flag_anomalies(upload, stats=None, options=None):
+    """Score the rows of ``upload`` and store their ``anomaly_flags``.
+
+    Bounds come from ``stats``, the ``TypeStats`` gathered during ingest,
+    or are collected batch by batch when it isn't given. Each type is
+    scored with one set-based UPDATE that only touches its outliers and
+    sums one CASE per (metric, method) bit, so no rows are loaded. Returns
+    the number of flagged rows.
+    """
+    if stats is None:
+        stats = collect_type_stats(upload)
+    bounds = type_bounds(stats, options)
+
+    rows = EquipmentData.objects.filter(upload=upload)
+    with transaction.atomic():
+        rows.exclude(anomaly_flags=0).update(anomaly_flags=0)
+        for equipment_type in bounds['zscore'][0].index:
+            conditions = {}
+            for (metric, method), bit in FLAGS.items():
+                low, high = bounds[method]
+                condition = outside(metric, low.at[equipment_type, metric], high.at[equipment_type, metric])
+                if condition is not None:
+                    conditions[bit] = condition
+            if not conditions:
+                continue
+            flags = reduce(add, (
+                Case(When(condition, then=Value(bit)), default=Value(0), output_field=IntegerField())
+                for bit, condition in conditions.items()
+            ))
+            rows.filter(reduce(or_, conditions.values()), equipment_type=equipment_type).update(anomaly_flags=flags)
+        return rows.filter(anomaly_flags__gt=0).count()
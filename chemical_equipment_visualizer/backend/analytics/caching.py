@@ -0,0 +1,98 @@
+import functools
+import hashlib
+from urllib.parse import urlencode
+
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from rest_framework.response import Response
+
+from .models import DatasetVersion
+
+CACHE_ALIAS = 'analytics'
+
+
+def dataset_version():
+    return DatasetVersion.objects.values_list('version', flat=True).first() or 0
+
+
+def bump_dataset_version():
+    """Invalidate every cached response once the current transaction commits.
+
+    Called whenever an upload is queued, changes state, is re-submitted or
+    is purged. The counter lives in the database so a bump from the worker
+    process reaches every web process.
+    """
+    def bump():
+        if not DatasetVersion.objects.update(version=F('version') + 1):
+            DatasetVersion.objects.create(version=1)
+
+    transaction.on_commit(bump)
+
+
+def response_key(request, name):
+    # One version lookup per request, shared by the ETag and the cache key
+    if not hasattr(request, '_dataset_version'):
+        request._dataset_version = dataset_version()
+    params = urlencode(sorted(request.GET.items()))
+    return f'{name}:{request._dataset_version}:{params}'
+
+
+def response_etag(request, name):
+    return hashlib.md5(response_key(request, name).encode()).hexdigest()
+
+
+def _freeze(response):
+    if isinstance(response, Response):
+        # Plain copies: serializer return types keep a reference to the serializer
+        data = list(response.data) if isinstance(response.data, list) else dict(response.data)
+        return ('data', data)
+    headers = {key: value for key, value in response.items() if key != 'Content-Type'}
+    return ('content', response.content, response['Content-Type'], headers)
+
+
+def _thaw(frozen):
+    if frozen[0] == 'data':
+        return Response(frozen[1])
+    _, content, content_type, headers = frozen
+    response = HttpResponse(content, content_type=content_type)
+    for key, value in headers.items():
+        response[key] = value
+    return response
+
+
+def cache_by_dataset_version(name):
+    """Cache a view's 200 responses until the dataset version changes.
+
+    Clients that send the ETag back in ``If-None-Match`` get a 304 without
+    the view running at all. Errors carry no ETag: they are not cached, and
+    a client must not revalidate one into a later 304.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            cache = caches[CACHE_ALIAS]
+            key = response_key(request, name)
+            frozen = cache.get(key)
+            if frozen is None:
+                response = method(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                frozen = _freeze(response)
+                cache.set(key, frozen)
+            return _thaw(frozen)
+
+        etag = condition(etag_func=lambda request, *args, **kwargs: response_etag(request, name))
+        conditional = method_decorator(etag)(wrapper)
+
+        @functools.wraps(method)
+        def view(self, request, *args, **kwargs):
+            response = conditional(self, request, *args, **kwargs)
+            if response.status_code not in (200, 304):
+                response.headers.pop('ETag', None)
+            return response
+        return view
+    return decorator
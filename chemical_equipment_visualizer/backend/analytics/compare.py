@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+from .summaries import METRICS
+
+
+def _records(frame, columns):
+    frame = frame[columns]
+    return frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+
+def type_drift(frame_a, frame_b):
+    """Per-type counts and averages in both uploads, with their differences."""
+    aggregations = {'count': ('equipment_type', 'size')}
+    aggregations.update({f'avg_{metric}': (metric, 'mean') for metric in METRICS})
+    stats_a = frame_a.groupby('equipment_type').agg(**aggregations)
+    stats_b = frame_b.groupby('equipment_type').agg(**aggregations)
+    joined = stats_a.join(stats_b, how='outer', lsuffix='_a', rsuffix='_b')
+    joined[['count_a', 'count_b']] = joined[['count_a', 'count_b']].fillna(0).astype('int64')
+
+    drift = {}
+    for equipment_type, row in joined.sort_index().iterrows():
+        item = {'count_a': int(row['count_a']), 'count_b': int(row['count_b']),
+                'count_delta': int(row['count_b'] - row['count_a'])}
+        for metric in METRICS:
+            a, b = row[f'avg_{metric}_a'], row[f'avg_{metric}_b']
+            item[f'avg_{metric}_a'] = None if pd.isna(a) else float(a)
+            item[f'avg_{metric}_b'] = None if pd.isna(b) else float(b)
+            item[f'avg_{metric}_delta'] = None if pd.isna(a) or pd.isna(b) else float(b - a)
+        drift[str(equipment_type)] = item
+    return drift
+
+
+def compare_frames(frame_a, frame_b, limit=100):
+    """Join two uploads on equipment name and describe what changed from a to b.
+
+    The join is a single pandas hash merge. A name that repeats within one
+    upload is compared by its last row. Lists of units are cut to ``limit``
+    entries; the counts always cover everything.
+    """
+    frame_a = frame_a.drop_duplicates('equipment_name', keep='last')
+    frame_b = frame_b.drop_duplicates('equipment_name', keep='last')
+    merged = frame_a.merge(frame_b, on='equipment_name', how='outer', suffixes=('_a', '_b'), indicator=True)
+
+    added = merged[merged['_merge'] == 'right_only']
+    removed = merged[merged['_merge'] == 'left_only']
+    common = merged[merged['_merge'] == 'both']
+
+    metrics = {}
+    relative = np.zeros(len(common))
+    for metric in METRICS:
+        delta = common[f'{metric}_b'].to_numpy() - common[f'{metric}_a'].to_numpy()
+        common = common.assign(**{f'{metric}_delta': delta})
+        scale = np.abs(common[f'{metric}_a'].to_numpy())
+        with np.errstate(divide='ignore', invalid='ignore'):
+            relative = np.fmax(relative, np.abs(delta) / np.where(scale > 0, scale, 1))
+        stats = {'changed': int(np.count_nonzero(delta)), 'mean_delta': None, 'mean_abs_delta': None,
+                 'max_increase': None, 'max_decrease': None}
+        if len(delta):
+            stats['mean_delta'] = float(np.nanmean(delta))
+            stats['mean_abs_delta'] = float(np.nanmean(np.abs(delta)))
+            for key, position, sign in (('max_increase', np.nanargmax(delta), 1),
+                                        ('max_decrease', np.nanargmin(delta), -1)):
+                if sign * delta[position] > 0:
+                    stats[key] = {'equipment_name': common['equipment_name'].iat[position],
+                                  'delta': float(delta[position])}
+        metrics[metric] = stats
+
+    # Units that changed, largest relative change first
+    order = np.argsort(-relative, kind='stable')
+    top = common.iloc[order[relative[order] > 0][:limit]]
+    top = top.rename(columns={'equipment_type_b': 'equipment_type'})
+    changed_type = common['equipment_type_a'] != common['equipment_type_b']
+
+    return {
+        'counts': {
+            'a': len(frame_a),
+            'b': len(frame_b),
+            'common': len(common),
+            'added': len(added),
+            'removed': len(removed),
+            'type_changed': int(changed_type.sum()),
+        },
+        'added': _records(added.head(limit).rename(columns={'equipment_type_b': 'equipment_type'}),
+                          ['equipment_name', 'equipment_type']),
+        'removed': _records(removed.head(limit).rename(columns={'equipment_type_a': 'equipment_type'}),
+                            ['equipment_name', 'equipment_type']),
+        'metrics': metrics,
+        'changes': _records(top, ['equipment_name', 'equipment_type'] + [
+            f'{metric}_{suffix}' for metric in METRICS for suffix in ('a', 'b', 'delta')
+        ]),
+        'type_drift': type_drift(frame_a, frame_b),
+    }
@@ -0,0 +1,76 @@
+import numpy as np
+
+from .summaries import METRICS
+
+BINNINGS = ('fixed', 'quantile')
+
+
+def _finite(values):
+    values = np.asarray(values, dtype='float64')
+    return values[np.isfinite(values)]
+
+
+def _floats(array):
+    # JSON has no NaN; buckets without a finite value become null
+    return [None if np.isnan(value) else float(value) for value in array]
+
+
+def bin_edges(values, bins, binning='fixed'):
+    """Edges for ``bins`` equal-width or equal-count bins over ``values``."""
+    values = _finite(values)
+    if not len(values):
+        return np.array([])
+    if binning == 'quantile':
+        # Repeated values can collapse quantiles; drop the duplicate edges
+        edges = np.unique(np.quantile(values, np.linspace(0, 1, bins + 1)))
+        if len(edges) > 1:
+            return edges
+    return np.histogram_bin_edges(values, bins=bins)
+
+
+def histogram(values, edges):
+    if not len(edges):
+        return {'edges': [], 'counts': []}
+    counts, _ = np.histogram(_finite(values), bins=edges)
+    return {'edges': edges.tolist(), 'counts': counts.tolist()}
+
+
+def downsample_minmax(values, points):
+    """Reduce a series to at most ``points`` buckets of (start, min, max).
+
+    Every bucket keeps its extremes, so spikes survive that averaging or
+    striding would drop. Series shorter than ``points`` come back whole.
+    """
+    values = np.asarray(values, dtype='float64')
+    if not len(values):
+        return {'index': [], 'min': [], 'max': []}
+    starts = np.unique(np.linspace(0, len(values), min(points, len(values)), endpoint=False).astype('int64'))
+    with np.errstate(invalid='ignore'):
+        return {
+            'index': starts.tolist(),
+            'min': _floats(np.fmin.reduceat(values, starts)),
+            'max': _floats(np.fmax.reduceat(values, starts)),
+        }
+
+
+def build_histograms(frame, bins=20, binning='fixed', by_type=False, points=500):
+    """Histograms and downsampled series for every metric of ``frame``.
+
+    Per-type histograms reuse the overall edges so their bars line up.
+    """
+    result = {'total_count': len(frame), 'binning': binning, 'histograms': {}, 'series': {}}
+    edges = {}
+    for metric in METRICS:
+        values = frame[metric].to_numpy()
+        edges[metric] = bin_edges(values, bins, binning)
+        result['histograms'][metric] = histogram(values, edges[metric])
+        result['series'][metric] = downsample_minmax(values, points)
+
+    if by_type:
+        result['by_type'] = {
+            str(equipment_type): {
+                metric: histogram(group[metric].to_numpy(), edges[metric]) for metric in METRICS
+            }
+            for equipment_type, group in frame.groupby('equipment_type', sort=True)
+        }
+    return result
@@ -0,0 +1,341 @@
+import hashlib
+from itertools import repeat
+
+import pandas as pd
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .anomalies import TypeStats, flag_anomalies
+from .caching import bump_dataset_version
+from .locking import write_lock
+from .metrics import Timings
+from .models import EquipmentData, UploadedFile, UploadSummary
+from .snapshots import SnapshotWriter, snapshots_enabled
+from .summaries import SummaryAccumulator, summarize_queryset
+
+PREVIEW_ROWS = 5
+# Model defaults the raw INSERT has to spell out; they are not database defaults
+INSERT_DEFAULTS = {'anomaly_flags': 0}
+# Preview keys of a mapped chunk, for previews rebuilt from stored rows
+LEGACY_PREVIEW_COLUMNS = {
+    'equipment_name': 'Equipment Name',
+    'equipment_type': 'Type',
+    'flowrate': 'Flowrate',
+    'pressure': 'Pressure',
+    'temperature': 'Temperature',
+}
+
+
+def get_chunk_size():
+    return getattr(settings, 'INGEST_CHUNK_SIZE', 50000)
+
+
+# Headers read as the reading's time. Only exact names, so columns such as
+# "Runtime" or "Update count" are left alone.
+TIMESTAMP_COLUMNS = {'timestamp', 'datetime', 'recorded_at', 'date'}
+
+
+def map_columns(columns):
+    column_mapping = {}
+    for col in columns:
+        col_lower = col.lower()
+        if 'equip' in col_lower and 'name' in col_lower:
+            column_mapping[col] = 'Equipment Name'
+        elif 'type' in col_lower:
+            column_mapping[col] = 'Type'
+        elif 'flow' in col_lower:
+            column_mapping[col] = 'Flowrate'
+        elif 'press' in col_lower:
+            column_mapping[col] = 'Pressure'
+        elif 'temp' in col_lower:
+            column_mapping[col] = 'Temperature'
+        elif col_lower.strip().replace(' ', '_') in TIMESTAMP_COLUMNS and 'Timestamp' not in column_mapping.values():
+            column_mapping[col] = 'Timestamp'
+    return column_mapping
+
+
+def read_chunks(file, chunk_size=None):
+    """Yield the CSV in fixed-size chunks with the column mapping applied.
+
+    The header is stripped and mapped once, then reused for every chunk so
+    that only ``chunk_size`` rows are held in memory at a time.
+    """
+    columns = None
+    for chunk in pd.read_csv(file, chunksize=chunk_size or get_chunk_size()):
+        if columns is None:
+            stripped = [str(col).strip() for col in chunk.columns]
+            mapping = map_columns(stripped)
+            columns = [mapping.get(col, col) for col in stripped]
+        chunk.columns = columns
+        yield chunk
+
+
+def _column(chunk, name, default):
+    if name in chunk.columns:
+        return chunk[name]
+    return pd.Series(default, index=chunk.index)
+
+
+def _text(chunk, name):
+    return _column(chunk, name, 'Unknown').fillna('Unknown').astype(str)
+
+
+def _number(chunk, name):
+    # Blank cells become 0 like a missing column; text is an error
+    values = _column(chunk, name, 0)
+    numbers = pd.to_numeric(values, errors='coerce')
+    bad = numbers.isna() & values.notna()
+    if values.dtype == object:
+        bad &= values.str.strip().ne('')
+    if bad.any():
+        raise ValueError(f'{name}: {values[bad].iloc[0]!r} is not a number')
+    return numbers.fillna(0).astype('float64')
+
+
+def normalize_chunk(chunk):
+    """Coerce a mapped chunk to the ``EquipmentData`` columns.
+
+    Each column is converted once as a whole. Missing columns and blank
+    cells get the defaults the per-row path used ("Unknown" or 0), so no
+    NULL reaches a NOT NULL column; text in a numeric column raises a
+    ``ValueError`` naming the column, which fails the upload.
+    ``recorded_at`` is only present when the file has a timestamp column;
+    naive times are UTC and unparseable ones become NULL. A numeric
+    timestamp column is not parsed, since ``to_datetime`` would read its
+    numbers as epoch offsets.
+    """
+    frame = pd.DataFrame({
+        'equipment_name': _text(chunk, 'Equipment Name'),
+        'equipment_type': _text(chunk, 'Type'),
+        'flowrate': _number(chunk, 'Flowrate'),
+        'pressure': _number(chunk, 'Pressure'),
+        'temperature': _number(chunk, 'Temperature'),
+    })
+    if 'Timestamp' in chunk.columns:
+        timestamps = chunk['Timestamp']
+        if pd.api.types.is_numeric_dtype(timestamps):
+            # An all-blank chunk is read as float NaN too; either way it is NULL
+            timestamps = pd.Series(pd.NaT, index=chunk.index)
+        frame['recorded_at'] = pd.to_datetime(timestamps, errors='coerce', utc=True)
+    return frame
+
+
+def _column_values(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        # Raw SQL skips the field's own conversion. Making the whole column
+        # naive in the connection's zone first leaves adapt() a cheap
+        # formatting step per value; NaT becomes NULL.
+        naive = series.dt.tz_convert(connection.timezone).dt.tz_localize(None).dt.floor('us')
+        adapt = connection.ops.adapt_datetimefield_value
+        return [
+            None if missing else adapt(value)
+            for value, missing in zip(naive.dt.to_pydatetime(), naive.isna().to_numpy())
+        ]
+    return series.tolist()
+
+
+def insert_rows(frame, upload):
+    """Insert a normalized frame straight from its column arrays.
+
+    Parameters are zipped from whole columns and sent with a single
+    ``executemany``, which skips building an ``EquipmentData`` instance
+    per row the way ``bulk_create`` would.
+    """
+    opts = EquipmentData._meta
+    quote_name = connection.ops.quote_name
+    columns = ['upload'] + list(frame.columns) + list(INSERT_DEFAULTS)
+    sql = 'INSERT INTO %s (%s) VALUES (%s)' % (
+        quote_name(opts.db_table),
+        ', '.join(quote_name(opts.get_field(name).column) for name in columns),
+        ', '.join(['%s'] * len(columns)),
+    )
+    params = zip(
+        repeat(upload.id),
+        *(_column_values(frame[name]) for name in frame.columns),
+        *(repeat(value) for value in INSERT_DEFAULTS.values()),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def preview_records(frame):
+    head = frame.head(PREVIEW_ROWS)
+    return head.astype(object).where(head.notna(), None).to_dict('records')
+
+
+def ingest_csv(file, upload, chunk_size=None, progress=None, snapshot=None, stats=None, timings=None):
+    """Stream ``file`` into ``EquipmentData`` rows for ``upload``.
+
+    Each chunk is committed on its own so ``progress(rows_so_far)`` can
+    publish how far the ingest got. Normalized chunks are also appended to
+    ``snapshot`` when a ``SnapshotWriter`` is given, and folded into
+    ``stats`` (a ``TypeStats`` for the anomaly bounds) when one is given.
+    Returns the summary dict and the first few mapped rows for preview.
+    Time per stage is added to ``timings``.
+    """
+    timings = timings or Timings('ingest')
+    accumulator = SummaryAccumulator()
+    preview = []
+    chunks = read_chunks(file, chunk_size)
+    while True:
+        with timings.stage('parse'):
+            chunk = next(chunks, None)
+        if chunk is None:
+            break
+        if len(preview) < PREVIEW_ROWS:
+            preview.extend(preview_records(chunk)[:PREVIEW_ROWS - len(preview)])
+        with timings.stage('normalize'):
+            frame = normalize_chunk(chunk)
+        with transaction.atomic():
+            with timings.stage('insert'):
+                insert_rows(frame, upload)
+            with timings.stage('summary'):
+                accumulator.update(frame)
+            if stats is not None:
+                with timings.stage('anomaly_stats'):
+                    stats.update(frame)
+            if snapshot is not None:
+                with timings.stage('snapshot'):
+                    snapshot.write(frame)
+            if progress is not None:
+                with timings.stage('progress'):
+                    progress(accumulator.total_count)
+    return accumulator, preview
+
+
+def hash_file(file):
+    """SHA-256 of an uploaded file, read in chunks and rewound afterwards."""
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def find_duplicate(content_hash, statuses):
+    """Most recent upload with identical content, or ``None``.
+
+    Legacy uploads (hashed by migration 0009) qualify as long as their
+    result can be rebuilt; see ``rebuild_result``. One with neither a
+    result nor a summary is skipped, so the file is ingested again.
+    """
+    return UploadedFile.objects.filter(
+        content_hash=content_hash, status__in=statuses
+    ).exclude(
+        status=UploadedFile.STATUS_DONE, result__isnull=True, summary__isnull=True
+    ).order_by('-uploaded_at').first()
+
+
+def reuse_upload(upload):
+    # Re-submitting a file counts as a fresh upload for history and retention
+    upload.uploaded_at = timezone.now()
+    UploadedFile.objects.filter(pk=upload.pk).update(uploaded_at=upload.uploaded_at)
+    bump_dataset_version()
+    return upload
+
+
+def rebuild_result(upload):
+    """Result of an upload ingested before results were stored.
+
+    Migration 0007 marked such uploads done without one. The summary comes
+    from their ``UploadSummary`` (or the rows, for ``UploadResultView``
+    when even that is missing) and the preview from their first rows.
+    """
+    if UploadSummary.objects.filter(upload=upload).exists():
+        summary = SummaryAccumulator.from_summaries([upload.summary]).as_dict()
+    else:
+        summary = summarize_queryset(EquipmentData.objects.filter(upload=upload))
+    rows = EquipmentData.objects.filter(upload=upload).order_by('id').values(*LEGACY_PREVIEW_COLUMNS)
+    preview = [
+        {LEGACY_PREVIEW_COLUMNS[name]: value for name, value in row.items()}
+        for row in rows[:PREVIEW_ROWS]
+    ]
+    return {'summary': summary, 'data': preview}
+
+
+def upload_result(upload):
+    if upload.result is None:
+        upload.result = rebuild_result(upload)
+        UploadedFile.objects.filter(pk=upload.pk).update(result=upload.result)
+    return {
+        'message': 'File uploaded successfully',
+        'summary': upload.result['summary'],
+        'data': upload.result['data']
+    }
+
+
+def process_upload(upload, timings=None):
+    """Ingest the stored file of ``upload`` and record the outcome on it.
+
+    Partial rows are removed again if the file fails to parse, so a failed
+    upload never contributes to summaries. Rows of a successful upload are
+    scored for outliers before it is marked done. Stage timings, rows and
+    bytes read are logged and recorded in ``analytics.metrics``. The
+    process's write lock is held throughout, so retention purges from the
+    after-upload pass wait for the ingest instead of hitting its locks.
+    """
+    with write_lock:
+        return _process_upload(upload, timings)
+
+
+def _process_upload(upload, timings):
+    def progress(rows):
+        UploadedFile.objects.filter(pk=upload.pk).update(rows_processed=rows)
+
+    timings = timings or Timings('upload')
+    timings.fields.update(upload_id=upload.id, file_name=upload.file_name)
+    snapshot = SnapshotWriter(upload) if snapshots_enabled() else None
+    stats = TypeStats()
+    try:
+        with upload.file.open('rb') as file:
+            accumulator, preview = ingest_csv(
+                file, upload, progress=progress, snapshot=snapshot, stats=stats, timings=timings
+            )
+            timings.add(bytes_read=upload.file.size)
+        if snapshot is not None:
+            with timings.stage('snapshot'):
+                snapshot.close()
+        with timings.stage('anomalies'):
+            flag_anomalies(upload, stats)
+    except Exception as e:
+        with timings.stage('cleanup'):
+            if snapshot is not None:
+                snapshot.abort()
+            EquipmentData.objects.filter(upload=upload).delete()
+        upload.status = UploadedFile.STATUS_FAILED
+        upload.error = str(e)
+        upload.rows_processed = 0
+        accumulator = None
+    else:
+        upload.status = UploadedFile.STATUS_DONE
+        upload.result = {'summary': accumulator.as_dict(), 'data': preview}
+        upload.rows_processed = accumulator.total_count
+    upload.processed_at = timezone.now()
+    
+    with timings.stage('save'), transaction.atomic():
+        if accumulator is not None:
+            UploadSummary.objects.update_or_create(
+                upload=upload, defaults=accumulator.summary_fields()
+            )
+        upload.save(update_fields=['status', 'error', 'result', 'rows_processed', 'processed_at'])
+        bump_dataset_version()
+    timings.finish(status=upload.status, rows=upload.rows_processed)
+    return upload
+
+
+def claim_next_upload():
+    """Move the oldest pending upload to processing and return it.
+
+    The conditional update makes the claim safe when several workers
+    poll the same table.
+    """
+    pending = UploadedFile.objects.filter(status=UploadedFile.STATUS_PENDING)
+    for pk in pending.order_by('uploaded_at').values_list('pk', flat=True)[:10]:
+        claimed = UploadedFile.objects.filter(
+            pk=pk, status=UploadedFile.STATUS_PENDING
+        ).update(status=UploadedFile.STATUS_PROCESSING)
+        if claimed:
+            bump_dataset_version()
+            return UploadedFile.objects.get(pk=pk)
+    return None
@@ -0,0 +1,87 @@
+import logging
+import threading
+from collections import deque
+
+from django.db import connection, transaction
+
+from .locking import retry_locked, write_lock
+from .metrics import Timings
+from .reports import build_current_reports
+from .retention import apply_retention, get_policy
+
+logger = logging.getLogger('analytics.jobs')
+
+# Whether a background thread is running passes, the uploads it still has
+# to do, and those whose pass failed and wait for the next one
+_state = threading.Condition()
+_busy = False
+_pending = deque()
+_failed = []
+
+
+def after_upload(upload=None):
+    """Housekeeping once an upload has finished: retention, then reports.
+
+    The worker runs this inline; synchronous uploads hand it to a
+    background thread through ``schedule_after_upload``. Purges take the
+    process's write lock, so they wait for an ingest in progress.
+    """
+    timings = Timings('after_upload', upload_id=getattr(upload, 'id', None))
+    with timings.stage('retention'), write_lock:
+        purged = apply_retention() if get_policy()['RUN_AFTER_UPLOAD'] else []
+    with timings.stage('reports'):
+        build_current_reports(upload)
+    timings.finish(purged=len(purged))
+    return purged
+
+
+def _run_in_background(upload):
+    global _busy
+    try:
+        while upload is not None:
+            try:
+                retry_locked(after_upload, upload)
+            except Exception:
+                # Kept rather than dropped: the next scheduled pass runs it again
+                logger.exception('after_upload failed for upload %s; retrying with the next pass',
+                                 getattr(upload, 'id', None))
+                with _state:
+                    _failed.append(upload)
+            with _state:
+                # Uploads scheduled during the pass get a pass of their own
+                upload = _pending.popleft() if _pending else None
+                if upload is None:
+                    _busy = False
+                    _state.notify_all()
+    finally:
+        connection.close()
+
+
+def schedule_after_upload(upload):
+    """Run ``after_upload`` on a background thread once the transaction commits.
+
+    At most one pass runs at a time. Uploads scheduled while one is running
+    are queued, and the same thread runs a pass for each of them before it
+    stops, so none misses its retention pass or its report. A pass that
+    still finds the database locked after ``retry_locked`` gave up, or that
+    fails otherwise, is queued again ahead of the next upload's.
+    """
+    def start():
+        global _busy
+        with _state:
+            uploads = _failed + [upload]
+            _failed.clear()
+            if _busy:
+                _pending.extend(uploads)
+                return
+            _busy = True
+            _pending.extend(uploads[1:])
+        threading.Thread(target=_run_in_background, args=(uploads[0],), daemon=True).start()
+
+    transaction.on_commit(start)
+
+
+def wait_for_after_upload():
+    """Block until background ``after_upload`` passes, queued ones included, are done."""
+    with _state:
+        _state.wait_for(lambda: not _busy)
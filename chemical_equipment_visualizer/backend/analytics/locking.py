@@ -0,0 +1,33 @@
+import threading
+import time
+
+from django.db import OperationalError
+
+# SQLite allows one writer at a time. Ingest and the after-upload pass hold
+# this while they write, so the threads of one process queue up here instead
+# of failing on each other's locks.
+write_lock = threading.RLock()
+
+# Backoff between attempts while another process holds the database lock
+RETRY_DELAYS = (0.25, 0.5, 1, 2, 4)
+
+
+def is_locked(error):
+    return isinstance(error, OperationalError) and 'locked' in str(error)
+
+
+def retry_locked(func, *args, delays=RETRY_DELAYS, **kwargs):
+    """Call ``func``, retrying with backoff while the database is locked.
+
+    Only "database is locked" errors are retried; anything else, and a lock
+    that outlasts every delay, is raised. ``func`` must be safe to run again,
+    and the caller must not be inside a transaction.
+    """
+    for delay in delays:
+        try:
+            return func(*args, **kwargs)
+        except OperationalError as e:
+            if not is_locked(e):
+                raise
+        time.sleep(delay)
+    return func(*args, **kwargs)
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from analytics.retention import apply_retention, get_policy, remove_orphaned_files
+
+
+class Command(BaseCommand):
+    help = 'Delete uploads that fall outside the retention policy (settings.UPLOAD_RETENTION)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-last', type=int)
+        parser.add_argument('--max-age-days', type=float)
+        parser.add_argument('--max-total-rows', type=int)
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--orphans', action='store_true',
+                            help='Also remove media files no upload refers to')
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        policy = get_policy(
+            KEEP_LAST=options['keep_last'],
+            MAX_AGE_DAYS=options['max_age_days'],
+            MAX_TOTAL_ROWS=options['max_total_rows'],
+            BATCH_SIZE=options['batch_size'],
+        )
+        verb = 'Would remove' if options['dry_run'] else 'Removed'
+        
+        purged = apply_retention(policy, dry_run=options['dry_run'])
+        for upload, rows in purged:
+            self.stdout.write(f'{verb} upload {upload.id} ({upload.file_name}, {rows} rows)')
+        
+        if options['orphans']:
+            removed = remove_orphaned_files(dry_run=options['dry_run'])
+            for path in removed:
+                self.stdout.write(f'{verb} orphaned file {path}')
+        
+        self.stdout.write(self.style.SUCCESS(f'{len(purged)} upload(s) past retention'))
@@ -0,0 +1,240 @@
+import json
+import shutil
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+
+from analytics.caching import CACHE_ALIAS
+from analytics.ingest import map_columns
+from analytics.jobs import wait_for_after_upload
+from analytics.reports import reports_dir
+
+BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'endpoints.json'
+
+# name: (share of rows, flowrate, pressure, temperature as (mean, std))
+TYPES = {
+    'Pump': (0.30, (120, 25), (5.5, 0.8), (95, 12)),
+    'Valve': (0.25, (90, 30), (4.2, 1.1), (80, 15)),
+    'Heat Exchanger': (0.15, (160, 35), (6.8, 1.2), (140, 20)),
+    'Compressor': (0.12, (220, 40), (9.5, 1.6), (125, 18)),
+    'Reactor': (0.10, (180, 30), (8.0, 1.4), (210, 30)),
+    'Condenser': (0.08, (140, 25), (3.6, 0.7), (65, 10)),
+}
+
+FIELDS = {
+    'Equipment Name': 'name', 'Type': 'type', 'Flowrate': 'flowrate',
+    'Pressure': 'pressure', 'Temperature': 'temperature', 'Timestamp': 'timestamp',
+}
+
+# The header spellings map_columns has to cope with, in the file's column order
+HEADERS = [
+    ['Equipment Name', 'Type', 'Flowrate', 'Pressure', 'Temperature', 'Timestamp'],
+    ['  equipment_name ', 'Equipment Type', 'Flow Rate (m3/h)', 'Pressure (bar)', 'Temp (C)', 'Recorded At'],
+    ['Site', 'TYPE', 'EQUIPMENT NAME', 'TEMPERATURE_C', 'FLOWRATE', 'PRESSURE_BAR', 'DATETIME', 'Notes'],
+]
+
+
+def make_readings(rows, seed=0, missing=0.02, start=0):
+    """Synthetic readings with per-type distributions, outliers and blank cells.
+
+    Any column can have blanks; ingest stores blank numbers as 0.
+    """
+    rng = np.random.default_rng(seed)
+    names = list(TYPES)
+    types = rng.choice(len(names), rows, p=[TYPES[name][0] for name in names])
+    frame = pd.DataFrame({
+        'name': [f'{names[t][:3].upper()}-{start + i:07d}' for i, t in enumerate(types)],
+        'type': np.array(names, dtype=object)[types],
+        'timestamp': (pd.Timestamp('2025-01-01') + pd.to_timedelta(start + np.arange(rows), unit='min'))
+        .strftime('%Y-%m-%d %H:%M:%S'),
+        'site': rng.choice(['North', 'South', 'East'], rows),
+        'notes': '',
+    })
+    for position, metric in enumerate(['flowrate', 'pressure', 'temperature'], start=1):
+        means = np.array([TYPES[name][position][0] for name in names])[types]
+        stds = np.array([TYPES[name][position][1] for name in names])[types]
+        values = rng.normal(means, stds)
+        # A few sensors misbehave badly enough to be flagged as outliers
+        spikes = rng.random(rows) < 0.002
+        values[spikes] *= rng.choice([0.1, 4.0], spikes.sum())
+        frame[metric] = values.round(2)
+
+    for column in ('name', 'type', 'timestamp', 'flowrate', 'pressure', 'temperature'):
+        frame.loc[rng.random(rows) < missing, column] = ''
+    return frame
+
+
+def write_csv(path, rows, seed=0, missing=0.02, chunk_size=100000):
+    """Write a ``rows``-long CSV with one of ``HEADERS``, chunk by chunk."""
+    headers = HEADERS[seed % len(HEADERS)]
+    mapping = map_columns([header.strip() for header in headers])
+    columns = [FIELDS.get(mapping.get(header.strip()), header.strip().lower()) for header in headers]
+
+    with open(path, 'w', newline='') as stream:
+        for offset in range(0, rows, chunk_size):
+            size = min(chunk_size, rows - offset)
+            frame = make_readings(size, seed=seed * rows + offset, missing=missing, start=offset)
+            frame = frame[columns]
+            frame.columns = headers
+            frame.to_csv(stream, index=False, header=offset == 0)
+    return path
+
+
+def measure(func, memory=False):
+    """Wall time, SQL queries and (optionally) traced peak memory of ``func()``."""
+    if memory:
+        tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if memory else None
+    finally:
+        if memory:
+            tracemalloc.stop()
+    return {'seconds': elapsed, 'queries': len(queries), 'peak_mb': None if peak is None else peak / 2 ** 20}
+
+
+def read(response, url):
+    if response.status_code != 200:
+        raise CommandError(f'{url} returned {response.status_code}')
+    # Streamed responses (the PDF) only do their work while being read
+    if response.streaming:
+        b''.join(response.streaming_content)
+        response.close()
+    return response
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the upload, summary, history and PDF endpoints against a stored baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 100000, 1000000])
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--missing', type=float, default=0.02,
+                            help='Share of blank name, type and timestamp cells')
+        parser.add_argument('--baseline', default=str(BASELINE))
+        parser.add_argument('--update-baseline', action='store_true',
+                            help='Store these results as the new baseline')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help='Allowed relative slowdown or memory growth')
+        parser.add_argument('--min-seconds', type=float, default=0.05,
+                            help='Ignore slowdowns smaller than this')
+        parser.add_argument('--skip-memory', action='store_true',
+                            help='Skip the tracemalloc pass (it roughly doubles the run time)')
+
+    def run_endpoints(self, csv_path, memory):
+        """Upload ``csv_path`` into an empty database, then read it back cold."""
+        client = APIClient()
+        results = {}
+
+        with open(csv_path, 'rb') as stream:
+            results['upload'] = measure(
+                lambda: read(client.post('/api/upload/', {'file': stream}, format='multipart'), '/api/upload/'), memory
+            )
+        # Retention and report pre-rendering run on a background thread
+        wait_for_after_upload()
+
+        for name, url in (('summary', '/api/summary/'), ('history', '/api/history/'), ('pdf', '/api/pdf/')):
+            # Cold: no cached response and no pre-rendered report
+            caches[CACHE_ALIAS].clear()
+            shutil.rmtree(reports_dir(), ignore_errors=True)
+            results[name] = measure(lambda: read(client.get(url), url), memory)
+        return results
+
+    def run_size(self, rows, seed, options, workdir):
+        csv_path = write_csv(workdir / f'bench-{rows}.csv', rows, seed, options['missing'])
+        self.stdout.write(f'{rows} rows: {csv_path.stat().st_size / 2 ** 20:.1f} MiB CSV')
+
+        passes = [False] if options['skip_memory'] else [False, True]
+        results = {}
+        for memory in passes:
+            # Every pass starts from a freshly migrated database and empty media
+            media = workdir / ('media-memory' if memory else 'media')
+            test_name = connection.settings_dict['TEST'].get('NAME')
+            if connection.vendor == 'sqlite':
+                # On disk, like the real database, rather than in memory
+                connection.settings_dict['TEST']['NAME'] = str(workdir / 'bench.sqlite3')
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+            try:
+                with override_settings(MEDIA_ROOT=str(media), INGEST_ASYNC=False):
+                    measured = self.run_endpoints(csv_path, memory)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                connection.settings_dict['TEST']['NAME'] = test_name
+                shutil.rmtree(media, ignore_errors=True)
+
+            for name, values in measured.items():
+                entry = results.setdefault(name, {})
+                if memory:
+                    entry['peak_mb'] = values['peak_mb']
+                else:
+                    entry.update(seconds=values['seconds'], queries=values['queries'])
+
+        csv_path.unlink()
+        return results
+
+    def compare(self, results, baseline, options):
+        regressions = []
+        for rows, endpoints in results.items():
+            for name, current in endpoints.items():
+                previous = baseline.get(rows, {}).get(name)
+                if previous is None:
+                    continue
+                if current['queries'] > previous['queries']:
+                    regressions.append(f"{rows} rows {name}: {previous['queries']} -> {current['queries']} queries")
+                slower = current['seconds'] - previous['seconds']
+                if slower > options['min_seconds'] and current['seconds'] > previous['seconds'] * (1 + options['tolerance']):
+                    regressions.append(f"{rows} rows {name}: {previous['seconds']:.3f}s -> {current['seconds']:.3f}s")
+                if current.get('peak_mb') is not None and previous.get('peak_mb') is not None \
+                        and current['peak_mb'] > previous['peak_mb'] * (1 + options['tolerance']):
+                    regressions.append(f"{rows} rows {name}: {previous['peak_mb']:.1f} -> {current['peak_mb']:.1f} MiB peak")
+        return regressions
+
+    def handle(self, *args, **options):
+        baseline_path = Path(options['baseline'])
+        baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+
+        workdir = Path(tempfile.mkdtemp(prefix='bench-endpoints-'))
+        setup_test_environment()
+        results = {}
+        try:
+            # Each size gets the next header spelling
+            for position, rows in enumerate(options['rows']):
+                results[str(rows)] = self.run_size(rows, options['seed'] + position, options, workdir)
+        finally:
+            teardown_test_environment()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        self.stdout.write(f"\n{'rows':>10} {'endpoint':<10} {'time (s)':>10} {'queries':>8} {'peak (MiB)':>11} {'baseline (s)':>13}")
+        for rows, endpoints in results.items():
+            for name, values in endpoints.items():
+                peak = '-' if values.get('peak_mb') is None else f"{values['peak_mb']:.1f}"
+                previous = baseline.get(rows, {}).get(name)
+                reference = '-' if previous is None else f"{previous['seconds']:.3f}"
+                self.stdout.write(f"{rows:>10} {name:<10} {values['seconds']:>10.3f} {values['queries']:>8} {peak:>11} {reference:>13}")
+
+        if options['update_baseline']:
+            baseline.update(results)
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(baseline, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Baseline written to {baseline_path}'))
+            return
+
+        regressions = self.compare(results, baseline, options)
+        if regressions:
+            for line in regressions:
+                self.stdout.write(self.style.ERROR(line))
+            raise CommandError(f'{len(regressions)} regression(s) against {baseline_path}')
+        self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
@@ -0,0 +1,104 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Avg, Count
+
+from analytics.ingest import insert_rows, normalize_chunk
+from analytics.management.commands.bench_rowbuild import make_frame
+from analytics.models import EquipmentData, UploadedFile
+
+# The composite and type indexes added in 0010, the ones being measured.
+# Later indexes (timestamps, anomalies) stay, as they serve other queries.
+COMPOSITE_INDEXES = [
+    'equipment_upload_type_idx',
+    'equipment_upload_flow_idx',
+    'equipment_upload_press_idx',
+    'equipment_upload_temp_idx',
+    'equipment_type_idx',
+]
+
+
+def access_patterns(upload):
+    """``(name, queryset, evaluate)`` for the ways the app reads ``EquipmentData``."""
+    rows = EquipmentData.objects.filter(upload=upload)
+    return [
+        ('type filter', rows.filter(equipment_type='Pump'), 'count'),
+        ('type counts', rows.values('equipment_type').annotate(n=Count('id')).order_by(), 'list'),
+        ('temperature range', rows.filter(temperature__gte=150, temperature__lt=155), 'count'),
+        ('pressure range avg', rows.filter(pressure__gt=9), 'avg'),
+        ('flowrate top 100', rows.order_by('-flowrate').values_list('id', flat=True)[:100], 'list'),
+        ('admin type filter', EquipmentData.objects.filter(equipment_type='Valve')
+            .order_by('-id').values_list('id', flat=True)[:100], 'list'),
+    ]
+
+
+def evaluate(queryset, how):
+    queryset = queryset.all()  # fresh clone, no result cache between runs
+    if how == 'count':
+        return queryset.count()
+    if how == 'avg':
+        return queryset.aggregate(Avg('flowrate'))
+    return list(queryset)
+
+
+class Command(BaseCommand):
+    help = 'Time EquipmentData access patterns with and without the composite indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=5000000)
+        parser.add_argument('--uploads', type=int, default=5,
+                            help='Uploads the rows are spread over')
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--chunk-size', type=int, default=250000)
+
+    def best_of(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    def run_queries(self, upload, repeat, label):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'\n{label}'))
+        results = {}
+        for name, queryset, how in access_patterns(upload):
+            results[name] = self.best_of(lambda: evaluate(queryset, how), repeat)
+            self.stdout.write(f'{name:<20} {results[name] * 1000:>10.1f} ms')
+            for line in queryset.explain().splitlines():
+                self.stdout.write(f'    {line}')
+        return results
+
+    def handle(self, *args, **options):
+        per_upload = options['rows'] // options['uploads']
+        
+        # Everything, including dropping the indexes, is rolled back at the end
+        with transaction.atomic():
+            uploads = []
+            start = time.perf_counter()
+            for number in range(options['uploads']):
+                upload = UploadedFile.objects.create(file_name=f'benchmark-{number}.csv', status=UploadedFile.STATUS_DONE)
+                uploads.append(upload)
+                for offset in range(0, per_upload, options['chunk_size']):
+                    size = min(options['chunk_size'], per_upload - offset)
+                    insert_rows(normalize_chunk(make_frame(size, seed=number * per_upload + offset)), upload)
+            self.stdout.write(f'Inserted {per_upload * len(uploads)} rows in {time.perf_counter() - start:.1f}s')
+            
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            
+            target = uploads[len(uploads) // 2]
+            indexed = self.run_queries(target, options['repeat'], 'With indexes')
+            
+            with connection.cursor() as cursor:
+                for name in COMPOSITE_INDEXES:
+                    cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+                cursor.execute('ANALYZE')
+            plain = self.run_queries(target, options['repeat'], 'Without composite indexes (FK index only)')
+            
+            self.stdout.write(self.style.MIGRATE_HEADING('\nSpeedup'))
+            for name in indexed:
+                self.stdout.write(f'{name:<20} {plain[name] / indexed[name]:>8.1f}x')
+            
+            transaction.set_rollback(True)
@@ -0,0 +1,75 @@
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from analytics.ingest import insert_rows, normalize_chunk
+from analytics.models import EquipmentData, UploadedFile
+
+TYPES = ['Pump', 'Valve', 'Reactor', 'Heat Exchanger', 'Compressor', 'Condenser']
+
+
+def make_frame(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Equipment Name': [f'Unit-{i}' for i in range(rows)],
+        'Type': rng.choice(TYPES, rows),
+        'Flowrate': rng.normal(150, 40, rows).round(2),
+        'Pressure': rng.normal(6, 1.5, rows).round(2),
+        'Temperature': rng.normal(110, 25, rows).round(2),
+    })
+
+
+def ingest_iterrows(chunk, upload):
+    # The per-row construction FileUploadView used before vectorization
+    equipment_data = []
+    for _, row in chunk.iterrows():
+        equipment_data.append(EquipmentData(
+            upload=upload,
+            equipment_name=str(row.get('Equipment Name', 'Unknown')),
+            equipment_type=str(row.get('Type', 'Unknown')),
+            flowrate=float(row.get('Flowrate', 0)),
+            pressure=float(row.get('Pressure', 0)),
+            temperature=float(row.get('Temperature', 0))
+        ))
+    EquipmentData.objects.bulk_create(equipment_data)
+
+
+def ingest_vectorized(chunk, upload):
+    insert_rows(normalize_chunk(chunk), upload)
+
+
+class Command(BaseCommand):
+    help = 'Compare iterrows and vectorized EquipmentData ingest (build + insert)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+        parser.add_argument('--skip-iterrows-above', type=int, default=None,
+                            help='Only time the vectorized path for larger sizes')
+
+    def timed(self, func, frame):
+        # Every run is rolled back so the benchmark leaves no rows behind
+        with transaction.atomic():
+            upload = UploadedFile.objects.create(file_name='benchmark.csv')
+            start = time.perf_counter()
+            func(frame, upload)
+            elapsed = time.perf_counter() - start
+            transaction.set_rollback(True)
+        return elapsed
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{'rows':>10} {'iterrows (s)':>14} {'vectorized (s)':>16} {'speedup':>9}")
+        
+        for rows in options['rows']:
+            frame = make_frame(rows)
+            vectorized = self.timed(ingest_vectorized, frame)
+            
+            limit = options['skip_iterrows_above']
+            if limit is not None and rows > limit:
+                self.stdout.write(f'{rows:>10} {"-":>14} {vectorized:>16.3f} {"-":>9}')
+                continue
+            
+            legacy = self.timed(ingest_iterrows, frame)
+            self.stdout.write(f'{rows:>10} {legacy:>14.3f} {vectorized:>16.3f} {legacy / vectorized:>8.1f}x')
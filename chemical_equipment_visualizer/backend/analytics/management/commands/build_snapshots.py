@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from analytics.models import UploadedFile
+from analytics.snapshots import snapshot_path, snapshots_enabled, write_snapshot_from_rows
+
+
+class Command(BaseCommand):
+    help = 'Write columnar snapshots for finished uploads that do not have one'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Rebuild existing snapshots too')
+
+    def handle(self, *args, **options):
+        if not snapshots_enabled():
+            raise CommandError('Snapshots are disabled or pyarrow is not installed')
+        
+        for upload in UploadedFile.objects.filter(status=UploadedFile.STATUS_DONE):
+            if snapshot_path(upload.id).exists() and not options['force']:
+                continue
+            write_snapshot_from_rows(upload)
+            self.stdout.write(f'Snapshot written for upload {upload.id} ({upload.file_name})')
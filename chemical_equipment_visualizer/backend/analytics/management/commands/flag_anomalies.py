@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from analytics.anomalies import flag_anomalies
+from analytics.caching import bump_dataset_version
+from analytics.models import UploadedFile
+from analytics.reports import build_current_reports
+
+
+class Command(BaseCommand):
+    help = 'Recompute the anomaly flags of finished uploads, e.g. after changing ANOMALY_DETECTION'
+
+    def add_arguments(self, parser):
+        parser.add_argument('upload_ids', nargs='*', type=int, help='Only these uploads (default: all)')
+
+    def handle(self, *args, **options):
+        uploads = UploadedFile.objects.filter(status=UploadedFile.STATUS_DONE)
+        if options['upload_ids']:
+            uploads = uploads.filter(id__in=options['upload_ids'])
+        
+        for upload in uploads:
+            flagged = flag_anomalies(upload)
+            # New report keys and ETags; stale report files are pruned below
+            UploadedFile.objects.filter(id=upload.id).update(flags_version=F('flags_version') + 1)
+            self.stdout.write(f'Upload {upload.id} ({upload.file_name}): {flagged} rows flagged')
+        bump_dataset_version()
+        build_current_reports()
@@ -0,0 +1,65 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from analytics.caching import bump_dataset_version
+from analytics.ingest import claim_next_upload, process_upload
+from analytics.jobs import after_upload
+from analytics.models import EquipmentData, UploadedFile
+
+
+class Command(BaseCommand):
+    help = 'Drain the queue of pending uploads with a local worker pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Uploads processed concurrently (keep at 1 on SQLite)')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty instead of polling')
+        parser.add_argument('--poll-interval', type=float, default=2.0)
+        parser.add_argument('--requeue', action='store_true',
+                            help='Reset uploads left in processing by a crashed worker')
+
+    def handle(self, *args, **options):
+        if options['requeue']:
+            self.requeue()
+        
+        workers = max(1, options['workers'])
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for _ in range(workers):
+                pool.submit(self.work, options['once'], options['poll_interval'])
+
+    def requeue(self):
+        stale = UploadedFile.objects.filter(status=UploadedFile.STATUS_PROCESSING)
+        EquipmentData.objects.filter(upload__in=stale).delete()
+        count = stale.update(status=UploadedFile.STATUS_PENDING, rows_processed=0)
+        bump_dataset_version()
+        self.stdout.write(f'Requeued {count} upload(s)')
+
+    def work(self, once, poll_interval):
+        try:
+            while True:
+                upload = claim_next_upload()
+                if upload is None:
+                    if once:
+                        return
+                    time.sleep(poll_interval)
+                    continue
+                
+                self.stdout.write(f'Processing upload {upload.id} ({upload.file_name})')
+                process_upload(upload)
+                if upload.status == UploadedFile.STATUS_DONE:
+                    self.stdout.write(self.style.SUCCESS(
+                        f'Upload {upload.id}: {upload.rows_processed} rows'
+                    ))
+                    for expired, rows in after_upload(upload):
+                        self.stdout.write(f'Retention removed upload {expired.id} ({rows} rows)')
+                else:
+                    self.stderr.write(f'Upload {upload.id} failed: {upload.error}')
+        except Exception as e:
+            self.stderr.write(f'Worker stopped: {e}')
+            raise
+        finally:
+            connection.close()
@@ -0,0 +1,155 @@
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+
+logger = logging.getLogger('analytics.metrics')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+METRICS = {
+    'analytics_request_duration_seconds': ('histogram', 'Time to produce a response, per endpoint'),
+    'analytics_requests_total': ('counter', 'Responses sent, per endpoint and status'),
+    'analytics_request_queries_total': ('counter', 'SQL queries run while handling requests'),
+    'analytics_stage_duration_seconds': ('histogram', 'Time spent in each stage of an operation'),
+    'analytics_stage_queries_total': ('counter', 'SQL queries run in each stage of an operation'),
+    'analytics_rows_total': ('counter', 'Rows handled by an operation'),
+    'analytics_bytes_read_total': ('counter', 'Bytes of uploaded files read by an operation'),
+}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """In-process counters and histograms, rendered in Prometheus text format.
+
+    Every process keeps its own numbers: /api/metrics shows the web process
+    that answers it, while the process_uploads worker reports through its
+    logs.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            counts, total = self._histograms.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            # Stored per bucket; made cumulative when rendered
+            position = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            counts[position] += 1
+            self._histograms[key] = (counts, total + value)
+
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(counts), total) for key, (counts, total) in self._histograms.items()}
+
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+            if kind == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{_labels(labels)} {_number(value)}')
+                continue
+            for (metric, labels), (counts, total) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(list(self.buckets) + ['+Inf'], counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_labels(labels, le=bound)} {cumulative}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(total)}')
+                lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+@contextmanager
+def count_queries():
+    """Count the SQL statements run on this thread's connection; yields a one-item list."""
+    counter = [0]
+
+    def wrapper(execute, sql, params, many, context):
+        counter[0] += 1
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield counter
+
+
+class Timings:
+    """Wall time and query counts per stage of one operation.
+
+    A stage can be entered many times (once per chunk); its totals add up.
+    ``finish`` feeds the registry and writes one JSON log line.
+    """
+
+    def __init__(self, operation, **fields):
+        self.operation = operation
+        self.fields = fields
+        self.stages = {}
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        with count_queries() as queries:
+            try:
+                yield
+            finally:
+                entry = self.stages.setdefault(name, {'seconds': 0.0, 'queries': 0, 'calls': 0})
+                entry['seconds'] += time.perf_counter() - start
+                entry['queries'] += queries[0]
+                entry['calls'] += 1
+
+    def add(self, **counts):
+        for key, value in counts.items():
+            self.fields[key] = self.fields.get(key, 0) + value
+
+    def finish(self, **fields):
+        self.fields.update(fields)
+        record = {
+            'event': self.operation,
+            'seconds': round(time.perf_counter() - self.started, 6),
+            **self.fields,
+            'stages': {
+                name: {**entry, 'seconds': round(entry['seconds'], 6)} for name, entry in self.stages.items()
+            },
+        }
+        for name, entry in self.stages.items():
+            registry.observe('analytics_stage_duration_seconds', entry['seconds'], operation=self.operation, stage=name)
+            registry.inc('analytics_stage_queries_total', entry['queries'], operation=self.operation, stage=name)
+        if self.fields.get('rows'):
+            registry.inc('analytics_rows_total', self.fields['rows'], operation=self.operation)
+        if self.fields.get('bytes_read'):
+            registry.inc('analytics_bytes_read_total', self.fields['bytes_read'], operation=self.operation)
+        logger.info(json.dumps(record, default=str))
+        return record
@@ -0,0 +1,37 @@
+import json
+import time
+
+from .metrics import count_queries, logger, registry
+
+
+class MetricsMiddleware:
+    """Latency, status and query count of every request, labelled by URL name.
+
+    Streamed responses (the full PDF report) are timed up to their first
+    byte; the rendering that follows happens while the body is sent.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with count_queries() as queries:
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        match = request.resolver_match
+        # Unrouted paths share one label so scanners can't grow the registry
+        endpoint = match.url_name or match.view_name if match else 'unmatched'
+        registry.observe('analytics_request_duration_seconds', elapsed, endpoint=endpoint, method=request.method)
+        registry.inc('analytics_requests_total', endpoint=endpoint, method=request.method, status=response.status_code)
+        registry.inc('analytics_request_queries_total', queries[0], endpoint=endpoint)
+        logger.info(json.dumps({
+            'event': 'request',
+            'endpoint': endpoint,
+            'method': request.method,
+            'status': response.status_code,
+            'seconds': round(elapsed, 6),
+            'queries': queries[0],
+        }))
+        return response
@@ -0,0 +1,50 @@
+# Generated by Django 4.2 on 2026-10-18 02:21
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def mark_existing_done(apps, schema_editor):
+    # Uploads that predate the job queue were ingested inline already
+    UploadedFile = apps.get_model('analytics', 'UploadedFile')
+    for upload in UploadedFile.objects.annotate(rows=Count('equipmentdata')):
+        upload.status = 'done'
+        upload.rows_processed = upload.rows
+        upload.processed_at = upload.uploaded_at
+        upload.save(update_fields=['status', 'rows_processed', 'processed_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0006_remove_uploadedfile_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='result',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='rows_processed',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.RunPython(mark_existing_done, migrations.RunPython.noop),
+    ]
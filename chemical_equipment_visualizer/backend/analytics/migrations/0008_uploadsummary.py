@@ -0,0 +1,62 @@
+# Generated by Django 4.2 on 2026-10-18 02:22
+
+from django.db import migrations, models
+from django.db.models import Count, F, Max, Min, Sum
+import django.db.models.deletion
+
+
+def backfill_summaries(apps, schema_editor):
+    UploadedFile = apps.get_model('analytics', 'UploadedFile')
+    EquipmentData = apps.get_model('analytics', 'EquipmentData')
+    UploadSummary = apps.get_model('analytics', 'UploadSummary')
+    
+    for upload in UploadedFile.objects.filter(status='done'):
+        rows = EquipmentData.objects.filter(upload=upload)
+        aggregates = {'total_count': Count('id')}
+        for metric in ['flowrate', 'pressure', 'temperature']:
+            aggregates[f'{metric}_sum'] = Sum(metric)
+            aggregates[f'{metric}_sumsq'] = Sum(F(metric) * F(metric))
+            aggregates[f'{metric}_min'] = Min(metric)
+            aggregates[f'{metric}_max'] = Max(metric)
+        fields = rows.aggregate(**aggregates)
+        for key, value in fields.items():
+            # Sums over an empty upload come back as NULL; min/max stay NULL
+            if value is None and not key.endswith(('_min', '_max')):
+                fields[key] = 0
+        fields['type_counts'] = {
+            item['equipment_type']: item['n']
+            for item in rows.values('equipment_type').annotate(n=Count('id')).order_by()
+        }
+        UploadSummary.objects.create(upload=upload, **fields)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0007_uploadedfile_processing_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_count', models.PositiveBigIntegerField(default=0)),
+                ('flowrate_sum', models.FloatField(default=0)),
+                ('flowrate_sumsq', models.FloatField(default=0)),
+                ('flowrate_min', models.FloatField(blank=True, null=True)),
+                ('flowrate_max', models.FloatField(blank=True, null=True)),
+                ('pressure_sum', models.FloatField(default=0)),
+                ('pressure_sumsq', models.FloatField(default=0)),
+                ('pressure_min', models.FloatField(blank=True, null=True)),
+                ('pressure_max', models.FloatField(blank=True, null=True)),
+                ('temperature_sum', models.FloatField(default=0)),
+                ('temperature_sumsq', models.FloatField(default=0)),
+                ('temperature_min', models.FloatField(blank=True, null=True)),
+                ('temperature_max', models.FloatField(blank=True, null=True)),
+                ('type_counts', models.JSONField(default=dict)),
+                ('upload', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='analytics.uploadedfile')),
+            ],
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
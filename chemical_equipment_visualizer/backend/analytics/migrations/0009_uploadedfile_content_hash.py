@@ -0,0 +1,35 @@
+# Generated by Django 4.2 on 2026-10-18 02:24
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def hash_existing_files(apps, schema_editor):
+    UploadedFile = apps.get_model('analytics', 'UploadedFile')
+    for upload in UploadedFile.objects.exclude(file=''):
+        digest = hashlib.sha256()
+        try:
+            with upload.file.open('rb') as file:
+                for chunk in file.chunks():
+                    digest.update(chunk)
+        except FileNotFoundError:
+            continue
+        upload.content_hash = digest.hexdigest()
+        upload.save(update_fields=['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0008_uploadsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.RunPython(hash_existing_files, migrations.RunPython.noop),
+    ]
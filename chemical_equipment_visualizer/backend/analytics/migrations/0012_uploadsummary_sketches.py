@@ -0,0 +1,89 @@
+# Generated by Django 4.2 on 2026-10-18 02:55
+
+import numpy as np
+from django.db import migrations, models
+
+METRICS = ['flowrate', 'pressure', 'temperature']
+
+
+class TDigest:
+    # Frozen copy of analytics.sketches.TDigest as of this migration (the
+    # parts needed to build and serialize one), so later changes to the
+    # app code don't change what this migration writes
+
+    def __init__(self, compression=200):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = None
+        self.max = None
+
+    def update(self, values):
+        values = np.asarray(values, dtype='float64')
+        values = values[np.isfinite(values)]
+        if not len(values):
+            return
+        low, high = float(values.min()), float(values.max())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+        self._compress(np.concatenate([self.means, values]),
+                       np.concatenate([self.weights, np.ones(len(values))]))
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        left = (np.cumsum(weights) - weights) / total
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * left - 1)
+        groups = np.floor(k - k[0]).astype('int64')
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+
+        merged = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / merged
+        self.weights = merged
+
+    def to_dict(self):
+        return {
+            'compression': self.compression,
+            'min': self.min,
+            'max': self.max,
+            'means': self.means.tolist(),
+            'weights': self.weights.tolist(),
+        }
+
+
+def backfill_sketches(apps, schema_editor):
+    EquipmentData = apps.get_model('analytics', 'EquipmentData')
+    UploadSummary = apps.get_model('analytics', 'UploadSummary')
+
+    for summary in UploadSummary.objects.all():
+        sketches = {metric: TDigest() for metric in METRICS}
+        rows = EquipmentData.objects.filter(upload_id=summary.upload_id).values_list(*METRICS)
+        batch = []
+        for row in rows.iterator(chunk_size=50000):
+            batch.append(row)
+            if len(batch) >= 50000:
+                for metric, values in zip(METRICS, zip(*batch)):
+                    sketches[metric].update(values)
+                batch = []
+        if batch:
+            for metric, values in zip(METRICS, zip(*batch)):
+                sketches[metric].update(values)
+        summary.sketches = {metric: sketch.to_dict() for metric, sketch in sketches.items()}
+        summary.save(update_fields=['sketches'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0011_datasetversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsummary',
+            name='sketches',
+            field=models.JSONField(default=dict),
+        ),
+        migrations.RunPython(backfill_sketches, migrations.RunPython.noop),
+    ]
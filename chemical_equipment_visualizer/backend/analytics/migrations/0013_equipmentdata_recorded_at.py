@@ -0,0 +1,26 @@
+# Generated by Django 4.2 on 2026-10-18 02:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0012_uploadsummary_sketches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='equipmentdata',
+            name='recorded_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='equipmentdata',
+            index=models.Index(fields=['upload', 'recorded_at'], name='equipment_upload_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='equipmentdata',
+            index=models.Index(fields=['upload', 'equipment_name', 'recorded_at'], name='equipment_upload_name_time_idx'),
+        ),
+    ]
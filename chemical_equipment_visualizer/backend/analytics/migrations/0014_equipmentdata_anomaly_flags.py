@@ -0,0 +1,22 @@
+# Generated by Django 4.2 on 2026-10-18 03:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0013_equipmentdata_recorded_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='equipmentdata',
+            name='anomaly_flags',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='equipmentdata',
+            index=models.Index(condition=models.Q(('anomaly_flags__gt', 0)), fields=['upload', 'id'], name='equipment_anomaly_idx'),
+        ),
+    ]
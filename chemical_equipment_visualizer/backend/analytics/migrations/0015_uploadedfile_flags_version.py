@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 03:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0014_equipmentdata_anomaly_flags'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='flags_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,87 @@
+from functools import reduce
+from operator import add, or_
+
+import numpy as np
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Case, F, IntegerField, Q, Value, When
+
+METRICS = ['flowrate', 'pressure', 'temperature']
+METHODS = ['zscore', 'iqr']
+FLAGS = {
+    (metric, method): 1 << (2 * position + offset)
+    for position, metric in enumerate(METRICS)
+    for offset, method in enumerate(METHODS)
+}
+DEFAULT_SETTINGS = {
+    'Z_THRESHOLD': 3.0,
+    'IQR_FACTOR': 1.5,
+    'MIN_GROUP_SIZE': 8,
+}
+
+
+def type_bounds(values, options):
+    # Frozen copy of the analytics.anomalies rules as of this migration, with
+    # exact quartiles: the rows of one type are loaded once here instead of
+    # being sketched during ingest
+    mean, std = values.mean(axis=0), values.std(axis=0, ddof=1)
+    q1, q3 = np.percentile(values, [25, 75], axis=0)
+    iqr = q3 - q1
+    return {
+        'zscore': (mean - options['Z_THRESHOLD'] * std, mean + options['Z_THRESHOLD'] * std),
+        'iqr': (q1 - options['IQR_FACTOR'] * iqr, q3 + options['IQR_FACTOR'] * iqr),
+    }
+
+
+def outside(metric, low, high):
+    conditions = [
+        Q(**{f'{metric}__{lookup}': float(bound)})
+        for lookup, bound in (('lt', low), ('gt', high)) if not np.isnan(bound)
+    ]
+    return reduce(or_, conditions) if conditions else None
+
+
+def backfill_anomaly_flags(apps, schema_editor):
+    EquipmentData = apps.get_model('analytics', 'EquipmentData')
+    UploadedFile = apps.get_model('analytics', 'UploadedFile')
+    options = dict(DEFAULT_SETTINGS, **getattr(settings, 'ANOMALY_DETECTION', {}))
+
+    for upload in UploadedFile.objects.filter(status='done'):
+        rows = EquipmentData.objects.filter(upload_id=upload.id)
+        if rows.filter(anomaly_flags__gt=0).exists():
+            # Scored at ingest already
+            continue
+        types = rows.values_list('equipment_type', flat=True).distinct()
+        for equipment_type in list(types):
+            of_type = rows.filter(equipment_type=equipment_type)
+            values = np.array(of_type.values_list(*METRICS), dtype='float64').reshape(-1, len(METRICS))
+            if len(values) < options['MIN_GROUP_SIZE']:
+                continue
+            bounds = type_bounds(values, options)
+            conditions = {}
+            for (metric, method), bit in FLAGS.items():
+                low, high = bounds[method]
+                position = METRICS.index(metric)
+                condition = outside(metric, low[position], high[position])
+                if condition is not None:
+                    conditions[bit] = condition
+            if not conditions:
+                continue
+            flags = reduce(add, (
+                Case(When(condition, then=Value(bit)), default=Value(0), output_field=IntegerField())
+                for bit, condition in conditions.items()
+            ))
+            of_type.filter(reduce(or_, conditions.values())).update(anomaly_flags=flags)
+        # Reports rendered before the flags existed get new keys
+        UploadedFile.objects.filter(id=upload.id).update(flags_version=F('flags_version') + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analytics', '0015_uploadedfile_flags_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_anomaly_flags, migrations.RunPython.noop),
+    ]
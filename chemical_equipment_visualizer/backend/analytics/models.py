@@ -1,9 +1,28 @@
 from django.db import models
 
 class UploadedFile(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    
     file = models.FileField(upload_to='uploads/')  # user field HATAO
     file_name = models.CharField(max_length=255)
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    rows_processed = models.PositiveBigIntegerField(default=0)
+    error = models.TextField(blank=True)
+    result = models.JSONField(null=True, blank=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    # Bumped whenever the rows are re-scored, so reports keyed on it are rebuilt
+    flags_version = models.PositiveIntegerField(default=0)
     
     class Meta:
         ordering = ['-uploaded_at']
@@ -18,6 +37,53 @@ class EquipmentData(models.Model):
     flowrate = models.FloatField()
     pressure = models.FloatField()
     temperature = models.FloatField()
+    # Reading time, for exports that carry a timestamp column
+    recorded_at = models.DateTimeField(null=True, blank=True)
+    # Outlier bits per metric and method; see analytics.anomalies
+    anomaly_flags = models.PositiveSmallIntegerField(default=0)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['upload', 'equipment_type'], name='equipment_upload_type_idx'),
+            models.Index(fields=['upload', 'flowrate'], name='equipment_upload_flow_idx'),
+            models.Index(fields=['upload', 'pressure'], name='equipment_upload_press_idx'),
+            models.Index(fields=['upload', 'temperature'], name='equipment_upload_temp_idx'),
+            models.Index(fields=['equipment_type'], name='equipment_type_idx'),
+            models.Index(fields=['upload', 'recorded_at'], name='equipment_upload_time_idx'),
+            models.Index(fields=['upload', 'equipment_name', 'recorded_at'], name='equipment_upload_name_time_idx'),
+            # Partial: only the few flagged rows are indexed
+            models.Index(fields=['upload', 'id'], name='equipment_anomaly_idx', condition=models.Q(anomaly_flags__gt=0)),
+        ]
+    
+    def __str__(self):
+        return f"{self.equipment_name} ({self.equipment_type})"
+
+class UploadSummary(models.Model):
+    # Partial aggregates written once at ingest; see analytics.summaries
+    upload = models.OneToOneField(UploadedFile, on_delete=models.CASCADE, related_name='summary')
+    total_count = models.PositiveBigIntegerField(default=0)
+    flowrate_sum = models.FloatField(default=0)
+    flowrate_sumsq = models.FloatField(default=0)
+    flowrate_min = models.FloatField(null=True, blank=True)
+    flowrate_max = models.FloatField(null=True, blank=True)
+    pressure_sum = models.FloatField(default=0)
+    pressure_sumsq = models.FloatField(default=0)
+    pressure_min = models.FloatField(null=True, blank=True)
+    pressure_max = models.FloatField(null=True, blank=True)
+    temperature_sum = models.FloatField(default=0)
+    temperature_sumsq = models.FloatField(default=0)
+    temperature_min = models.FloatField(null=True, blank=True)
+    temperature_max = models.FloatField(null=True, blank=True)
+    type_counts = models.JSONField(default=dict)
+    # Serialized analytics.sketches.TDigest per metric
+    sketches = models.JSONField(default=dict)
+    
+    def __str__(self):
+        return f"Summary of {self.upload}"
+
+class DatasetVersion(models.Model):
+    # Single row bumped whenever the set of uploads changes; see analytics.caching
+    version = models.PositiveBigIntegerField(default=0)
     
     def __str__(self):
-        return f"{self.equipment_name} ({self.equipment_type})"
\ No newline at end of file
+        return f"Dataset version {self.version}"
\ No newline at end of file
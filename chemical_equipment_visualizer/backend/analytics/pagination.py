@@ -0,0 +1,14 @@
+from rest_framework.pagination import CursorPagination
+
+
+class EquipmentCursorPagination(CursorPagination):
+    """Keyset pagination over ``EquipmentData.id``.
+
+    Each page is ``WHERE id > <cursor> ORDER BY id LIMIT n``, so page 10,000
+    costs the same as the first one.
+    """
+
+    ordering = 'id'
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
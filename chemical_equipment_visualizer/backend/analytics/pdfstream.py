@@ -0,0 +1,137 @@
+import math
+import zlib
+
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+# Standard Type 1 fonts need no embedding; object numbers 3.. in this order
+FONTS = {'F1': 'Helvetica', 'F2': 'Helvetica-Bold'}
+CATALOG_ID = 1
+PAGES_ID = 2
+
+
+def _escape(text):
+    data = str(text).encode('cp1252', 'replace')
+    return data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)').decode('latin-1')
+
+
+def _rgb(color):
+    color = color.lstrip('#')
+    return ' '.join(f'{int(color[i:i + 2], 16) / 255:.3f}' for i in (0, 2, 4))
+
+
+class StreamingPDF:
+    """Write a PDF one page at a time.
+
+    ReportLab's canvas keeps every page until ``save()``; this writer emits
+    each page's objects as soon as the page ends and only remembers their
+    byte offsets for the cross-reference table. Output accumulates until
+    ``take()`` is called, so a caller can hand it to a streaming response
+    page by page. Only text, lines, rectangles and pie wedges are supported.
+    """
+
+    def __init__(self, pagesize=letter):
+        self.width, self.height = pagesize
+        self.pending = []
+        self.offset = 0
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = PAGES_ID + len(FONTS) + 1
+        self.ops = []
+        self.font = None
+
+        self._write('%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        for number, (name, base) in enumerate(FONTS.items(), PAGES_ID + 1):
+            self._object(number, f'<< /Type /Font /Subtype /Type1 /BaseFont /{base} '
+                                 f'/Encoding /WinAnsiEncoding >>')
+
+    def _write(self, data):
+        if isinstance(data, str):
+            data = data.encode('latin-1')
+        self.pending.append(data)
+        self.offset += len(data)
+
+    def _object(self, number, body):
+        self.offsets[number] = self.offset
+        self._write(f'{number} 0 obj\n')
+        self._write(body)
+        self._write('\nendobj\n')
+
+    def take(self):
+        """Return and forget everything written since the last call."""
+        data = b''.join(self.pending)
+        self.pending = []
+        return data
+
+    def set_font(self, name, size):
+        key = next(key for key, base in FONTS.items() if base == name)
+        if self.font != (key, size):
+            self.font = (key, size)
+            self.ops.append(f'/{key} {size} Tf')
+
+    def text(self, x, y, text, align='left'):
+        if align == 'right':
+            key, size = self.font
+            x -= stringWidth(str(text), FONTS[key], size)
+        elif align == 'center':
+            key, size = self.font
+            x -= stringWidth(str(text), FONTS[key], size) / 2
+        self.ops.append(f'BT /{self.font[0]} {self.font[1]} Tf {x:.2f} {y:.2f} Td ({_escape(text)}) Tj ET')
+
+    def line(self, x1, y1, x2, y2):
+        self.ops.append(f'{x1:.2f} {y1:.2f} m {x2:.2f} {y2:.2f} l S')
+
+    def rect(self, x, y, width, height, fill):
+        self.ops.append(f'{_rgb(fill)} rg {x:.2f} {y:.2f} {width:.2f} {height:.2f} re f 0 g')
+
+    def wedge(self, cx, cy, radius, start, extent, fill):
+        """Pie slice from ``start`` through ``extent`` degrees, counter-clockwise."""
+        ops = [f'{_rgb(fill)} rg {cx:.2f} {cy:.2f} m']
+        angle = math.radians(start)
+        a = cx + radius * math.cos(angle), cy + radius * math.sin(angle)
+        ops.append(f'{a[0]:.2f} {a[1]:.2f} l')
+        segments = max(1, math.ceil(abs(extent) / 90))
+        step = math.radians(extent) / segments
+        k = 4 / 3 * math.tan(step / 4) * radius
+        for _ in range(segments):
+            end = angle + step
+            c1 = (cx + radius * math.cos(angle) - k * math.sin(angle),
+                  cy + radius * math.sin(angle) + k * math.cos(angle))
+            c2 = (cx + radius * math.cos(end) + k * math.sin(end),
+                  cy + radius * math.sin(end) - k * math.cos(end))
+            p = cx + radius * math.cos(end), cy + radius * math.sin(end)
+            ops.append(f'{c1[0]:.2f} {c1[1]:.2f} {c2[0]:.2f} {c2[1]:.2f} {p[0]:.2f} {p[1]:.2f} c')
+            angle = end
+        ops.append('h b 0 g')
+        self.ops.append(' '.join(ops))
+
+    def end_page(self):
+        content = zlib.compress('\n'.join(self.ops).encode('latin-1'))
+        self.ops = []
+        self.font = None
+
+        content_id, page_id = self.next_id, self.next_id + 1
+        self.next_id += 2
+        self.offsets[content_id] = self.offset
+        self._write(f'{content_id} 0 obj\n<< /Length {len(content)} /Filter /FlateDecode >>\nstream\n')
+        self._write(content)
+        self._write('\nendstream\nendobj\n')
+
+        fonts = ' '.join(f'/{key} {number} 0 R' for number, key in enumerate(FONTS, PAGES_ID + 1))
+        self._object(page_id, f'<< /Type /Page /Parent {PAGES_ID} 0 R '
+                              f'/MediaBox [0 0 {self.width:g} {self.height:g}] '
+                              f'/Resources << /Font << {fonts} >> >> /Contents {content_id} 0 R >>')
+        self.page_ids.append(page_id)
+
+    def close(self):
+        if self.ops or not self.page_ids:
+            self.end_page()
+        kids = ' '.join(f'{number} 0 R' for number in self.page_ids)
+        self._object(PAGES_ID, f'<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>')
+        self._object(CATALOG_ID, f'<< /Type /Catalog /Pages {PAGES_ID} 0 R >>')
+
+        xref = self.offset
+        self._write(f'xref\n0 {self.next_id}\n0000000000 65535 f \n')
+        for number in range(1, self.next_id):
+            self._write(f'{self.offsets[number]:010d} 00000 n \n')
+        self._write(f'trailer\n<< /Size {self.next_id} /Root {CATALOG_ID} 0 R >>\nstartxref\n{xref}\n%%EOF\n')
@@ -0,0 +1,364 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.db.models import Avg, Count, Sum
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+from .anomalies import describe_flags
+from .models import EquipmentData, UploadedFile
+from .pdfstream import StreamingPDF
+from .summaries import summarize_queryset
+
+REPORT_ANOMALIES = 10
+ANOMALY_LABELS = {'flowrate': 'flow', 'pressure': 'press', 'temperature': 'temp'}
+CHART_COLORS = ['#36A2EB', '#FF6384', '#FFCE56', '#4BC0C0', '#9966FF', '#FF9F40']
+PIE_SLICES = 8
+ROW_HEIGHT = 14
+
+
+def reports_dir():
+    return Path(settings.MEDIA_ROOT) / 'reports'
+
+
+def report_uploads(upload_id=None):
+    """Ids of the finished uploads a report covers, in a stable order."""
+    uploads = UploadedFile.objects.filter(status=UploadedFile.STATUS_DONE)
+    if upload_id is not None:
+        uploads = uploads.filter(id=upload_id)
+    return sorted(uploads.values_list('id', flat=True))
+
+
+def flags_version(upload_ids):
+    # Per-upload counters only grow, so their sum changes whenever any of them does
+    versions = UploadedFile.objects.filter(id__in=upload_ids).aggregate(total=Sum('flags_version'))
+    return versions['total'] or 0
+
+
+def report_key(upload_ids, upload_id=None, full=False, version=None):
+    # A finished upload's rows only change when they are re-scored, which
+    # bumps its flags_version; the ids and that version identify the content
+    if version is None:
+        version = flags_version(upload_ids)
+    prefix = 'full-' if full else ''
+    suffix = f'-v{version}' if version else ''
+    if upload_id is not None:
+        return f'{prefix}upload-{upload_id}{suffix}'
+    digest = hashlib.sha1(','.join(map(str, upload_ids)).encode()).hexdigest()[:16]
+    return f'{prefix}all-{digest}{suffix}'
+
+
+def report_path(key):
+    return reports_dir() / f'{key}.pdf'
+
+
+def render_report(stream, upload_ids):
+    p = canvas.Canvas(stream, pagesize=letter)
+
+    p.setFont("Helvetica-Bold", 16)
+    p.drawString(100, 750, "Chemical Equipment Analysis Report")
+    p.setFont("Helvetica", 12)
+    p.drawString(100, 730, "Generated from Chemical Equipment Visualizer")
+    p.line(100, 720, 500, 720)
+
+    data = EquipmentData.objects.filter(upload_id__in=upload_ids)
+    summary = summarize_queryset(data)
+    if summary['total_count']:
+        p.setFont("Helvetica-Bold", 14)
+        p.drawString(100, 690, "Summary Statistics")
+        p.setFont("Helvetica", 12)
+
+        p.drawString(100, 670, f"Total Equipment: {summary['total_count']}")
+        p.drawString(100, 650, f"Average Flowrate: {summary['avg_flowrate']:.2f}")
+        p.drawString(100, 630, f"Average Pressure: {summary['avg_pressure']:.2f}")
+        p.drawString(100, 610, f"Average Temperature: {summary['avg_temperature']:.2f}")
+
+        p.setFont("Helvetica-Bold", 14)
+        p.drawString(100, 580, "Equipment List:")
+        p.setFont("Helvetica", 10)
+
+        y = 560
+        items = data.order_by('id').values_list('equipment_name', 'equipment_type')[:15]
+        for i, (equipment_name, equipment_type) in enumerate(items):
+            text = f"{i+1}. {equipment_name} ({equipment_type})"
+            p.drawString(100, y, text)
+            y -= 15
+        
+        flagged = data.filter(anomaly_flags__gt=0)
+        y -= 15
+        p.setFont("Helvetica-Bold", 14)
+        p.drawString(100, y, f"Anomalies: {flagged.count()} flagged")
+        p.setFont("Helvetica", 10)
+        y -= 20
+        items = flagged.order_by('id').values_list('equipment_name', 'equipment_type', 'anomaly_flags')
+        for equipment_name, equipment_type, flags in items[:REPORT_ANOMALIES]:
+            p.drawString(100, y, f"{equipment_name} ({equipment_type}): {', '.join(describe_flags(flags))}")
+            y -= 15
+    else:
+        p.drawString(100, 690, "No data available")
+
+    p.showPage()
+    p.save()
+
+
+class PageWriter:
+    """Layout cursor that starts a new, numbered page when one fills up."""
+
+    top = 750
+    bottom = 60
+
+    def __init__(self, pdf, title):
+        self.pdf = pdf
+        self.title = title
+        self.page = 0
+        self.y = self.top
+        self.header = None
+
+    def new_page(self):
+        if self.page:
+            self.pdf.end_page()
+        self.page += 1
+        self.pdf.set_font('Helvetica', 8)
+        self.pdf.text(50, 30, self.title)
+        self.pdf.text(560, 30, f"Page {self.page}", align='right')
+        self.y = self.top
+        if self.header is not None:
+            self.table_header()
+
+    def ensure(self, height):
+        if self.y - height < self.bottom:
+            self.new_page()
+
+    def heading(self, text, size=14):
+        self.ensure(size + 20)
+        self.pdf.set_font('Helvetica-Bold', size)
+        self.pdf.text(50, self.y, text)
+        self.y -= size + 8
+
+    def text(self, text, size=11):
+        self.ensure(size + 4)
+        self.pdf.set_font('Helvetica', size)
+        self.pdf.text(50, self.y, text)
+        self.y -= size + 4
+
+    def start_table(self, columns):
+        # columns: (title, x, align) triples; the header repeats on every page
+        self.header = columns
+        self.ensure(ROW_HEIGHT * 2)
+        self.table_header()
+
+    def table_header(self):
+        self.pdf.set_font('Helvetica-Bold', 9)
+        self.cells([title for title, _, _ in self.header])
+        self.pdf.line(50, self.y + ROW_HEIGHT - 3, 560, self.y + ROW_HEIGHT - 3)
+
+    def row(self, cells):
+        self.ensure(ROW_HEIGHT)
+        self.pdf.set_font('Helvetica', 9)
+        self.cells(cells)
+
+    def cells(self, cells):
+        for cell, (_, x, align) in zip(cells, self.header):
+            self.pdf.text(x, self.y, cell, align=align)
+        self.y -= ROW_HEIGHT
+
+    def end_table(self):
+        self.header = None
+        self.y -= ROW_HEIGHT
+
+
+def draw_type_pie(pdf, x, y, type_stats):
+    """Type distribution as a pie with a legend; small types fold into Other."""
+    slices = [(item['equipment_type'], item['count']) for item in type_stats[:PIE_SLICES]]
+    other = sum(item['count'] for item in type_stats[PIE_SLICES:])
+    if other:
+        slices.append(('Other', other))
+    total = sum(count for _, count in slices)
+
+    pdf.set_font('Helvetica-Bold', 10)
+    pdf.text(x + 125, y + 185, 'Equipment Type Distribution', align='center')
+    start = 90
+    pdf.set_font('Helvetica', 8)
+    for i, (label, count) in enumerate(slices):
+        color = CHART_COLORS[i % len(CHART_COLORS)]
+        extent = -360 * count / total
+        pdf.wedge(x + 70, y + 95, 65, start, extent, color)
+        start += extent
+        pdf.rect(x + 150, y + 160 - i * 14, 8, 8, color)
+        pdf.text(x + 162, y + 161 - i * 14, f"{label[:16]} ({count})")
+
+
+def draw_averages_bar(pdf, x, y, summary):
+    values = [summary['avg_flowrate'], summary['avg_pressure'], summary['avg_temperature']]
+    low, high = min(0, *values), max(0, *values)
+    scale = 140 / ((high - low) or 1)
+    base = y + 30 + (0 - low) * scale
+
+    pdf.set_font('Helvetica-Bold', 10)
+    pdf.text(x + 125, y + 185, 'Average Values', align='center')
+    pdf.line(x + 30, base, x + 240, base)
+    pdf.set_font('Helvetica', 8)
+    for i, (label, value) in enumerate(zip(['Flowrate', 'Pressure', 'Temperature'], values)):
+        left = x + 45 + i * 65
+        pdf.rect(left, min(base, base + value * scale), 40, abs(value * scale), CHART_COLORS[0])
+        pdf.text(left + 20, base + max(value * scale, 0) + 3, f"{value:.2f}", align='center')
+        pdf.text(left + 20, y + 15, label, align='center')
+
+
+def render_full_report(upload_ids, chunk_size=2000):
+    """Yield a paginated, per-type report of every row as PDF bytes.
+
+    Rows are read through ``iterator()`` (a server-side cursor where the
+    database supports one) and each page is yielded as soon as it is full,
+    so neither the rows nor the document are ever held in memory at once.
+    """
+    pdf = StreamingPDF(letter)
+    writer = PageWriter(pdf, "Chemical Equipment Analysis Report")
+    writer.new_page()
+    writer.heading("Chemical Equipment Analysis Report", size=16)
+    writer.text("Generated from Chemical Equipment Visualizer", size=12)
+    pdf.line(50, writer.y + 6, 560, writer.y + 6)
+    writer.y -= 14
+
+    data = EquipmentData.objects.filter(upload_id__in=upload_ids)
+    summary = summarize_queryset(data)
+    if not summary['total_count']:
+        writer.text("No data available")
+        pdf.close()
+        yield pdf.take()
+        return
+
+    writer.heading("Summary Statistics")
+    writer.text(f"Total Equipment: {summary['total_count']}")
+    writer.text(f"Average Flowrate: {summary['avg_flowrate']:.2f}")
+    writer.text(f"Average Pressure: {summary['avg_pressure']:.2f}")
+    writer.text(f"Average Temperature: {summary['avg_temperature']:.2f}")
+
+    type_stats = list(
+        data.order_by().values('equipment_type').annotate(
+            count=Count('id'),
+            avg_flowrate=Avg('flowrate'),
+            avg_pressure=Avg('pressure'),
+            avg_temperature=Avg('temperature'),
+        ).order_by('-count', 'equipment_type')
+    )
+    writer.y -= 210
+    draw_type_pie(pdf, 50, writer.y, type_stats)
+    draw_averages_bar(pdf, 310, writer.y, summary)
+    writer.y -= 20
+
+    writer.heading("Equipment Types")
+    writer.start_table([
+        ('Type', 50, 'left'), ('Count', 300, 'right'), ('Avg Flowrate', 380, 'right'),
+        ('Avg Pressure', 470, 'right'), ('Avg Temperature', 560, 'right'),
+    ])
+    for item in type_stats:
+        writer.row([
+            item['equipment_type'][:40], str(item['count']), f"{item['avg_flowrate']:.2f}",
+            f"{item['avg_pressure']:.2f}", f"{item['avg_temperature']:.2f}",
+        ])
+    writer.end_table()
+    yield pdf.take()
+
+    stats_by_type = {item['equipment_type']: item for item in type_stats}
+    rows = data.order_by('equipment_type', 'id').values_list(
+        'equipment_type', 'equipment_name', 'flowrate', 'pressure', 'temperature'
+    )
+    current_type = None
+    number = 0
+    for equipment_type, name, flowrate, pressure, temperature in rows.iterator(chunk_size=chunk_size):
+        if equipment_type != current_type:
+            # Every type starts its own section on a fresh page
+            writer.end_table()
+            writer.new_page()
+            current_type = equipment_type
+            stats = stats_by_type[equipment_type]
+            writer.heading(f"{equipment_type} ({stats['count']} units)")
+            writer.text(
+                f"Avg Flowrate {stats['avg_flowrate']:.2f}   Avg Pressure {stats['avg_pressure']:.2f}   "
+                f"Avg Temperature {stats['avg_temperature']:.2f}", size=10
+            )
+            writer.start_table([
+                ('#', 50, 'left'), ('Equipment Name', 90, 'left'), ('Flowrate', 400, 'right'),
+                ('Pressure', 480, 'right'), ('Temperature', 560, 'right'),
+            ])
+            number = 0
+        number += 1
+        writer.row([str(number), name[:55], f"{flowrate:.2f}", f"{pressure:.2f}", f"{temperature:.2f}"])
+        if pdf.pending:
+            yield pdf.take()
+
+    writer.end_table()
+    writer.new_page()
+    flagged = data.filter(anomaly_flags__gt=0)
+    writer.heading(f"Anomalies ({flagged.count()} flagged)")
+    writer.text("Outside the per-type z-score or IQR bounds computed at upload", size=10)
+    writer.start_table([
+        ('Equipment Name', 50, 'left'), ('Type', 210, 'left'), ('Flowrate', 330, 'right'),
+        ('Pressure', 390, 'right'), ('Temperature', 460, 'right'), ('Flags', 470, 'left'),
+    ])
+    rows = flagged.order_by('id').values_list(
+        'equipment_name', 'equipment_type', 'flowrate', 'pressure', 'temperature', 'anomaly_flags'
+    )
+    for name, equipment_type, flowrate, pressure, temperature, flags in rows.iterator(chunk_size=chunk_size):
+        # Only short metric names fit; the method is in the API response
+        metrics = {flag.split(':')[0] for flag in describe_flags(flags)}
+        writer.row([
+            name[:30], equipment_type[:22], f"{flowrate:.2f}", f"{pressure:.2f}", f"{temperature:.2f}",
+            ', '.join(label for metric, label in ANOMALY_LABELS.items() if metric in metrics),
+        ])
+        if pdf.pending:
+            yield pdf.take()
+
+    pdf.close()
+    yield pdf.take()
+
+
+def build_report(upload_ids, key):
+    """Render a report to disk; the file appears atomically under ``key``."""
+    path = report_path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix='.pdf.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as stream:
+            render_report(stream, upload_ids)
+        os.replace(tmp_name, path)
+    except Exception:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+    return path
+
+
+def get_report(upload_id=None):
+    """Return ``(path, key)`` of the current report, rendering it if missing."""
+    upload_ids = report_uploads(upload_id)
+    key = report_key(upload_ids, upload_id)
+    path = report_path(key)
+    if not path.exists():
+        build_report(upload_ids, key)
+    return path, key
+
+
+def prune_reports():
+    """Remove report files that no longer match the current set of uploads."""
+    versions = dict(
+        UploadedFile.objects.filter(status=UploadedFile.STATUS_DONE).values_list('id', 'flags_version')
+    )
+    upload_ids = sorted(versions)
+    current = {report_key(upload_ids, version=sum(versions.values()))} | {
+        report_key([upload_id], upload_id, version=versions[upload_id]) for upload_id in upload_ids
+    }
+    for path in reports_dir().glob('*.pdf'):
+        if path.stem not in current:
+            path.unlink(missing_ok=True)
+
+
+def build_current_reports(upload=None):
+    """Pre-render the reports a dashboard will ask for after an upload."""
+    if upload is not None and upload.status == UploadedFile.STATUS_DONE:
+        get_report(upload.id)
+    get_report()
+    prune_reports()
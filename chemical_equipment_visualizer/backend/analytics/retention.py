@@ -0,0 +1,158 @@
+import time
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .caching import bump_dataset_version
+from .locking import retry_locked, write_lock
+from .metrics import Timings
+from .models import EquipmentData, UploadedFile
+from .reports import report_key, report_path
+from .snapshots import delete_snapshots
+
+DEFAULT_POLICY = {
+    'KEEP_LAST': 5,
+    'MAX_AGE_DAYS': None,
+    'MAX_TOTAL_ROWS': None,
+    'FAILED_MAX_AGE_HOURS': 24,
+    'BATCH_SIZE': 10000,
+    'RUN_AFTER_UPLOAD': True,
+}
+
+
+def get_policy(**overrides):
+    policy = dict(DEFAULT_POLICY)
+    policy.update(getattr(settings, 'UPLOAD_RETENTION', {}))
+    policy.update({key: value for key, value in overrides.items() if value is not None})
+    return policy
+
+
+def select_expired(policy):
+    """Ids of uploads the policy no longer keeps.
+
+    Finished uploads are walked newest first; one expires once it falls
+    outside ``KEEP_LAST``, is older than ``MAX_AGE_DAYS`` or pushes the
+    running row count past ``MAX_TOTAL_ROWS``. Failed uploads only stay
+    around long enough for clients to read their status.
+    """
+    now = timezone.now()
+    expired = []
+    total_rows = 0
+
+    done = UploadedFile.objects.filter(status=UploadedFile.STATUS_DONE).order_by('-uploaded_at')
+    for position, (upload_id, uploaded_at, rows) in enumerate(
+        done.values_list('id', 'uploaded_at', 'rows_processed')
+    ):
+        total_rows += rows
+        if policy['KEEP_LAST'] is not None and position >= policy['KEEP_LAST']:
+            expired.append(upload_id)
+        elif policy['MAX_AGE_DAYS'] is not None and uploaded_at < now - timedelta(days=policy['MAX_AGE_DAYS']):
+            expired.append(upload_id)
+        elif policy['MAX_TOTAL_ROWS'] is not None and position and total_rows > policy['MAX_TOTAL_ROWS']:
+            # The newest upload is always kept, even if it alone is too big
+            expired.append(upload_id)
+
+    if policy['FAILED_MAX_AGE_HOURS'] is not None:
+        cutoff = now - timedelta(hours=policy['FAILED_MAX_AGE_HOURS'])
+        expired += UploadedFile.objects.filter(
+            status=UploadedFile.STATUS_FAILED, uploaded_at__lt=cutoff
+        ).values_list('id', flat=True)
+    return expired
+
+
+def delete_rows(upload_id, batch_size):
+    """Delete the ``EquipmentData`` of an upload in bounded batches.
+
+    Each batch is a single raw DELETE in its own transaction, so neither
+    Django's collector nor one long-running statement touches every row.
+    A batch that finds the database locked is retried on its own.
+    """
+    quote_name = connection.ops.quote_name
+    table = quote_name(EquipmentData._meta.db_table)
+    sql = 'DELETE FROM {table} WHERE {pk} IN (SELECT {pk} FROM {table} WHERE {fk} = %s LIMIT %s)'.format(
+        table=table,
+        pk=quote_name(EquipmentData._meta.pk.column),
+        fk=quote_name(EquipmentData._meta.get_field('upload').column),
+    )
+
+    def delete_batch():
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(sql, [upload_id, batch_size])
+            return cursor.rowcount
+
+    deleted = 0
+    while True:
+        count = retry_locked(delete_batch)
+        deleted += count
+        if count < batch_size:
+            return deleted
+
+
+def _delete_upload(upload):
+    with transaction.atomic():
+        # Only the summary is left to cascade now
+        UploadedFile.objects.filter(pk=upload.pk).delete()
+        bump_dataset_version()
+
+
+def purge_upload(upload, batch_size, timings=None):
+    """Delete an upload's rows, the upload itself and then its files.
+
+    Runs under the process's write lock, so an ingest in this process
+    finishes first; each write is retried while another process holds the
+    database lock.
+    """
+    timings = timings or Timings('retention')
+    with write_lock:
+        with timings.stage('delete_rows'):
+            rows = delete_rows(upload.id, batch_size)
+        with timings.stage('delete_upload'):
+            retry_locked(_delete_upload, upload)
+    with timings.stage('delete_files'):
+        if upload.file:
+            upload.file.delete(save=False)
+        delete_snapshots([upload.id])
+        report_path(report_key([upload.id], upload.id, version=upload.flags_version)).unlink(missing_ok=True)
+    return rows
+
+
+def apply_retention(policy=None, dry_run=False):
+    """Purge every upload the policy expires; returns ``(upload, rows)`` pairs."""
+    policy = policy or get_policy()
+    timings = Timings('retention_dry_run' if dry_run else 'retention')
+    with timings.stage('select'):
+        uploads = list(UploadedFile.objects.filter(id__in=select_expired(policy)))
+    if dry_run:
+        purged = [(upload, upload.rows_processed) for upload in uploads]
+    else:
+        purged = [(upload, purge_upload(upload, policy['BATCH_SIZE'], timings)) for upload in uploads]
+    timings.finish(uploads=len(purged), rows=sum(rows for _, rows in purged))
+    return purged
+
+
+def remove_orphaned_files(min_age=timedelta(hours=1), dry_run=False):
+    """Delete upload and snapshot files that no ``UploadedFile`` refers to.
+
+    Files younger than ``min_age`` are skipped: an upload's file is written
+    to storage just before its row is committed.
+    """
+    media_root = Path(settings.MEDIA_ROOT)
+    referenced = {media_root / name for name in UploadedFile.objects.values_list('file', flat=True) if name}
+    upload_ids = {str(upload_id) for upload_id in UploadedFile.objects.values_list('id', flat=True)}
+    cutoff = time.time() - min_age.total_seconds()
+
+    removed = []
+    for path in (media_root / 'uploads').glob('*'):
+        if path.is_file() and path not in referenced and path.stat().st_mtime < cutoff:
+            removed.append(path)
+    for path in (media_root / 'snapshots').glob('*.arrow'):
+        if path.stem not in upload_ids and path.stat().st_mtime < cutoff:
+            removed.append(path)
+
+    if not dry_run:
+        for path in removed:
+            path.unlink(missing_ok=True)
+    return removed
@@ -4,11 +4,26 @@ from .models import UploadedFile, EquipmentData
 class UploadedFileSerializer(serializers.ModelSerializer):
     class Meta:
         model = UploadedFile
-        fields = ['id', 'file_name', 'uploaded_at']
-        read_only_fields = ['uploaded_at']
+        fields = ['id', 'file_name', 'uploaded_at', 'status']
+        read_only_fields = ['uploaded_at', 'status']
+
+class UploadStatusSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadedFile
+        fields = ['id', 'file_name', 'uploaded_at', 'status', 'rows_processed',
+                 'error', 'processed_at']
+        read_only_fields = fields
 
 class EquipmentDataSerializer(serializers.ModelSerializer):
+    """Pass ``fields`` to serialize only some of the fields."""
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
     class Meta:
         model = EquipmentData
         fields = ['id', 'equipment_name', 'equipment_type', 
-                 'flowrate', 'pressure', 'temperature']
\ No newline at end of file
+                 'flowrate', 'pressure', 'temperature', 'recorded_at']
\ No newline at end of file
@@ -0,0 +1,110 @@
+import numpy as np
+
+PERCENTILES = (50, 90, 99)
+
+
+class TDigest:
+    """Mergeable quantile sketch (a merging t-digest).
+
+    Values are kept as weighted centroids that are small near the tails and
+    large around the median, so extreme quantiles stay accurate while the
+    digest stays at a few hundred centroids however many values it has
+    seen. Two digests merge by pooling their centroids and compressing
+    again, which is how per-upload digests combine.
+    """
+
+    def __init__(self, compression=200, buffer_size=50000):
+        self.compression = compression
+        self.buffer_size = buffer_size
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = None
+        self.max = None
+        self._buffer = []
+        self._buffered = 0
+
+    @property
+    def count(self):
+        self._flush()
+        return int(self.weights.sum())
+
+    def update(self, values):
+        values = np.asarray(values, dtype='float64')
+        values = values[np.isfinite(values)]
+        if not len(values):
+            return
+        low, high = float(values.min()), float(values.max())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+        self._buffer.append(values)
+        self._buffered += len(values)
+        if self._buffered >= self.buffer_size:
+            self._flush()
+
+    def merge(self, other):
+        other._flush()
+        if not len(other.weights):
+            return
+        self._flush()
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._compress(np.concatenate([self.means, other.means]),
+                       np.concatenate([self.weights, other.weights]))
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        values = np.concatenate(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        self._compress(np.concatenate([self.means, values]),
+                       np.concatenate([self.weights, np.ones(len(values))]))
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        total = weights.sum()
+        # k1 scale function: centroids sharing a unit of k merge into one,
+        # which bounds their size by q(1 - q) and keeps the tails fine
+        left = (np.cumsum(weights) - weights) / total
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * left - 1)
+        groups = np.floor(k - k[0]).astype('int64')
+        starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+
+        merged = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / merged
+        self.weights = merged
+
+    def quantile(self, q):
+        """Estimated value at quantile ``q`` (0..1); ``None`` when empty."""
+        self._flush()
+        if not len(self.weights):
+            return None
+        total = self.weights.sum()
+        # Each centroid sits at the middle of the weight it covers
+        positions = np.r_[0, np.cumsum(self.weights) - self.weights / 2, total]
+        values = np.r_[self.min, self.means, self.max]
+        return float(np.interp(q * total, positions, values))
+
+    def percentiles(self, percentiles=PERCENTILES):
+        return {f'p{p}': self.quantile(p / 100) for p in percentiles}
+
+    def to_dict(self):
+        self._flush()
+        return {
+            'compression': self.compression,
+            'min': self.min,
+            'max': self.max,
+            'means': self.means.tolist(),
+            'weights': self.weights.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        digest = cls(compression=data.get('compression', 200))
+        if data.get('weights'):
+            digest.means = np.asarray(data['means'], dtype='float64')
+            digest.weights = np.asarray(data['weights'], dtype='float64')
+            digest.min = data['min']
+            digest.max = data['max']
+        return digest
@@ -0,0 +1,150 @@
+import os
+from pathlib import Path
+
+import pandas as pd
+from django.conf import settings
+
+try:
+    import pyarrow as pa
+except ImportError:  # snapshots are optional, readers fall back to the ORM
+    pa = None
+
+from .models import EquipmentData
+
+COLUMNS = ['equipment_name', 'equipment_type', 'flowrate', 'pressure', 'temperature']
+
+
+def snapshots_enabled():
+    return pa is not None and getattr(settings, 'SNAPSHOTS_ENABLED', True)
+
+
+def snapshot_path(upload_id):
+    return Path(settings.MEDIA_ROOT) / 'snapshots' / f'{upload_id}.arrow'
+
+
+class SnapshotWriter:
+    """Append normalized chunks of one upload to an Arrow IPC file.
+
+    Batches go to a temporary file that only replaces the snapshot on
+    ``close()``, so readers never see a half-written dataset.
+    """
+
+    def __init__(self, upload):
+        self.path = snapshot_path(upload.id)
+        self.tmp_path = self.path.with_suffix('.arrow.tmp')
+        self.writer = None
+        self.schema = None
+
+    def write(self, frame):
+        if self.writer is None:
+            self.schema = pa.Schema.from_pandas(frame, preserve_index=False)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.writer = pa.ipc.new_file(str(self.tmp_path), self.schema)
+        batch = pa.RecordBatch.from_pandas(frame, schema=self.schema, preserve_index=False)
+        self.writer.write_batch(batch)
+
+    def close(self):
+        if self.writer is None:
+            return
+        self.writer.close()
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.tmp_path.unlink(missing_ok=True)
+
+
+def load_table(upload_id, columns=None):
+    """Memory-map the snapshot of an upload; ``None`` if there is none."""
+    if pa is None:
+        return None
+    path = snapshot_path(upload_id)
+    if not path.exists():
+        return None
+    table = pa.ipc.open_file(pa.memory_map(str(path))).read_all()
+    if not columns:
+        return table
+    # Uploads without timestamps have no recorded_at column in their snapshot
+    for name in columns:
+        if name not in table.column_names:
+            table = table.append_column(name, pa.nulls(len(table), pa.timestamp('ns', tz='UTC')))
+    return table.select(columns)
+
+
+def load_frame(upload_ids, columns=None):
+    """Load the normalized rows of ``upload_ids`` as one DataFrame.
+
+    Uploads with a snapshot are read from the memory-mapped file; the rest
+    fall back to a ``values_list`` query on ``EquipmentData``.
+    """
+    columns = columns or COLUMNS
+    frames = []
+    for upload_id in upload_ids:
+        table = load_table(upload_id, columns)
+        if table is not None:
+            frames.append(table.to_pandas())
+            continue
+        rows = EquipmentData.objects.filter(upload_id=upload_id).order_by('id').values_list(*columns)
+        frames.append(to_frame(rows.iterator(chunk_size=10000), columns))
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+
+def iter_frames(upload_id, columns=None, chunk_size=50000):
+    """Yield the normalized rows of one upload a batch at a time.
+
+    Like ``load_frame``, but only one batch is materialized at once: the
+    snapshot's record batches, or ``chunk_size`` rows from the database.
+    """
+    columns = columns or COLUMNS
+    table = load_table(upload_id, columns)
+    if table is not None:
+        for batch in table.to_batches():
+            yield batch.to_pandas()
+        return
+    rows = EquipmentData.objects.filter(upload_id=upload_id).order_by('id').values_list(*columns)
+    batch = []
+    for row in rows.iterator(chunk_size=chunk_size):
+        batch.append(row)
+        if len(batch) >= chunk_size:
+            yield to_frame(batch, columns)
+            batch = []
+    if batch:
+        yield to_frame(batch, columns)
+
+
+def to_frame(rows, columns):
+    frame = pd.DataFrame.from_records(rows, columns=columns)
+    if 'recorded_at' in frame:
+        frame['recorded_at'] = pd.to_datetime(frame['recorded_at'], utc=True)
+    return frame
+
+
+def write_snapshot_from_rows(upload, chunk_size=50000):
+    """Build the snapshot of an already ingested upload from its rows."""
+    writer = SnapshotWriter(upload)
+    rows = EquipmentData.objects.filter(upload=upload).order_by('id')
+    columns = COLUMNS
+    if rows.filter(recorded_at__isnull=False).exists():
+        columns = COLUMNS + ['recorded_at']
+    rows = rows.values_list(*columns)
+    batch = []
+    try:
+        for row in rows.iterator(chunk_size=chunk_size):
+            batch.append(row)
+            if len(batch) >= chunk_size:
+                writer.write(to_frame(batch, columns))
+                batch = []
+        if batch:
+            writer.write(to_frame(batch, columns))
+    except Exception:
+        writer.abort()
+        raise
+    writer.close()
+
+
+def delete_snapshots(upload_ids):
+    for upload_id in upload_ids:
+        snapshot_path(upload_id).unlink(missing_ok=True)
@@ -0,0 +1,122 @@
+from collections import Counter
+
+from django.db.models import Avg, Count
+
+from .sketches import TDigest
+
+METRICS = ['flowrate', 'pressure', 'temperature']
+
+
+class SummaryAccumulator:
+    """Mergeable partial aggregates over normalized ``EquipmentData`` columns.
+
+    Chunks are folded in during ingest and the partials are persisted as an
+    ``UploadSummary``; summaries of several uploads combine the same way.
+    Percentiles come from a ``TDigest`` per metric, which merges likewise.
+    """
+
+    def __init__(self):
+        self.total_count = 0
+        self.sums = dict.fromkeys(METRICS, 0.0)
+        self.sumsq = dict.fromkeys(METRICS, 0.0)
+        self.mins = dict.fromkeys(METRICS)
+        self.maxs = dict.fromkeys(METRICS)
+        self.type_counts = Counter()
+        self.sketches = {metric: TDigest() for metric in METRICS}
+
+    def update(self, frame):
+        if not len(frame):
+            return
+        self.total_count += len(frame)
+        for metric in METRICS:
+            values = frame[metric].to_numpy()
+            self.sums[metric] += float(values.sum())
+            self.sumsq[metric] += float((values * values).sum())
+            self._extend(metric, float(values.min()), float(values.max()))
+            self.sketches[metric].update(values)
+        self.type_counts.update(frame['equipment_type'].value_counts().to_dict())
+
+    def _extend(self, metric, low, high):
+        if self.mins[metric] is None or low < self.mins[metric]:
+            self.mins[metric] = low
+        if self.maxs[metric] is None or high > self.maxs[metric]:
+            self.maxs[metric] = high
+
+    def merge(self, summary):
+        """Fold a stored ``UploadSummary`` into this accumulator."""
+        if not summary.total_count:
+            return
+        self.total_count += summary.total_count
+        for metric in METRICS:
+            self.sums[metric] += getattr(summary, f'{metric}_sum')
+            self.sumsq[metric] += getattr(summary, f'{metric}_sumsq')
+            self._extend(metric, getattr(summary, f'{metric}_min'), getattr(summary, f'{metric}_max'))
+            if metric in summary.sketches:
+                self.sketches[metric].merge(TDigest.from_dict(summary.sketches[metric]))
+        self.type_counts.update(summary.type_counts)
+
+    @classmethod
+    def from_summaries(cls, summaries):
+        accumulator = cls()
+        for summary in summaries:
+            accumulator.merge(summary)
+        return accumulator
+
+    def mean(self, metric):
+        if not self.total_count:
+            return 0
+        return self.sums[metric] / self.total_count
+
+    def std(self, metric):
+        if self.total_count < 2:
+            return 0.0
+        variance = (self.sumsq[metric] - self.sums[metric] ** 2 / self.total_count) / (self.total_count - 1)
+        return max(variance, 0.0) ** 0.5
+
+    def percentiles(self):
+        return {metric: self.sketches[metric].percentiles() for metric in METRICS}
+
+    def summary_fields(self):
+        fields = {
+            'total_count': self.total_count,
+            'type_counts': dict(self.type_counts),
+            'sketches': {metric: sketch.to_dict() for metric, sketch in self.sketches.items()},
+        }
+        for metric in METRICS:
+            fields[f'{metric}_sum'] = self.sums[metric]
+            fields[f'{metric}_sumsq'] = self.sumsq[metric]
+            fields[f'{metric}_min'] = self.mins[metric]
+            fields[f'{metric}_max'] = self.maxs[metric]
+        return fields
+
+    def as_dict(self):
+        return {
+            'total_count': self.total_count,
+            'avg_flowrate': self.mean('flowrate'),
+            'avg_pressure': self.mean('pressure'),
+            'avg_temperature': self.mean('temperature'),
+            'type_distribution': dict(self.type_counts.most_common()),
+            'percentiles': self.percentiles()
+        }
+
+
+def summarize_queryset(queryset):
+    """Compute the summary dict for ``EquipmentData`` rows in the database.
+
+    Only the aggregates and the grouped type counts leave the database, so
+    the cost in the web process does not depend on the number of rows.
+    """
+    totals = queryset.aggregate(
+        total_count=Count('id'),
+        avg_flowrate=Avg('flowrate'),
+        avg_pressure=Avg('pressure'),
+        avg_temperature=Avg('temperature'),
+    )
+    type_counts = (
+        queryset.order_by().values('equipment_type')
+        .annotate(count=Count('id')).order_by('-count', 'equipment_type')
+    )
+    totals['type_distribution'] = {item['equipment_type']: item['count'] for item in type_counts}
+    # Same keys as SummaryAccumulator.as_dict; without sketches the values are null
+    totals['percentiles'] = {metric: TDigest().percentiles() for metric in METRICS}
+    return totals
@@ -1,3 +1,1498 @@
-from django.test import TestCase
+import io
+import json
+import re
+import shutil
+import tempfile
+import threading
+import zlib
+from datetime import timedelta
+from importlib import import_module
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.apps import apps
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import OperationalError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .anomalies import FLAGS, collect_type_stats, describe_flags, flag_anomalies, type_bounds
+from .caching import CACHE_ALIAS, dataset_version
+from .histograms import bin_edges, downsample_minmax, histogram
+from .locking import retry_locked, write_lock
+from .ingest import claim_next_upload, map_columns, normalize_chunk, process_upload, read_chunks
+from . import jobs, retention
+from .jobs import after_upload, schedule_after_upload, wait_for_after_upload
+from .management.commands.bench_endpoints import HEADERS, Command as BenchEndpoints, make_readings, write_csv
+from .management.commands.bench_queries import COMPOSITE_INDEXES, access_patterns
+from .metrics import Registry, Timings
+from .models import EquipmentData, UploadedFile, UploadSummary
+from .reports import build_current_reports, render_full_report, report_key, report_path, reports_dir
+from .retention import DEFAULT_POLICY, apply_retention, select_expired
+from .sketches import TDigest
+from .snapshots import COLUMNS as SNAPSHOT_COLUMNS, load_frame, snapshot_path
+from .summaries import METRICS, SummaryAccumulator, summarize_queryset
+
+COLUMNS = ['Equipment Name', 'Type', 'Flowrate', 'Pressure', 'Temperature']
+HEADER = ','.join(COLUMNS) + '\n'
+
+
+def make_csv(rows, header=HEADER):
+    return (header + ''.join(','.join(map(str, row)) + '\n' for row in rows)).encode()
+
+
+def random_rows(rng, types):
+    """``(name, type, flowrate, pressure, temperature)`` rows; ``types`` maps type to row count."""
+    rows = []
+    for equipment_type, count in types.items():
+        values = rng.normal([100, 5, 80], [10, 0.5, 4], size=(count, 3))
+        rows += [
+            (f'{equipment_type}-{i}', equipment_type, *np.round(row, 3))
+            for i, row in enumerate(values)
+        ]
+    return rows
+
+
+def read_pdf(data):
+    """Page count and footer page numbers of a PDF, checking its structure on the way.
+
+    Every cross-reference entry has to point at its object, and the page
+    tree's count has to match the page objects.
+    """
+    xref = int(re.search(rb'startxref\n(\d+)\n%%EOF\n$', data).group(1))
+    lines = data[xref:].split(b'trailer')[0].split(b'\n')
+    size = int(lines[1].split()[1])
+    for number, line in enumerate(lines[3:size + 2], 1):
+        offset = int(line.split()[0])
+        assert data.startswith(f'{number} 0 obj\n'.encode(), offset), f'object {number} is misplaced'
+
+    count = int(re.search(rb'/Type /Pages /Kids \[[^\]]*\] /Count (\d+)', data).group(1))
+    assert count == len(re.findall(rb'/Type /Page ', data)), 'page count does not match the page objects'
+
+    footers = []
+    for match in re.finditer(rb'<< /Length (\d+) /Filter /FlateDecode >>\nstream\n', data):
+        content = zlib.decompress(data[match.end():match.end() + int(match.group(1))])
+        footers += [int(page) for page in re.findall(rb'\(Page (\d+)\) Tj', content)]
+    return count, footers
+
+
+class UploadTestCase(TestCase):
+    """Uploads go through the API, with their files under a throwaway MEDIA_ROOT."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root, INGEST_ASYNC=False)
+        media.enable()
+        self.addCleanup(media.disable)
+        # Cached responses are keyed by a dataset version that restarts with every test
+        caches[CACHE_ALIAS].clear()
+
+    def post(self, content, name='equipment.csv', **params):
+        return self.client.post('/api/upload/', {'file': SimpleUploadedFile(name, content), **params})
+
+    def upload(self, content, name='equipment.csv'):
+        self.assertEqual(self.post(content, name).status_code, 200)
+        return UploadedFile.objects.latest('id')
+
+    def process_pending(self):
+        # What the process_uploads worker does, on the test's own connection
+        while (upload := claim_next_upload()) is not None:
+            process_upload(upload)
+
+
+class ChunkedIngestTests(UploadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.rows = random_rows(np.random.default_rng(0), {'Pump': 30, 'Valve': 15, 'Reactor': 5})
+
+    def test_read_chunks(self):
+        header = ' Equipment Name , Equip Type,Flow (m3/h),Pressure bar,Temp C\n'
+        file = SimpleUploadedFile('equipment.csv', make_csv(self.rows, header))
+        chunks = list(read_chunks(file, chunk_size=7))
+        self.assertEqual([len(chunk) for chunk in chunks], [7] * 7 + [1])
+        for chunk in chunks:
+            self.assertEqual(list(chunk.columns), COLUMNS)
+        self.assertEqual(pd.concat(chunks)['Equipment Name'].tolist(), [row[0] for row in self.rows])
+
+    @override_settings(INGEST_CHUNK_SIZE=7)
+    def test_upload_in_chunks(self):
+        response = self.post(make_csv(self.rows))
+        self.assertEqual(response.status_code, 200)
+
+        stored = EquipmentData.objects.order_by('id').values_list(
+            'equipment_name', 'equipment_type', 'flowrate', 'pressure', 'temperature'
+        )
+        self.assertEqual(list(stored), [tuple(row) for row in self.rows])
+
+        # The summary folded chunk by chunk matches one pass over the whole file
+        frame = pd.DataFrame(self.rows, columns=COLUMNS)
+        data = response.json()
+        summary = data['summary']
+        self.assertEqual(summary['total_count'], 50)
+        self.assertEqual(summary['type_distribution'], {'Pump': 30, 'Valve': 15, 'Reactor': 5})
+        for column in ['Flowrate', 'Pressure', 'Temperature']:
+            self.assertAlmostEqual(summary[f'avg_{column.lower()}'], frame[column].mean())
+        self.assertEqual([row['Equipment Name'] for row in data['data']], [f'Pump-{i}' for i in range(5)])
+
+    @override_settings(INGEST_CHUNK_SIZE=7)
+    def test_failed_chunk_rolls_back(self):
+        # A bad value in a late chunk fails the upload after earlier chunks were inserted
+        rows = list(self.rows)
+        rows[40] = ('Broken', 'Pump', 'not-a-number', 5, 80)
+        response = self.post(make_csv(rows))
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(EquipmentData.objects.exists())
+        self.assertFalse(UploadedFile.objects.exists())
+        self.assertEqual(response.json()['error'], "Flowrate: 'not-a-number' is not a number")
+
+    def test_blank_cells(self):
+        rows = [('P-1', 'Pump', 1.5, 2, 3), ('', '', '', ' ', ''), ('P-3', 'Pump', 4, '', 6)]
+        response = self.post(make_csv(rows))
+        self.assertEqual(response.status_code, 200)
+        stored = EquipmentData.objects.order_by('id').values_list(
+            'equipment_name', 'equipment_type', 'flowrate', 'pressure', 'temperature'
+        )
+        self.assertEqual(list(stored), [
+            ('P-1', 'Pump', 1.5, 2, 3), ('Unknown', 'Unknown', 0, 0, 0), ('P-3', 'Pump', 4, 0, 6),
+        ])
+
+
+class RowBuildTests(UploadTestCase):
+
+    def test_normalize_chunk(self):
+        chunk = pd.DataFrame({'Equipment Name': [101, 'P-2'], 'Flowrate': [1, 2], 'Pressure': [1.5, 2.5]})
+        frame = normalize_chunk(chunk)
+        self.assertEqual(frame.to_dict('records'), [
+            {'equipment_name': '101', 'equipment_type': 'Unknown', 'flowrate': 1.0, 'pressure': 1.5, 'temperature': 0.0},
+            {'equipment_name': 'P-2', 'equipment_type': 'Unknown', 'flowrate': 2.0, 'pressure': 2.5, 'temperature': 0.0},
+        ])
+        self.assertEqual(frame['flowrate'].dtype, 'float64')
+
+    @override_settings(INGEST_CHUNK_SIZE=4)
+    def test_missing_columns_get_defaults(self):
+        content = make_csv([(f'P-{i}', i, i * 2) for i in range(10)], 'Equipment Name,Flowrate,Pressure\n')
+        response = self.post(content)
+        self.assertEqual(response.status_code, 200)
+        stored = EquipmentData.objects.order_by('id').values_list(
+            'equipment_name', 'equipment_type', 'flowrate', 'pressure', 'temperature'
+        )
+        self.assertEqual(list(stored), [(f'P-{i}', 'Unknown', float(i), float(i * 2), 0.0) for i in range(10)])
+        self.assertEqual(response.json()['summary']['type_distribution'], {'Unknown': 10})
+
+
+class BackgroundIngestTests(UploadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.content = make_csv(random_rows(np.random.default_rng(1), {'Pump': 12, 'Valve': 8}))
+
+    def test_async_upload(self):
+        response = self.post(self.content, **{'async': '1'})
+        self.assertEqual(response.status_code, 202)
+        upload_id = response.json()['id']
+        self.assertEqual(response.json()['status'], UploadedFile.STATUS_PENDING)
+        self.assertEqual(self.client.get(response.json()['result_url']).status_code, 202)
+        self.assertFalse(EquipmentData.objects.exists())
+
+        self.process_pending()
+        status = self.client.get(f'/api/upload/{upload_id}/status/').json()
+        self.assertEqual((status['status'], status['rows_processed']), (UploadedFile.STATUS_DONE, 20))
+
+        # Same payload as a synchronous upload of the same file
+        result = self.client.get(f'/api/upload/{upload_id}/result/')
+        self.assertEqual(result.status_code, 200)
+        expected = self.post(self.content).json()
+        for key in ('message', 'summary', 'data'):
+            self.assertEqual(result.json()[key], expected[key])
+
+    @override_settings(INGEST_ASYNC=True)
+    def test_async_by_default(self):
+        self.assertEqual(self.post(self.content).status_code, 202)
+        self.assertEqual(self.post(self.content, **{'async': '0'}).status_code, 200)
+
+    def test_failed_async_upload(self):
+        response = self.post(b'Equipment Name,Flowrate\nP-1,1\nP-2,oops\n', **{'async': '1'})
+        upload_id = response.json()['id']
+        self.process_pending()
+
+        status = self.client.get(f'/api/upload/{upload_id}/status/').json()
+        self.assertEqual(status['status'], UploadedFile.STATUS_FAILED)
+        self.assertTrue(status['error'])
+        self.assertEqual(self.client.get(f'/api/upload/{upload_id}/result/').status_code, 500)
+        self.assertFalse(EquipmentData.objects.exists())
+
+    def test_unknown_upload(self):
+        self.assertEqual(self.client.get('/api/upload/999/status/').status_code, 404)
+        self.assertEqual(self.client.get('/api/upload/999/result/').status_code, 404)
+
+
+class UploadSummaryTests(UploadTestCase):
+    """Partials folded chunk by chunk against one pass over the full frame."""
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(2)
+        self.files = [
+            random_rows(rng, {'Pump': 40, 'Valve': 23}),
+            random_rows(rng, {'Valve': 17, 'Reactor': 9}),
+        ]
+
+    def assertSummary(self, summary, frame):
+        self.assertEqual(summary['total_count'], len(frame))
+        self.assertEqual(summary['type_distribution'], frame['Type'].value_counts().to_dict())
+        for metric in METRICS:
+            self.assertAlmostEqual(summary[f'avg_{metric}'], frame[metric.capitalize()].mean())
+
+    @override_settings(INGEST_CHUNK_SIZE=6)
+    def test_parity(self):
+        ids = [self.upload(make_csv(rows)).id for rows in self.files]
+        frames = [pd.DataFrame(rows, columns=COLUMNS) for rows in self.files]
+
+        for upload_id, frame in zip(ids, frames):
+            stored = UploadSummary.objects.get(upload_id=upload_id)
+            accumulator = SummaryAccumulator.from_summaries([stored])
+            for metric in METRICS:
+                values = frame[metric.capitalize()]
+                self.assertAlmostEqual(getattr(stored, f'{metric}_sum'), values.sum())
+                self.assertAlmostEqual(getattr(stored, f'{metric}_sumsq'), (values ** 2).sum(), places=4)
+                self.assertEqual(getattr(stored, f'{metric}_min'), values.min())
+                self.assertEqual(getattr(stored, f'{metric}_max'), values.max())
+                self.assertAlmostEqual(accumulator.std(metric), values.std())
+            self.assertSummary(self.client.get('/api/summary/', {'upload_id': upload_id}).json(), frame)
+
+        # Merging the stored partials of both uploads equals the concatenated file
+        self.assertSummary(self.client.get('/api/summary/').json(), pd.concat(frames))
+
+    def test_no_data(self):
+        self.assertEqual(self.client.get('/api/summary/').status_code, 404)
+
+    def test_upload_id(self):
+        upload = self.upload(make_csv(self.files[0]))
+        self.assertEqual(self.client.get('/api/summary/', {'upload_id': upload.id}).status_code, 200)
+        self.assertEqual(self.client.get('/api/summary/', {'upload_id': upload.id + 1}).status_code, 404)
+        for value in ('abc', '-1', '1.5'):
+            response = self.client.get('/api/summary/', {'upload_id': value})
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('upload_id', response.json()['error'])
+
+
+class DatabaseAggregateTests(UploadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(3)
+        self.post(make_csv(random_rows(rng, {'Pump': 25, 'Valve': 25, 'Reactor': 10})))
+        self.post(make_csv(random_rows(rng, {'Valve': 5, 'Mixer': 12})))
+
+    def test_matches_materialized_summary(self):
+        summary = summarize_queryset(EquipmentData.objects.all())
+        expected = SummaryAccumulator.from_summaries(UploadSummary.objects.all()).as_dict()
+        self.assertEqual(summary.keys(), expected.keys())
+        # Row aggregates carry no sketches: the percentiles are there, but null
+        self.assertEqual(summary['percentiles'], {metric: {'p50': None, 'p90': None, 'p99': None} for metric in METRICS})
+        self.assertEqual(summary['total_count'], 77)
+        for metric in METRICS:
+            self.assertAlmostEqual(summary[f'avg_{metric}'], expected[f'avg_{metric}'])
+        # Same counts, most common first with ties broken by name
+        self.assertEqual(list(summary['type_distribution'].items()),
+                         [('Valve', 30), ('Pump', 25), ('Mixer', 12), ('Reactor', 10)])
+
+    def test_summary_without_materialized_rows(self):
+        expected = self.client.get('/api/summary/').json()
+        UploadSummary.objects.all().delete()
+        summary = self.client.get('/api/summary/').json()
+        self.assertEqual(summary['total_count'], expected['total_count'])
+        self.assertEqual(summary['type_distribution'], expected['type_distribution'])
+        for metric in METRICS:
+            self.assertAlmostEqual(summary[f'avg_{metric}'], expected[f'avg_{metric}'])
+
+    def test_pdf(self):
+        response = self.client.get('/api/pdf/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(response).startswith(b'%PDF'))
+
+
+@override_settings(INGEST_CHUNK_SIZE=7)
+class SnapshotTests(UploadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.content = make_csv(random_rows(np.random.default_rng(4), {'Pump': 20, 'Valve': 12}))
+
+    def rows(self, upload):
+        rows = EquipmentData.objects.filter(upload=upload).order_by('id').values_list(*SNAPSHOT_COLUMNS)
+        return pd.DataFrame.from_records(list(rows), columns=SNAPSHOT_COLUMNS)
+
+    def test_snapshot_matches_rows(self):
+        upload = self.upload(self.content)
+        self.assertTrue(snapshot_path(upload.id).exists())
+        self.assertFalse(snapshot_path(upload.id).with_suffix('.arrow.tmp').exists())
+        pd.testing.assert_frame_equal(load_frame([upload.id]), self.rows(upload))
+
+    def test_several_uploads(self):
+        first, second = self.upload(self.content), self.upload(make_csv([('M-1', 'Mixer', 1.5, 2, 3)]))
+        snapshot_path(second.id).unlink()
+        # One from its snapshot, one from the ORM fallback
+        expected = pd.concat([self.rows(first), self.rows(second)], ignore_index=True)
+        pd.testing.assert_frame_equal(load_frame([first.id, second.id]), expected)
+
+    def test_failed_upload_leaves_no_snapshot(self):
+        self.post(self.content + b'Broken,Pump,oops,1,1\n')
+        self.assertEqual(list(snapshot_path(0).parent.glob('*')), [])
+
+    def test_build_snapshots(self):
+        with override_settings(SNAPSHOTS_ENABLED=False):
+            upload = self.upload(self.content)
+        self.assertFalse(snapshot_path(upload.id).exists())
+        pd.testing.assert_frame_equal(load_frame([upload.id]), self.rows(upload))
+
+        call_command('build_snapshots', stdout=io.StringIO())
+        self.assertTrue(snapshot_path(upload.id).exists())
+        pd.testing.assert_frame_equal(load_frame([upload.id]), self.rows(upload))
+
+
+class DeduplicationTests(UploadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.content = make_csv(random_rows(np.random.default_rng(5), {'Pump': 10, 'Valve': 6}))
+
+    def test_same_bytes(self):
+        first = self.upload(self.content)
+        other = self.upload(make_csv([('M-1', 'Mixer', 1, 2, 3)]))
+
+        response = self.post(self.content, name='renamed.csv')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['duplicate_of'], first.id)
+        self.assertEqual(data['summary'], first.result['summary'])
+        self.assertEqual(UploadedFile.objects.count(), 2)
+        self.assertEqual(EquipmentData.objects.count(), 17)
+        # Moved back to the top of the history
+        self.assertEqual([item['id'] for item in self.client.get('/api/history/').json()], [first.id, other.id])
+
+    def test_queued_job(self):
+        queued = self.post(self.content, **{'async': '1'}).json()
+        again = self.post(self.content, **{'async': '1'})
+        self.assertEqual(again.status_code, 202)
+        self.assertEqual(again.json()['id'], queued['id'])
+        # A synchronous upload does not wait for the queued one
+        self.assertNotIn('duplicate_of', self.post(self.content).json())
+
+    def test_failed_upload_is_not_reused(self):
+        content = b'Equipment Name,Flowrate\nP-1,oops\n'
+        failed = self.post(content, **{'async': '1'}).json()['id']
+        self.process_pending()
+        response = self.post(content, **{'async': '1'})
+        self.assertEqual(response.status_code, 202)
+        self.assertNotEqual(response.json()['id'], failed)
+
+
+class RetentionTests(TestCase):
+
+    def policy(self, **rules):
+        # Every rule off except the ones under test
+        policy = dict(DEFAULT_POLICY, KEEP_LAST=None, MAX_AGE_DAYS=None, MAX_TOTAL_ROWS=None,
+                      FAILED_MAX_AGE_HOURS=None)
+        policy.update(rules)
+        return policy
+
+    def upload(self, age=timedelta(), rows=100, status=UploadedFile.STATUS_DONE):
+        upload = UploadedFile.objects.create(file_name='equipment.csv', status=status, rows_processed=rows)
+        # uploaded_at is auto_now_add, so it can only be moved afterwards
+        UploadedFile.objects.filter(pk=upload.pk).update(uploaded_at=timezone.now() - age)
+        return upload.id
+
+    def test_keep_last(self):
+        ids = [self.upload(age=timedelta(hours=hours)) for hours in (4, 3, 2, 1)]
+        self.assertCountEqual(select_expired(self.policy(KEEP_LAST=2)), ids[:2])
+
+    def test_max_age_days(self):
+        old = self.upload(age=timedelta(days=10))
+        self.upload(age=timedelta(days=2))
+        self.assertEqual(select_expired(self.policy(MAX_AGE_DAYS=7)), [old])
+
+    def test_max_total_rows(self):
+        oldest, older, _, _ = [self.upload(age=timedelta(hours=hours), rows=100) for hours in (4, 3, 2, 1)]
+        self.assertCountEqual(select_expired(self.policy(MAX_TOTAL_ROWS=250)), [oldest, older])
+
+    def test_max_total_rows_keeps_newest(self):
+        older = self.upload(age=timedelta(hours=1), rows=10)
+        self.upload(rows=1000)
+        self.assertEqual(select_expired(self.policy(MAX_TOTAL_ROWS=500)), [older])
+
+    def test_failed_max_age_hours(self):
+        failed = self.upload(age=timedelta(hours=30), status=UploadedFile.STATUS_FAILED)
+        self.upload(age=timedelta(hours=1), status=UploadedFile.STATUS_FAILED)
+        self.upload(age=timedelta(hours=30), status=UploadedFile.STATUS_PENDING)
+        self.upload(age=timedelta(hours=30))
+        self.assertEqual(list(select_expired(self.policy(FAILED_MAX_AGE_HOURS=24))), [failed])
+
+    def test_rules_combine(self):
+        kept = self.upload(age=timedelta(hours=1))
+        too_old = self.upload(age=timedelta(days=10))
+        failed = self.upload(age=timedelta(days=2), status=UploadedFile.STATUS_FAILED)
+        expired = select_expired(self.policy(KEEP_LAST=5, MAX_AGE_DAYS=7, FAILED_MAX_AGE_HOURS=24))
+        self.assertCountEqual(expired, [too_old, failed])
+        self.assertNotIn(kept, expired)
+
+
+class PurgeTests(UploadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(6)
+        self.old = self.upload(make_csv(random_rows(rng, {'Pump': 11})))
+        self.new = self.upload(make_csv(random_rows(rng, {'Valve': 4})))
+
+    def test_purge(self):
+        paths = [Path(self.old.file.path), snapshot_path(self.old.id)]
+        purged = apply_retention(dict(DEFAULT_POLICY, KEEP_LAST=1, BATCH_SIZE=3))
+        self.assertEqual([(upload.id, rows) for upload, rows in purged], [(self.old.id, 11)])
+
+        self.assertEqual(list(UploadedFile.objects.values_list('id', flat=True)), [self.new.id])
+        self.assertEqual(EquipmentData.objects.count(), 4)
+        self.assertFalse(UploadSummary.objects.filter(upload_id=self.old.id).exists())
+        self.assertFalse(any(path.exists() for path in paths))
+
+    def test_purge_during_ingest(self):
+        # An ingest holds the write lock while the purge starts; the purge
+        # waits for it, then retries the writes another process has locked
+        events, ingesting = [], threading.Event()
+
+        def ingest():
+            with write_lock:
+                ingesting.set()
+                threading.Event().wait(0.2)
+                events.append('ingest done')
+
+        bump_dataset_version = retention.bump_dataset_version
+
+        def locked_once():
+            if 'locked' not in events:
+                events.append('locked')
+                raise OperationalError('database is locked')
+            events.append('purged')
+            bump_dataset_version()
+
+        thread = threading.Thread(target=ingest)
+        thread.start()
+        ingesting.wait(5)
+        with mock.patch('analytics.retention.bump_dataset_version', locked_once), \
+                mock.patch('analytics.locking.time.sleep'):
+            purged = apply_retention(dict(DEFAULT_POLICY, KEEP_LAST=1, BATCH_SIZE=3))
+        thread.join()
+
+        self.assertEqual(events, ['ingest done', 'locked', 'purged'])
+        self.assertEqual([(upload.id, rows) for upload, rows in purged], [(self.old.id, 11)])
+        self.assertEqual(list(UploadedFile.objects.values_list('id', flat=True)), [self.new.id])
+        self.assertEqual(EquipmentData.objects.count(), 4)
+        self.assertTrue(snapshot_path(self.new.id).exists())
+
+    def test_dry_run(self):
+        out = io.StringIO()
+        call_command('apply_retention', keep_last=1, dry_run=True, stdout=out)
+        self.assertIn(f'Would remove upload {self.old.id}', out.getvalue())
+        self.assertEqual(EquipmentData.objects.count(), 15)
+
+        call_command('apply_retention', keep_last=1, stdout=io.StringIO())
+        self.assertEqual(EquipmentData.objects.count(), 4)
+
+
+class IndexTests(TestCase):
+
+    def test_access_patterns_use_indexes(self):
+        upload = UploadedFile.objects.create(file_name='equipment.csv', status=UploadedFile.STATUS_DONE)
+        expected = {
+            'type filter': 'equipment_upload_type_idx',
+            'temperature range': 'equipment_upload_temp_idx',
+            'pressure range avg': 'equipment_upload_press_idx',
+            'flowrate top 100': 'equipment_upload_flow_idx',
+            'admin type filter': 'equipment_type_idx',
+        }
+        for name, queryset, _ in access_patterns(upload):
+            if name in expected:
+                self.assertIn(expected[name], queryset.explain(), name)
+
+    def test_bench_queries(self):
+        out = io.StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command('bench_queries', rows=400, uploads=2, repeat=1, chunk_size=100, stdout=out)
+        self.assertIn('Speedup', out.getvalue())
+        # Only the 0010 indexes are dropped for the baseline
+        dropped = [query['sql'].split()[-1].strip('"') for query in queries if query['sql'].startswith('DROP INDEX')]
+        self.assertEqual(dropped, COMPOSITE_INDEXES)
+        self.assertLess(set(COMPOSITE_INDEXES), {index.name for index in EquipmentData._meta.indexes})
+        # The benchmark rolls back its rows and the dropped indexes
+        self.assertFalse(EquipmentData.objects.exists())
+        self.assertIn('equipment_upload_type_idx', EquipmentData.objects.filter(upload_id=1, equipment_type='Pump').explain())
+
+
+@override_settings(UPLOAD_RETENTION={'RUN_AFTER_UPLOAD': False})
+class ResponseCacheTests(UploadTestCase):
+    """Version bumps run on commit, so uploads here execute their on_commit callbacks."""
+
+    def setUp(self):
+        super().setUp()
+        self.rng = np.random.default_rng(7)
+        self.committed_upload({'Pump': 5})
+
+    def committed_upload(self, types):
+        # Only the version bump; after_upload has tests of its own
+        with mock.patch('analytics.views.schedule_after_upload'), self.captureOnCommitCallbacks(execute=True):
+            return self.upload(make_csv(random_rows(self.rng, types)))
+
+    def test_etag_and_304(self):
+        response = self.client.get('/api/summary/')
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        with self.assertNumQueries(1):
+            # Only the version lookup; the view does not run
+            cached = self.client.get('/api/summary/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/summary/').json(), response.json())
+        # Other parameters are other entries
+        self.assertNotEqual(self.client.get('/api/summary/', {'upload_id': 1})['ETag'], etag)
+
+    def test_upload_invalidates(self):
+        version = dataset_version()
+        summary = self.client.get('/api/summary/')
+        history = self.client.get('/api/history/')
+        pdf = self.client.get('/api/pdf/')
+
+        self.committed_upload({'Valve': 3})
+        self.assertGreater(dataset_version(), version)
+
+        for old, path in ((summary, '/api/summary/'), (history, '/api/history/'), (pdf, '/api/pdf/')):
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=old['ETag'])
+            self.assertEqual(response.status_code, 200, path)
+            self.assertNotEqual(response['ETag'], old['ETag'])
+        self.assertEqual(self.client.get('/api/summary/').json()['total_count'], 8)
+        self.assertEqual(len(self.client.get('/api/history/').json()), 2)
+
+    def test_gzip_clients_keep_strong_etags(self):
+        # Responses go out uncompressed, so nothing turns the ETag into a weak one
+        response = self.client.get('/api/summary/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertFalse(response['ETag'].startswith('W/'))
+        cached = self.client.get('/api/summary/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_errors_are_not_cached(self):
+        upload_id = UploadedFile.objects.get().id + 1
+        for value, status in ((upload_id, 404), ('abc', 400)):
+            response = self.client.get('/api/summary/', {'upload_id': value})
+            self.assertEqual(response.status_code, status)
+            # Nothing a client could revalidate into a 304 later
+            self.assertNotIn('ETag', response)
+        # Without its version bump, so a cached 404 would still be served
+        self.upload(make_csv(random_rows(self.rng, {'Valve': 3})))
+        self.assertEqual(self.client.get('/api/summary/', {'upload_id': upload_id}).status_code, 200)
+
+
+class ReportTests(UploadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(8)
+        self.first = self.upload(make_csv(random_rows(rng, {'Pump': 6})))
+        self.second = self.upload(make_csv(random_rows(rng, {'Valve': 4})))
+
+    def stored_reports(self):
+        return sorted(path.stem for path in reports_dir().glob('*.pdf'))
+
+    def test_build_current_reports(self):
+        build_current_reports(self.first)
+        all_key = report_key([self.first.id, self.second.id])
+        self.assertEqual(self.stored_reports(), sorted([all_key, f'upload-{self.first.id}']))
+
+        # Reports of a set of uploads that no longer exists are pruned
+        self.second.delete()
+        build_current_reports()
+        self.assertEqual(self.stored_reports(), sorted([report_key([self.first.id]), f'upload-{self.first.id}']))
+
+    def test_conditional_get(self):
+        response = self.client.get('/api/pdf/', {'upload_id': self.first.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        self.assertEqual(response['ETag'], f'"upload-{self.first.id}"')
+        self.assertTrue(report_path(f'upload-{self.first.id}').exists())
+
+        again = self.client.get('/api/pdf/', {'upload_id': self.first.id}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        again = self.client.get('/api/pdf/', {'upload_id': self.first.id},
+                                HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(again.status_code, 304)
+
+        other = self.client.get('/api/pdf/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(other.status_code, 200)
+
+    def test_unknown_upload(self):
+        for upload_id in ('999', 'abc'):
+            self.assertEqual(self.client.get('/api/pdf/', {'upload_id': upload_id}).status_code, 404)
+
+    def test_after_upload(self):
+        with override_settings(UPLOAD_RETENTION={'KEEP_LAST': 1}):
+            purged = after_upload(self.second)
+        self.assertEqual([upload.id for upload, _ in purged], [self.first.id])
+        self.assertEqual(self.stored_reports(), sorted([report_key([self.second.id]), f'upload-{self.second.id}']))
+
+
+class FullReportTests(UploadTestCase):
+
+    def test_page_count(self):
+        rng = np.random.default_rng(0)
+        # 45 rows fit on a type's first page and 48 on each page after it
+        upload = self.upload(make_csv(random_rows(rng, {'Pump': 120, 'Valve': 10, 'Reactor': 3})))
+
+        response = self.client.get('/api/pdf/', {'full': '1', 'upload_id': upload.id})
+        self.assertEqual(response.status_code, 200)
+        data = b''.join(response.streaming_content)
+
+        count, footers = read_pdf(data)
+        # Summary, Pump (3 pages), Valve, Reactor, Anomalies
+        self.assertEqual(count, 7)
+        self.assertEqual(footers, list(range(1, count + 1)))
+
+    def test_page_count_without_rows(self):
+        count, footers = read_pdf(b''.join(render_full_report([])))
+        self.assertEqual((count, footers), (1, [1]))
+
+    def test_streamed_in_pages(self):
+        upload = self.upload(make_csv(random_rows(np.random.default_rng(1), {'Pump': 200})))
+        parts = list(render_full_report([upload.id]))
+        self.assertGreater(len(parts), 4)
+        self.assertEqual(read_pdf(b''.join(parts))[0], 7)
+
+    def test_etag(self):
+        upload = self.upload(make_csv(random_rows(np.random.default_rng(2), {'Pump': 3})))
+        response = self.client.get('/api/pdf/', {'full': '1'})
+        self.assertEqual(response['ETag'], f'"{report_key([upload.id], full=True)}"')
+        again = self.client.get('/api/pdf/', {'full': '1'}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+
+class EquipmentListTests(UploadTestCase):
+
+    def walk(self, response):
+        rows, pages = [], 0
+        while True:
+            self.assertEqual(response.status_code, 200)
+            rows.extend(response.json()['results'])
+            pages += 1
+            if not response.json()['next']:
+                return rows, pages
+            response = self.client.get(response.json()['next'])
+
+    def test_pages_cover_every_row_once(self):
+        upload = self.upload(make_csv(random_rows(np.random.default_rng(0), {'Pump': 23, 'Valve': 2})))
+        rows, pages = self.walk(self.client.get(f'/api/uploads/{upload.id}/equipment/', {'page_size': 4}))
+
+        self.assertEqual(pages, 7)
+        expected = list(EquipmentData.objects.filter(upload=upload).order_by('id').values_list('id', flat=True))
+        self.assertEqual([row['id'] for row in rows], expected)
+
+    def test_stable_while_other_uploads_arrive(self):
+        upload = self.upload(make_csv(random_rows(np.random.default_rng(1), {'Pump': 10})))
+        url = f'/api/uploads/{upload.id}/equipment/'
+        first = self.client.get(url, {'page_size': 3})
+
+        # Rows of a later upload get higher ids and must not leak into the walk
+        self.upload(make_csv(random_rows(np.random.default_rng(2), {'Valve': 10})), name='other.csv')
+        rows = first.json()['results'] + self.walk(self.client.get(first.json()['next']))[0]
+
+        expected = list(EquipmentData.objects.filter(upload=upload).order_by('id').values_list('id', flat=True))
+        self.assertEqual([row['id'] for row in rows], expected)
+        self.assertEqual({row['equipment_type'] for row in rows}, {'Pump'})
+
+    def test_fields(self):
+        upload = self.upload(make_csv([['P1', 'Pump', 1, 2, 3]]))
+        url = f'/api/uploads/{upload.id}/equipment/'
+
+        response = self.client.get(url, {'fields': 'equipment_name,flowrate'})
+        self.assertEqual(response.json()['results'], [{'equipment_name': 'P1', 'flowrate': 1.0}])
+
+        # Paging still works without the cursor's id column in the rows
+        other = self.upload(make_csv([['P2', 'Pump', 4, 5, 6], ['P3', 'Pump', 7, 8, 9]]), name='more.csv')
+        rows, pages = self.walk(self.client.get(f'/api/uploads/{other.id}/equipment/',
+                                                {'fields': 'equipment_name', 'page_size': 1}))
+        self.assertEqual((rows, pages), ([{'equipment_name': 'P2'}, {'equipment_name': 'P3'}], 2))
+
+        response = self.client.get(url, {'fields': 'flowrate,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', response.json()['error'])
+
+    def test_unknown_upload(self):
+        self.assertEqual(self.client.get('/api/uploads/999/equipment/').status_code, 404)
+
+
+class HistogramTests(UploadTestCase):
+
+    def test_fixed_bins_match_numpy(self):
+        rows = random_rows(np.random.default_rng(0), {'Pump': 40, 'Valve': 25})
+        self.upload(make_csv(rows))
+
+        response = self.client.get('/api/histogram/', {'bins': 8, 'by_type': '1'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['total_count'], 65)
+
+        frame = pd.DataFrame(rows, columns=['name', 'equipment_type', *METRICS])
+        for metric in METRICS:
+            counts, edges = np.histogram(frame[metric], bins=8)
+            self.assertEqual(data['histograms'][metric]['counts'], counts.tolist())
+            np.testing.assert_allclose(data['histograms'][metric]['edges'], edges)
+            # Per-type bars share the overall edges and add up to them
+            by_type = [data['by_type'][name][metric] for name in ('Pump', 'Valve')]
+            self.assertTrue(all(h['edges'] == data['histograms'][metric]['edges'] for h in by_type))
+            self.assertEqual(np.sum([h['counts'] for h in by_type], axis=0).tolist(), counts.tolist())
+
+    def test_quantile_bins(self):
+        values = np.arange(100, dtype='float64')
+        edges = bin_edges(values, 4, 'quantile')
+        np.testing.assert_allclose(edges, [0, 24.75, 49.5, 74.25, 99])
+        self.assertEqual(histogram(values, edges)['counts'], [25, 25, 25, 25])
+
+        # Collapsed quantiles drop duplicate edges instead of making empty bins
+        skewed = np.r_[np.zeros(90), np.arange(1, 11)]
+        edges = bin_edges(skewed, 10, 'quantile')
+        self.assertTrue((np.diff(edges) > 0).all())
+        self.assertEqual(sum(histogram(skewed, edges)['counts']), 100)
+
+    def test_downsample_keeps_extremes(self):
+        values = np.random.default_rng(1).normal(size=10_000)
+        values[1234], values[8765] = 50, -50
+        series = downsample_minmax(values, 100)
+
+        self.assertEqual(len(series['index']), 100)
+        self.assertEqual(series['index'][0], 0)
+        self.assertEqual(max(series['max']), 50)
+        self.assertEqual(min(series['min']), -50)
+        for start, end, low, high in zip(series['index'], series['index'][1:] + [len(values)], series['min'], series['max']):
+            self.assertEqual((low, high), (values[start:end].min(), values[start:end].max()))
+
+    def test_short_series_and_non_finite(self):
+        series = downsample_minmax([1.0, np.nan, 3.0], 500)
+        self.assertEqual(series, {'index': [0, 1, 2], 'min': [1.0, None, 3.0], 'max': [1.0, None, 3.0]})
+        self.assertEqual(histogram([1.0, np.inf, 2.0], bin_edges([1.0, np.inf, 2.0], 2))['counts'], [1, 1])
+
+    def test_bad_params(self):
+        self.upload(make_csv([['P1', 'Pump', 1, 2, 3]]))
+        for params in ({'bins': 'x'}, {'bins': '0'}, {'points': '-1'}, {'binning': 'log'}):
+            self.assertEqual(self.client.get('/api/histogram/', params).status_code, 400, params)
+
+    def test_no_data(self):
+        self.assertEqual(self.client.get('/api/histogram/').status_code, 404)
+
+    def test_upload_id(self):
+        upload = self.upload(make_csv([['P1', 'Pump', 1, 2, 3]]))
+        self.assertEqual(self.client.get('/api/histogram/', {'upload_id': upload.id}).status_code, 200)
+        for upload_id in ('abc', '-1'):
+            self.assertEqual(self.client.get('/api/histogram/', {'upload_id': upload_id}).status_code, 400)
+        self.assertEqual(self.client.get('/api/histogram/', {'upload_id': upload.id + 1}).status_code, 404)
+
+
+class TDigestTests(TestCase):
+    QUANTILES = [0.001, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 0.999]
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.values = np.concatenate([rng.lognormal(size=150000), rng.normal(50, 5, size=50000)])
+        self.sorted = np.sort(self.values)
+
+    def assertRankError(self, digest, tolerance=0.005):
+        for q in self.QUANTILES:
+            rank = np.searchsorted(self.sorted, digest.quantile(q)) / len(self.sorted)
+            self.assertLess(abs(rank - q), tolerance, f'q={q}')
+
+    def digests(self, parts):
+        digests = []
+        for values in np.array_split(self.values, parts):
+            digest = TDigest()
+            digest.update(values)
+            digests.append(digest)
+        return digests
+
+    def test_rank_error(self):
+        digest = TDigest()
+        digest.update(self.values)
+        self.assertEqual(digest.count, len(self.values))
+        self.assertRankError(digest)
+
+    def test_rank_error_merged(self):
+        digest, *others = self.digests(8)
+        for other in others:
+            digest.merge(other)
+        self.assertEqual(digest.count, len(self.values))
+        self.assertRankError(digest)
+
+    def test_rank_error_round_trip(self):
+        # Sketches are stored in a JSONField and merged after loading
+        digests = [TDigest.from_dict(json.loads(json.dumps(digest.to_dict()))) for digest in self.digests(4)]
+        digest = TDigest()
+        for other in digests:
+            digest.merge(other)
+        self.assertEqual(digest.count, len(self.values))
+        self.assertRankError(digest)
+
+        restored = TDigest.from_dict(json.loads(json.dumps(digest.to_dict())))
+        self.assertEqual(restored.percentiles(), digest.percentiles())
+
+    def test_empty(self):
+        digest = TDigest.from_dict(TDigest().to_dict())
+        self.assertIsNone(digest.quantile(0.5))
+        self.assertEqual(digest.count, 0)
+
+
+class PercentileTests(UploadTestCase):
+
+    @override_settings(INGEST_CHUNK_SIZE=50)
+    def test_summary_percentiles(self):
+        rng = np.random.default_rng(3)
+        first = random_rows(rng, {'Pump': 300, 'Valve': 120})
+        second = random_rows(rng, {'Reactor': 250})
+        for content, name in ((first, 'a.csv'), (second, 'b.csv')):
+            self.upload(make_csv(content), name)
+
+        percentiles = self.client.get('/api/summary/').json()['percentiles']
+        frame = pd.DataFrame(first + second, columns=['name', 'equipment_type', *METRICS])
+        for metric in METRICS:
+            values = np.sort(frame[metric].to_numpy())
+            self.assertEqual(set(percentiles[metric]), {'p50', 'p90', 'p99'})
+            for key, value in percentiles[metric].items():
+                # Small inputs stay as exact centroids, so the rank is close to exact
+                rank = np.searchsorted(values, value) / len(values)
+                self.assertLess(abs(rank - int(key[1:]) / 100), 0.01, f'{metric} {key}')
+
+
+class CompareTests(UploadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.a = self.upload(make_csv([
+            ['P1', 'Pump', 100, 5, 80],
+            ['P2', 'Pump', 120, 6, 82],
+            ['V1', 'Valve', 50, 2, 60],
+            ['R1', 'Reactor', 10, 20, 300],
+        ]), 'a.csv')
+        self.b = self.upload(make_csv([
+            ['P1', 'Pump', 110, 5, 80],
+            ['P2', 'Pump', 60, 6, 82],
+            ['V1', 'Mixer', 50, 2, 60],
+            ['M1', 'Mixer', 30, 1, 40],
+        ]), 'b.csv')
+
+    def compare(self, **params):
+        response = self.client.get('/api/compare/', {'a': self.a.id, 'b': self.b.id, **params})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_counts_and_units(self):
+        data = self.compare()
+        self.assertEqual(data['counts'], {'a': 4, 'b': 4, 'common': 3, 'added': 1, 'removed': 1, 'type_changed': 1})
+        self.assertEqual(data['added'], [{'equipment_name': 'M1', 'equipment_type': 'Mixer'}])
+        self.assertEqual(data['removed'], [{'equipment_name': 'R1', 'equipment_type': 'Reactor'}])
+
+    def test_metric_deltas(self):
+        flowrate = self.compare()['metrics']['flowrate']
+        self.assertEqual(flowrate['changed'], 2)
+        self.assertAlmostEqual(flowrate['mean_delta'], (10 - 60 + 0) / 3)
+        self.assertAlmostEqual(flowrate['mean_abs_delta'], 70 / 3)
+        self.assertEqual(flowrate['max_increase'], {'equipment_name': 'P1', 'delta': 10.0})
+        self.assertEqual(flowrate['max_decrease'], {'equipment_name': 'P2', 'delta': -60.0})
+        self.assertEqual(self.compare()['metrics']['pressure']['changed'], 0)
+        self.assertIsNone(self.compare()['metrics']['pressure']['max_increase'])
+
+    def test_changes_by_relative_size(self):
+        changes = self.compare()['changes']
+        # P2 dropped by half, P1 rose by a tenth, V1 only changed type
+        self.assertEqual([row['equipment_name'] for row in changes], ['P2', 'P1'])
+        self.assertEqual((changes[0]['flowrate_a'], changes[0]['flowrate_b'], changes[0]['flowrate_delta']),
+                         (120.0, 60.0, -60.0))
+        self.assertEqual(len(self.compare(limit=1)['changes']), 1)
+
+    def test_type_drift_matches_pandas(self):
+        drift = self.compare()['type_drift']
+        frame_a = load_frame([self.a.id])
+        frame_b = load_frame([self.b.id])
+        self.assertEqual(set(drift), set(frame_a['equipment_type']) | set(frame_b['equipment_type']))
+        for equipment_type, item in drift.items():
+            a = frame_a[frame_a['equipment_type'] == equipment_type]
+            b = frame_b[frame_b['equipment_type'] == equipment_type]
+            self.assertEqual((item['count_a'], item['count_b']), (len(a), len(b)))
+            for metric in METRICS:
+                if len(a) and len(b):
+                    self.assertAlmostEqual(item[f'avg_{metric}_delta'], b[metric].mean() - a[metric].mean())
+                else:
+                    self.assertIsNone(item[f'avg_{metric}_delta'])
+
+    def test_bad_params(self):
+        self.assertEqual(self.client.get('/api/compare/', {'a': self.a.id}).status_code, 400)
+        self.assertEqual(self.client.get('/api/compare/', {'a': self.a.id, 'b': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/compare/', {'a': self.a.id, 'b': 999}).status_code, 404)
+        self.assertEqual(self.client.get('/api/compare/', {'a': self.a.id, 'b': self.b.id, 'limit': '-1'}).status_code, 400)
+
+
+class TrendTests(UploadTestCase):
+    header = ','.join(COLUMNS + ['Timestamp']) + '\n'
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(4)
+        start = pd.Timestamp('2024-03-01T00:00:00Z')
+        self.frames = []
+        for name, offset in (('a.csv', 0), ('b.csv', 90)):
+            rows = random_rows(rng, {'Pump': 120, 'Valve': 60})
+            times = start + pd.to_timedelta(rng.integers(offset, offset + 300, size=len(rows)), unit='min')
+            self.upload(make_csv([(*row, time.strftime('%Y-%m-%d %H:%M:%S')) for row, time in zip(rows, times)],
+                                 header=self.header), name)
+            self.frames.append(pd.DataFrame(
+                {'equipment_type': [row[1] for row in rows], 'recorded_at': times,
+                 **{metric: [row[i] for row in rows] for i, metric in enumerate(METRICS, 2)}}))
+        self.frame = pd.concat(self.frames)
+
+    def expected(self, frame, freq, window):
+        grouped = frame.groupby(frame['recorded_at'].dt.floor(freq))
+        counts = grouped.size()
+        sums = grouped[METRICS].sum()
+        span = pd.Timedelta(window, unit=freq)
+        rolling = sums.rolling(span).sum().div(counts.rolling(span).sum(), axis=0)
+        return counts, sums.div(counts, axis=0), rolling
+
+    def assertSeries(self, series, frame, freq, window):
+        counts, averages, rolling = self.expected(frame, freq, window)
+        self.assertEqual([item['bucket'] for item in series], [value.isoformat() for value in counts.index])
+        self.assertEqual([item['count'] for item in series], counts.tolist())
+        for metric in METRICS:
+            np.testing.assert_allclose([item[f'avg_{metric}'] for item in series], averages[metric])
+            np.testing.assert_allclose([item[f'rolling_{metric}'] for item in series], rolling[metric])
+
+    def test_recorded_at_parsed(self):
+        stored = EquipmentData.objects.order_by('id').values_list('recorded_at', flat=True)
+        self.assertEqual(
+            [pd.Timestamp(value) for value in stored],
+            self.frames[0]['recorded_at'].tolist() + self.frames[1]['recorded_at'].tolist(),
+        )
+
+    def test_timestamp_columns(self):
+        for header in ('Timestamp', 'datetime', 'Recorded At', 'recorded_at', ' DATE '):
+            self.assertEqual(map_columns([header]), {header: 'Timestamp'})
+        for header in ('Runtime', 'Update Count', 'Last Maintenance Date', 'Time Zone'):
+            self.assertEqual(map_columns([header]), {})
+        # The first timestamp column wins
+        self.assertEqual(map_columns(['Date', 'Timestamp']), {'Date': 'Timestamp'})
+
+    def test_numeric_timestamps_not_parsed(self):
+        rows = random_rows(np.random.default_rng(9), {'Pump': 6})
+        header = ','.join(COLUMNS + ['Date', 'Runtime']) + '\n'
+        upload = self.upload(make_csv([(*row, 20240301 + i, 1.5 * i) for i, row in enumerate(rows)], header))
+
+        # Neither becomes a 1970 epoch offset
+        stored = EquipmentData.objects.filter(upload=upload).values_list('recorded_at', flat=True)
+        self.assertEqual(list(stored), [None] * 6)
+
+    def test_hourly_rolling(self):
+        response = self.client.get('/api/trends/', {'bucket': 'hour', 'window': 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertSeries(response.json()['series'], self.frame, 'h', 3)
+
+    def test_database_fallback_matches_snapshots(self):
+        expected = self.client.get('/api/trends/', {'bucket': 'hour', 'window': 2}).json()
+        for upload in UploadedFile.objects.all():
+            snapshot_path(upload.id).unlink()
+        caches[CACHE_ALIAS].clear()
+        series = self.client.get('/api/trends/', {'bucket': 'hour', 'window': 2}).json()['series']
+        self.assertEqual([item['bucket'] for item in series], [item['bucket'] for item in expected['series']])
+        for item, other in zip(series, expected['series']):
+            self.assertEqual(item['count'], other['count'])
+            for metric in METRICS:
+                self.assertAlmostEqual(item[f'rolling_{metric}'], other[f'rolling_{metric}'])
+
+    def test_filters(self):
+        upload = UploadedFile.objects.order_by('id').first()
+        params = {'bucket': 'minute', 'window': 30, 'upload_id': upload.id, 'equipment_type': 'Valve',
+                  'start': '2024-03-01T01:00:00', 'end': '2024-03-01T03:00:00+00:00'}
+        series = self.client.get('/api/trends/', params).json()['series']
+        frame = self.frames[0]
+        frame = frame[(frame['equipment_type'] == 'Valve')
+                      & (frame['recorded_at'] >= '2024-03-01T01:00:00Z')
+                      & (frame['recorded_at'] < '2024-03-01T03:00:00Z')]
+        self.assertSeries(series, frame, 'min', 30)
+
+    def test_unparseable_and_missing_timestamps(self):
+        UploadedFile.objects.all().delete()
+        self.upload(make_csv([['P1', 'Pump', 1, 2, 3, 'not a time'], ['P2', 'Pump', 1, 2, 3, '2024-01-01 10:30']],
+                             header=self.header), 'c.csv')
+        self.upload(make_csv([['P3', 'Pump', 1, 2, 3]]), 'd.csv')
+        self.assertEqual(
+            list(EquipmentData.objects.order_by('id').values_list('recorded_at', flat=True)),
+            [None, pd.Timestamp('2024-01-01T10:30Z').to_pydatetime(), None],
+        )
+        series = self.client.get('/api/trends/', {'bucket': 'day'}).json()['series']
+        self.assertEqual([(item['bucket'], item['count']) for item in series], [('2024-01-01T00:00:00+00:00', 1)])
+
+    def test_bad_params(self):
+        for params in ({'bucket': 'week'}, {'window': '0'}, {'window': 'x'}, {'start': 'yesterday'}):
+            self.assertEqual(self.client.get('/api/trends/', params).status_code, 400, params)
+        response = self.client.get('/api/trends/', {'bucket': 'minute', 'start': '2000-01-01'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_upload_id(self):
+        upload = UploadedFile.objects.order_by('id').first()
+        self.assertEqual(self.client.get('/api/trends/', {'upload_id': upload.id}).status_code, 200)
+        for upload_id in ('abc', '-1'):
+            self.assertEqual(self.client.get('/api/trends/', {'upload_id': upload_id}).status_code, 400)
+        self.assertEqual(self.client.get('/api/trends/', {'upload_id': 999}).status_code, 404)
+
+
+class AnomalyTests(UploadTestCase):
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(2)
+        rows = random_rows(rng, {'Pump': 300, 'Valve': 200, 'Reactor': 3})
+        # Outliers in one metric each, and extreme rows in a type too small to score
+        rows += [
+            ('Pump-hot', 'Pump', 100, 5, 200), ('Pump-fast', 'Pump', 400, 5, 80),
+            ('Valve-low', 'Valve', 100, 0.1, 80), ('Reactor-x', 'Reactor', 9999, 99, 999),
+        ]
+        self.frame = pd.DataFrame(rows, columns=['equipment_name', 'equipment_type', *METRICS])
+        self.scored = self.upload(make_csv(rows))
+
+    def expected_flags(self, options=None):
+        """Flags of every row for the bounds the upload's ``TypeStats`` give."""
+        bounds = type_bounds(collect_type_stats(self.scored), options)
+        flags = pd.Series(0, index=self.frame.index)
+        for (metric, method), bit in FLAGS.items():
+            low, high = bounds[method]
+            lower = self.frame['equipment_type'].map(low[metric])
+            upper = self.frame['equipment_type'].map(high[metric])
+            flags[(self.frame[metric] < lower) | (self.frame[metric] > upper)] |= bit
+        return dict(zip(self.frame['equipment_name'], flags))
+
+    def stored_flags(self):
+        return dict(EquipmentData.objects.filter(upload=self.scored).values_list('equipment_name', 'anomaly_flags'))
+
+    def test_bounds_match_pandas(self):
+        stats = collect_type_stats(self.scored)
+        bounds = type_bounds(stats)
+        self.assertEqual(list(bounds['zscore'][0].index), ['Pump', 'Valve'])
+
+        groups = self.frame.groupby('equipment_type')[METRICS]
+        pd.testing.assert_frame_equal(stats.means, groups.mean(), check_names=False, check_like=True)
+        pd.testing.assert_frame_equal(stats.stds(), groups.std(), check_names=False, check_like=True)
+        low, high = bounds['zscore']
+        pd.testing.assert_frame_equal(low, (groups.mean() - 3 * groups.std()).loc[['Pump', 'Valve']],
+                                      check_names=False)
+        # Quartiles come from the per-type t-digests; close to the exact ones
+        for q in (0.25, 0.75):
+            np.testing.assert_allclose(stats.quantiles(q).loc[['Pump', 'Valve']],
+                                       groups.quantile(q).loc[['Pump', 'Valve']], rtol=0.01)
+
+    def test_flags_match_bounds(self):
+        stored = self.stored_flags()
+        self.assertEqual(stored, self.expected_flags())
+        self.assertEqual(stored['Pump-hot'] & FLAGS[('temperature', 'zscore')], FLAGS[('temperature', 'zscore')])
+        self.assertTrue(stored['Pump-fast'] and stored['Valve-low'])
+        self.assertEqual(stored['Reactor-x'], 0)
+
+    def test_backfill_migration(self):
+        # Rows stored before 0014 have no flags; 0016 scores them with exact quartiles
+        backfill = import_module('analytics.migrations.0016_backfill_anomaly_flags').backfill_anomaly_flags
+        EquipmentData.objects.update(anomaly_flags=0)
+        backfill(apps, None)
+
+        groups = self.frame.groupby('equipment_type')[METRICS]
+        q1, q3 = groups.quantile(0.25), groups.quantile(0.75)
+        bounds = {
+            'zscore': (groups.mean() - 3 * groups.std(), groups.mean() + 3 * groups.std()),
+            'iqr': (q1 - 1.5 * (q3 - q1), q3 + 1.5 * (q3 - q1)),
+        }
+        expected = pd.Series(0, index=self.frame.index)
+        scored = self.frame['equipment_type'].isin(['Pump', 'Valve'])
+        for (metric, method), bit in FLAGS.items():
+            low, high = (bound[metric] for bound in bounds[method])
+            value = self.frame[metric]
+            outlier = (value < self.frame['equipment_type'].map(low)) | (value > self.frame['equipment_type'].map(high))
+            expected[outlier & scored] |= bit
+        self.assertEqual(self.stored_flags(), dict(zip(self.frame['equipment_name'], expected)))
+        self.assertTrue(self.stored_flags()['Pump-hot'])
+        self.scored.refresh_from_db()
+        self.assertEqual(self.scored.flags_version, 1)
+
+        # Uploads that already carry flags are left alone
+        EquipmentData.objects.filter(equipment_name='Pump-0').update(anomaly_flags=FLAGS[('pressure', 'iqr')])
+        backfill(apps, None)
+        self.assertEqual(self.stored_flags()['Pump-0'], FLAGS[('pressure', 'iqr')])
+
+    def test_flags_from_ingest(self):
+        # Bounds gathered chunk by chunk at ingest agree with a rescore
+        rng = np.random.default_rng(3)
+        rows = random_rows(rng, {'Pump': 500, 'Valve': 40}) + [('Pump-hot', 'Pump', 100, 5, 200)]
+        with override_settings(INGEST_CHUNK_SIZE=64):
+            upload = self.upload(make_csv(rows), 'chunked.csv')
+        at_ingest = dict(EquipmentData.objects.filter(upload=upload).values_list('id', 'anomaly_flags'))
+
+        flag_anomalies(upload)
+        rescored = dict(EquipmentData.objects.filter(upload=upload).values_list('id', 'anomaly_flags'))
+        self.assertEqual(at_ingest, rescored)
+        self.assertTrue(EquipmentData.objects.get(upload=upload, equipment_name='Pump-hot').anomaly_flags)
+
+    def test_endpoint(self):
+        response = self.client.get('/api/anomalies/', {'metric': 'temperature', 'method': 'zscore', 'page_size': 1000})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        bit = FLAGS[('temperature', 'zscore')]
+        self.assertEqual({row['equipment_name'] for row in results},
+                         {name for name, flags in self.expected_flags().items() if flags & bit})
+        hot = next(row for row in results if row['equipment_name'] == 'Pump-hot')
+        self.assertEqual(hot['anomalies'], describe_flags(hot['anomaly_flags']))
+        self.assertIn('temperature:zscore', hot['anomalies'])
+
+        response = self.client.get('/api/anomalies/', {'equipment_type': 'Valve', 'page_size': 1000})
+        self.assertEqual({row['equipment_type'] for row in response.json()['results']}, {'Valve'})
+        self.assertEqual(self.client.get('/api/anomalies/', {'metric': 'speed'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/anomalies/', {'method': 'mad'}).status_code, 400)
+
+    def test_upload_id(self):
+        response = self.client.get('/api/anomalies/', {'upload_id': self.scored.id})
+        self.assertEqual(response.status_code, 200)
+        for upload_id in ('abc', '-1'):
+            self.assertEqual(self.client.get('/api/anomalies/', {'upload_id': upload_id}).status_code, 400)
+        self.assertEqual(self.client.get('/api/anomalies/', {'upload_id': self.scored.id + 1}).status_code, 404)
+
+    def test_flag_anomalies_command(self):
+        options = {'Z_THRESHOLD': 2.0, 'IQR_FACTOR': 1.0, 'MIN_GROUP_SIZE': 8}
+        with override_settings(ANOMALY_DETECTION=options):
+            call_command('flag_anomalies', stdout=io.StringIO())
+        self.assertEqual(self.stored_flags(), self.expected_flags(options))
+
+    def test_rescoring_changes_report_etag(self):
+        params = {'upload_id': self.scored.id}
+        before = self.client.get('/api/pdf/', params)
+        self.assertEqual(before.status_code, 200)
+        old_path = report_path(report_key([self.scored.id], self.scored.id))
+        self.assertTrue(old_path.exists())
+
+        with override_settings(ANOMALY_DETECTION={'Z_THRESHOLD': 2.0}):
+            call_command('flag_anomalies', stdout=io.StringIO())
+        after = self.client.get('/api/pdf/', params, HTTP_IF_NONE_MATCH=before['ETag'])
+        self.assertEqual(after.status_code, 200)
+        self.assertNotEqual(after['ETag'], before['ETag'])
+        # The report rendered with the old flags is gone
+        self.assertFalse(old_path.exists())
+
+    def test_full_report_lists_flagged_units(self):
+        response = self.client.get('/api/pdf/', {'full': '1', 'upload_id': self.scored.id})
+        count, footers = read_pdf(b''.join(response.streaming_content))
+        # Summary, Pump (7 pages), Valve (5), Reactor, Anomalies
+        self.assertEqual(count, 15)
+        self.assertEqual(footers, list(range(1, 16)))
+
+
+class BenchEndpointsTests(UploadTestCase):
+
+    def test_generated_files_ingest(self):
+        workdir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, workdir, ignore_errors=True)
+        # One file per header spelling, each read back through the real upload path
+        for seed in range(len(HEADERS)):
+            path = write_csv(workdir / f'{seed}.csv', 300, seed=seed, missing=0.1)
+            expected = make_readings(300, seed=seed * 300, missing=0.1)
+            with override_settings(INGEST_CHUNK_SIZE=64):
+                upload = self.upload(path.read_bytes(), f'{seed}.csv')
+
+            stored = pd.DataFrame.from_records(
+                EquipmentData.objects.filter(upload=upload).order_by('id').values(*METRICS, 'recorded_at')
+            )
+            self.assertEqual(len(stored), 300)
+            for metric in METRICS:
+                # Blank cells are stored as 0
+                np.testing.assert_allclose(stored[metric], expected[metric].replace('', 0).astype(float))
+            self.assertEqual(stored['recorded_at'].isna().sum(), (expected['timestamp'] == '').sum())
+
+    def test_compare(self):
+        command = BenchEndpoints()
+        options = {'tolerance': 0.25, 'min_seconds': 0.05}
+        baseline = {'1000': {
+            'upload': {'seconds': 1.0, 'queries': 10, 'peak_mb': 20.0},
+            'summary': {'seconds': 0.01, 'queries': 2, 'peak_mb': 1.0},
+        }}
+        same = {'1000': {
+            'upload': {'seconds': 1.2, 'queries': 10, 'peak_mb': 24.0},
+            # Three times slower, but by less than min_seconds
+            'summary': {'seconds': 0.03, 'queries': 2, 'peak_mb': 1.0},
+            'pdf': {'seconds': 9.0, 'queries': 99},
+        }}
+        self.assertEqual(command.compare(same, baseline, options), [])
+
+        worse = {'1000': {
+            'upload': {'seconds': 1.3, 'queries': 11, 'peak_mb': 26.0},
+            'summary': {'seconds': 0.01, 'queries': 2},
+        }}
+        self.assertEqual(command.compare(worse, baseline, options), [
+            '1000 rows upload: 10 -> 11 queries',
+            '1000 rows upload: 1.000s -> 1.300s',
+            '1000 rows upload: 20.0 -> 26.0 MiB peak',
+        ])
+
+
+class MetricsTests(UploadTestCase):
+
+    def sample(self, text, line):
+        match = re.search(rf'^{re.escape(line)} (\S+)$', text, re.M)
+        return float(match.group(1)) if match else 0.0
+
+    def test_registry_render(self):
+        metrics = Registry(buckets=(0.1, 1))
+        metrics.inc('analytics_requests_total', endpoint='summary', method='GET', status=200)
+        metrics.inc('analytics_requests_total', 2, endpoint='summary', method='GET', status=200)
+        metrics.inc('analytics_rows_total', 5, operation='a "quoted"\nname')
+        for value in (0.05, 0.5, 0.7, 3):
+            metrics.observe('analytics_stage_duration_seconds', value, operation='upload', stage='insert')
+        text = metrics.render()
+
+        self.assertIn('# TYPE analytics_requests_total counter', text)
+        self.assertIn('analytics_requests_total{endpoint="summary",method="GET",status="200"} 3', text)
+        self.assertIn('analytics_rows_total{operation="a \\"quoted\\"\\nname"} 5', text)
+        labels = 'operation="upload",stage="insert"'
+        self.assertIn(f'analytics_stage_duration_seconds_bucket{{{labels},le="0.1"}} 1', text)
+        self.assertIn(f'analytics_stage_duration_seconds_bucket{{{labels},le="1"}} 3', text)
+        self.assertIn(f'analytics_stage_duration_seconds_bucket{{{labels},le="+Inf"}} 4', text)
+        self.assertIn(f'analytics_stage_duration_seconds_sum{{{labels}}} 4.25', text)
+        self.assertIn(f'analytics_stage_duration_seconds_count{{{labels}}} 4', text)
+
+    def test_timings(self):
+        timings = Timings('test', rows=1)
+        for _ in range(2):
+            with timings.stage('count'):
+                UploadedFile.objects.count()
+        timings.add(rows=2, bytes_read=10)
+        with self.assertLogs('analytics.metrics') as logs:
+            record = timings.finish(status='done')
+
+        self.assertEqual(record['stages']['count']['calls'], 2)
+        self.assertEqual(record['stages']['count']['queries'], 2)
+        self.assertEqual((record['rows'], record['bytes_read'], record['status']), (3, 10, 'done'))
+        self.assertEqual(json.loads(logs.records[0].getMessage()), record)
+
+    def test_upload_stages_logged(self):
+        content = make_csv(random_rows(np.random.default_rng(0), {'Pump': 20}))
+        with self.assertLogs('analytics.metrics') as logs, override_settings(INGEST_CHUNK_SIZE=8):
+            self.upload(content)
+        records = [json.loads(record.getMessage()) for record in logs.records]
+        upload = next(record for record in records if record['event'] == 'upload')
+
+        self.assertEqual((upload['status'], upload['rows']), (UploadedFile.STATUS_DONE, 20))
+        # Read once to hash it and once to parse it
+        self.assertEqual(upload['bytes_read'], 2 * len(content))
+        self.assertTrue({'hash', 'dedupe', 'store', 'parse', 'normalize', 'insert', 'save'} <= set(upload['stages']))
+        self.assertEqual(upload['stages']['insert']['calls'], 3)
+        request = next(record for record in records if record['event'] == 'request')
+        self.assertEqual((request['endpoint'], request['method'], request['status']), ('upload', 'POST', 200))
+
+    def test_metrics_endpoint(self):
+        line = 'analytics_requests_total{endpoint="summary",method="GET",status="404"}'
+        before = self.sample(self.client.get('/api/metrics/').content.decode(), line)
+        with self.assertLogs('analytics.metrics'):
+            self.client.get('/api/summary/')
+            self.client.get('/api/no-such-path/')
+
+        response = self.client.get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertEqual(self.sample(text, line), before + 1)
+        self.assertIn('analytics_requests_total{endpoint="unmatched",method="GET",status="404"}', text)
+        self.assertIn('analytics_request_duration_seconds_count{endpoint="summary",method="GET"}', text)
+
+
+class LegacyUploadTests(UploadTestCase):
+    """Uploads from before results were stored: done, but with ``result`` NULL."""
+
+    def setUp(self):
+        super().setUp()
+        rng = np.random.default_rng(4)
+        self.content = make_csv(random_rows(rng, {'Pump': 20, 'Valve': 10}))
+        self.legacy = self.upload(self.content)
+        self.expected = self.legacy.result
+        UploadedFile.objects.filter(pk=self.legacy.pk).update(result=None)
+
+    def assertResult(self, data):
+        self.assertEqual(data['data'], self.expected['data'])
+        summary, expected = data['summary'], self.expected['summary']
+        self.assertEqual(summary.keys(), expected.keys())
+        self.assertEqual(summary['total_count'], 30)
+        self.assertEqual(summary['type_distribution'], expected['type_distribution'])
+        for metric in METRICS:
+            self.assertAlmostEqual(summary[f'avg_{metric}'], expected[f'avg_{metric}'])
+
+    def test_result(self):
+        response = self.client.get(f'/api/upload/{self.legacy.id}/result/')
+        self.assertEqual(response.status_code, 200)
+        self.assertResult(response.json())
+        # Rebuilt once and stored
+        self.legacy.refresh_from_db()
+        self.assertIsNotNone(self.legacy.result)
+
+    def test_result_without_summary(self):
+        UploadSummary.objects.filter(upload=self.legacy).delete()
+        response = self.client.get(f'/api/upload/{self.legacy.id}/result/')
+        self.assertEqual(response.status_code, 200)
+        self.assertResult(response.json())
+
+    def post_again(self):
+        return self.post(self.content, name='again.csv')
+
+    def test_duplicate(self):
+        response = self.post_again()
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['duplicate_of'], self.legacy.id)
+        self.assertResult(data)
+        self.assertEqual(UploadedFile.objects.count(), 1)
+
+    def test_duplicate_without_summary(self):
+        # Nothing to rebuild the result from cheaply: the file is ingested again
+        UploadSummary.objects.filter(upload=self.legacy).delete()
+        response = self.post_again()
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertNotIn('duplicate_of', data)
+        self.assertResult(data)
+        self.assertEqual(UploadedFile.objects.count(), 2)
+
+
+class AfterUploadQueueTests(TestCase):
+
+    def setUp(self):
+        self.addCleanup(jobs._failed.clear)
+
+    def schedule(self, *uploads):
+        for upload in uploads:
+            with self.captureOnCommitCallbacks(execute=True):
+                schedule_after_upload(upload)
+
+    def test_passes_requested_mid_pass_are_queued(self):
+        release, calls = threading.Event(), []
+
+        def fake_after_upload(upload):
+            calls.append(upload)
+            release.wait(5)
+            if upload == 'b':
+                raise RuntimeError('report failed')
+
+        with mock.patch('analytics.jobs.after_upload', fake_after_upload), \
+                self.assertLogs('analytics.jobs', 'ERROR') as logs:
+            for upload in ('a', 'b', 'c'):
+                with self.captureOnCommitCallbacks(execute=True):
+                    schedule_after_upload(upload)
+            release.set()
+            wait_for_after_upload()
+
+        # One thread ran every pass in order, past the failing one
+        self.assertEqual(calls, ['a', 'b', 'c'])
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(jobs._failed, ['b'])
+
+    def test_locked_database_is_retried(self):
+        calls = []
+
+        def fake_after_upload(upload):
+            calls.append(upload)
+            if len(calls) < 3:
+                raise OperationalError('database is locked')
+
+        with mock.patch('analytics.jobs.after_upload', fake_after_upload), \
+                mock.patch('analytics.locking.time.sleep'):
+            self.schedule('a')
+            wait_for_after_upload()
+
+        self.assertEqual(calls, ['a', 'a', 'a'])
+        self.assertEqual(jobs._failed, [])
+
+    def test_failed_pass_runs_again_with_the_next(self):
+        calls, fail = [], {'a'}
+
+        def fake_after_upload(upload):
+            calls.append(upload)
+            if upload in fail:
+                raise OperationalError('disk I/O error')
+
+        with mock.patch('analytics.jobs.after_upload', fake_after_upload), \
+                self.assertLogs('analytics.jobs', 'ERROR'):
+            self.schedule('a')
+            wait_for_after_upload()
+            fail.clear()
+            self.schedule('b')
+            wait_for_after_upload()
+
+        # Not a lock error, so no retries; the failed pass is not dropped
+        self.assertEqual(calls, ['a', 'a', 'b'])
+        self.assertEqual(jobs._failed, [])
+
+
+class RetryLockedTests(TestCase):
+
+    def test_retries_only_lock_errors(self):
+        attempts = []
+
+        def locked_twice():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise OperationalError('database is locked')
+            return 'done'
+
+        with mock.patch('analytics.locking.time.sleep') as sleep:
+            self.assertEqual(retry_locked(locked_twice, delays=(1, 2, 4)), 'done')
+        self.assertEqual([c.args[0] for c in sleep.call_args_list], [1, 2])
+
+        def broken():
+            raise OperationalError('no such table: x')
+
+        with mock.patch('analytics.locking.time.sleep') as sleep, self.assertRaises(OperationalError):
+            retry_locked(broken, delays=(1, 2))
+        sleep.assert_not_called()
+
+    def test_gives_up_after_the_last_delay(self):
+        def locked():
+            raise OperationalError('database is locked')
+
+        with mock.patch('analytics.locking.time.sleep') as sleep, self.assertRaises(OperationalError):
+            retry_locked(locked, delays=(1, 2))
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_after_upload_waits_for_ingest(self):
+        events = []
+        ingesting, purged = threading.Event(), threading.Event()
+
+        def ingest():
+            with write_lock:
+                ingesting.set()
+                purged.wait(0.2)
+                events.append('ingest done')
+
+        def fake_retention():
+            events.append('retention')
+            purged.set()
+            return []
+
+        with mock.patch('analytics.jobs.apply_retention', fake_retention), \
+                mock.patch('analytics.jobs.build_current_reports'):
+            thread = threading.Thread(target=ingest)
+            thread.start()
+            ingesting.wait(5)
+            after_upload()
+            thread.join()
+
+        self.assertEqual(events, ['ingest done', 'retention'])
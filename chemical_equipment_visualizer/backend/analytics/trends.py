@@ -0,0 +1,95 @@
+import pandas as pd
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay, TruncHour, TruncMinute
+
+from .models import EquipmentData
+from .snapshots import load_table
+from .summaries import METRICS
+
+BUCKETS = {
+    'minute': (TruncMinute, 'min'),
+    'hour': (TruncHour, 'h'),
+    'day': (TruncDay, 'D'),
+}
+MAX_BUCKETS = 5000
+PARTIAL_COLUMNS = ['count'] + [f'{metric}_sum' for metric in METRICS]
+
+
+def snapshot_buckets(upload_id, bucket, filters):
+    """Per-bucket counts and sums for one upload, from its Arrow snapshot.
+
+    Only the timestamp, metric and filter columns are read from the
+    memory-mapped file. Returns ``None`` when the upload has no snapshot.
+    """
+    columns = ['recorded_at'] + METRICS + [name for name in ('equipment_name', 'equipment_type') if name in filters]
+    table = load_table(upload_id, columns)
+    if table is None:
+        return None
+    frame = table.to_pandas()
+    frame = frame[frame['recorded_at'].notna()]
+    for name in ('equipment_name', 'equipment_type'):
+        if name in filters:
+            frame = frame[frame[name] == filters[name]]
+    if 'start' in filters:
+        frame = frame[frame['recorded_at'] >= filters['start']]
+    if 'end' in filters:
+        frame = frame[frame['recorded_at'] < filters['end']]
+
+    aggregations = {'count': ('recorded_at', 'size')}
+    aggregations.update({f'{metric}_sum': (metric, 'sum') for metric in METRICS})
+    return frame.groupby(frame['recorded_at'].dt.floor(BUCKETS[bucket][1])).agg(**aggregations)
+
+
+def database_buckets(upload_id, bucket, filters):
+    """The same partials grouped in the database, for uploads without a snapshot.
+
+    The filters hit the composite ``recorded_at`` indexes, and only one row
+    per bucket comes back.
+    """
+    queryset = EquipmentData.objects.filter(upload_id=upload_id, recorded_at__isnull=False)
+    for name in ('equipment_name', 'equipment_type'):
+        if name in filters:
+            queryset = queryset.filter(**{name: filters[name]})
+    if 'start' in filters:
+        queryset = queryset.filter(recorded_at__gte=filters['start'])
+    if 'end' in filters:
+        queryset = queryset.filter(recorded_at__lt=filters['end'])
+
+    aggregates = {'count': Count('id')}
+    aggregates.update({f'{metric}_sum': Sum(metric) for metric in METRICS})
+    rows = (
+        queryset.annotate(bucket=BUCKETS[bucket][0]('recorded_at'))
+        .order_by().values('bucket').annotate(**aggregates)
+    )
+    frame = pd.DataFrame.from_records(rows, columns=['bucket'] + PARTIAL_COLUMNS)
+    return frame.set_index(pd.to_datetime(frame.pop('bucket'), utc=True))
+
+
+def trend_series(upload_ids, bucket, window, filters):
+    """Time-bucketed averages with a count-weighted rolling mean.
+
+    Partial counts and sums of each upload are added per bucket before the
+    averages are taken. The rolling window spans ``window`` buckets of
+    time, so gaps shorten it rather than reaching further back. Raises
+    ``ValueError`` if the result would exceed ``MAX_BUCKETS``.
+    """
+    partials = []
+    for upload_id in upload_ids:
+        partial = snapshot_buckets(upload_id, bucket, filters)
+        partials.append(partial if partial is not None else database_buckets(upload_id, bucket, filters))
+    partials = [partial for partial in partials if len(partial)]
+    if not partials:
+        return []
+
+    frame = pd.concat(partials).groupby(level=0).sum().sort_index()
+    if len(frame) > MAX_BUCKETS:
+        raise ValueError(f'More than {MAX_BUCKETS} buckets; use a coarser bucket or a narrower range')
+
+    span = pd.Timedelta(window, unit=BUCKETS[bucket][1])
+    result = pd.DataFrame({'bucket': [value.isoformat() for value in frame.index], 'count': frame['count'].to_numpy()})
+    counts = frame['count'].rolling(span).sum()
+    for metric in METRICS:
+        result[f'avg_{metric}'] = (frame[f'{metric}_sum'] / frame['count']).to_numpy()
+    for metric in METRICS:
+        result[f'rolling_{metric}'] = (frame[f'{metric}_sum'].rolling(span).sum() / counts).to_numpy()
+    return result.astype(object).where(result.notna(), None).to_dict('records')
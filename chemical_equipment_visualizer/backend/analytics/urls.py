@@ -1,9 +1,22 @@
-from django.urls import path
-from .views import FileUploadView, DataSummaryView, UploadHistoryView, GeneratePDFView
+from django.urls import path, re_path
+from .views import (
+    FileUploadView, UploadStatusView, UploadResultView, EquipmentListView,
+    AnomaliesView, DataSummaryView, HistogramView, CompareView, TrendsView,
+    UploadHistoryView, GeneratePDFView, MetricsView
+)
 
 urlpatterns = [
     path('upload/', FileUploadView.as_view(), name='upload'),
+    path('upload/<int:pk>/status/', UploadStatusView.as_view(), name='upload-status'),
+    path('upload/<int:pk>/result/', UploadResultView.as_view(), name='upload-result'),
+    path('uploads/<int:pk>/equipment/', EquipmentListView.as_view(), name='upload-equipment'),
+    path('anomalies/', AnomaliesView.as_view(), name='anomalies'),
     path('summary/', DataSummaryView.as_view(), name='summary'),
+    path('histogram/', HistogramView.as_view(), name='histogram'),
+    path('compare/', CompareView.as_view(), name='compare'),
+    path('trends/', TrendsView.as_view(), name='trends'),
     path('history/', UploadHistoryView.as_view(), name='history'),
     path('pdf/', GeneratePDFView.as_view(), name='pdf'),
+    # Scrapers ask for /api/metrics, without the trailing slash
+    re_path(r'^metrics/?$', MetricsView.as_view(), name='metrics'),
 ]
\ No newline at end of file
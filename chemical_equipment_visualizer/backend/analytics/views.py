@@ -1,112 +1,315 @@
-import pandas as pd
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import AllowAny
-from django.http import HttpResponse
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-import io
-from .models import UploadedFile, EquipmentData
-from .serializers import UploadedFileSerializer
+from django.conf import settings
+from django.db.models import F
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.http import http_date, quote_etag
+from .anomalies import METHODS, describe_flags, flag_mask
+from .caching import bump_dataset_version, cache_by_dataset_version
+from .compare import compare_frames
+from .ingest import find_duplicate, hash_file, process_upload, reuse_upload, upload_result
+from .histograms import BINNINGS, build_histograms
+from .jobs import schedule_after_upload
+from .metrics import Timings, registry
+from .models import UploadedFile, EquipmentData, UploadSummary
+from .pagination import EquipmentCursorPagination
+from .reports import get_report, render_full_report, report_key, report_uploads
+from .serializers import EquipmentDataSerializer, UploadedFileSerializer, UploadStatusSerializer
+from .snapshots import load_frame
+from .summaries import METRICS, SummaryAccumulator, summarize_queryset
+from .trends import BUCKETS, trend_series
 
 class FileUploadView(APIView):
     permission_classes = [AllowAny]
     
+    def run_async(self, request):
+        value = request.query_params.get('async', request.data.get('async'))
+        if value is None:
+            return getattr(settings, 'INGEST_ASYNC', False)
+        return str(value).lower() in ('1', 'true', 'yes')
+    
+    def accepted(self, uploaded_file):
+        return Response({
+            'message': 'File accepted for processing',
+            'id': uploaded_file.id,
+            'status': uploaded_file.status,
+            'status_url': reverse('upload-status', args=[uploaded_file.id]),
+            'result_url': reverse('upload-result', args=[uploaded_file.id])
+        }, status=202)
+    
     def post(self, request):
         if 'file' not in request.FILES:
             return Response({'error': 'No file uploaded'}, status=400)
         
         file = request.FILES['file']
+        run_async = self.run_async(request)
+        timings = Timings('upload', file_name=file.name)
         
         try:
-            df = pd.read_csv(file)
-            df.columns = [str(col).strip() for col in df.columns]
-            
-            column_mapping = {}
-            for col in df.columns:
-                col_lower = col.lower()
-                if 'equip' in col_lower and 'name' in col_lower:
-                    column_mapping[col] = 'Equipment Name'
-                elif 'type' in col_lower:
-                    column_mapping[col] = 'Type'
-                elif 'flow' in col_lower:
-                    column_mapping[col] = 'Flowrate'
-                elif 'press' in col_lower:
-                    column_mapping[col] = 'Pressure'
-                elif 'temp' in col_lower:
-                    column_mapping[col] = 'Temperature'
-            
-            df.rename(columns=column_mapping, inplace=True)
-            
-            uploaded_file = UploadedFile.objects.create(
-                file=file,
-                file_name=file.name
-            )
-            
-            equipment_data = []
-            for _, row in df.iterrows():
-                equipment_data.append(EquipmentData(
-                    upload=uploaded_file,
-                    equipment_name=str(row.get('Equipment Name', 'Unknown')),
-                    equipment_type=str(row.get('Type', 'Unknown')),
-                    flowrate=float(row.get('Flowrate', 0)),
-                    pressure=float(row.get('Pressure', 0)),
-                    temperature=float(row.get('Temperature', 0))
-                ))
-            
-            EquipmentData.objects.bulk_create(equipment_data)
-            
-            UploadedFile.objects.exclude(
-                id__in=UploadedFile.objects.all().order_by('-uploaded_at')[:5].values_list('id', flat=True)
-            ).delete()
-            
-            summary = {
-                'total_count': len(df),
-                'avg_flowrate': float(df['Flowrate'].mean()) if 'Flowrate' in df.columns else 0,
-                'avg_pressure': float(df['Pressure'].mean()) if 'Pressure' in df.columns else 0,
-                'avg_temperature': float(df['Temperature'].mean()) if 'Temperature' in df.columns else 0,
-                'type_distribution': df['Type'].value_counts().to_dict() if 'Type' in df.columns else {'Unknown': len(df)}
-            }
-            
-            return Response({
-                'message': 'File uploaded successfully',
-                'summary': summary,
-                'data': df.head(5).to_dict('records')
-            })
+            with timings.stage('hash'):
+                content_hash = hash_file(file)
+            timings.add(bytes_read=file.size)
+            # A queued or running job for the same bytes is as good as a finished one
+            statuses = [UploadedFile.STATUS_DONE]
+            if run_async:
+                statuses += [UploadedFile.STATUS_PENDING, UploadedFile.STATUS_PROCESSING]
+            with timings.stage('dedupe'):
+                duplicate = find_duplicate(content_hash, statuses)
             
+            if duplicate is None:
+                with timings.stage('store'):
+                    uploaded_file = UploadedFile.objects.create(
+                        file=file,
+                        file_name=file.name,
+                        content_hash=content_hash,
+                        status=UploadedFile.STATUS_PENDING if run_async else UploadedFile.STATUS_PROCESSING
+                    )
+                bump_dataset_version()
         except Exception as e:
             return Response({'error': str(e)}, status=500)
+        
+        if duplicate is not None:
+            if duplicate.status == UploadedFile.STATUS_DONE:
+                reuse_upload(duplicate)
+            timings.finish(status='duplicate', upload_id=duplicate.id)
+            if run_async:
+                return self.accepted(duplicate)
+            result = upload_result(duplicate)
+            result['duplicate_of'] = duplicate.id
+            return Response(result)
+        
+        if run_async:
+            timings.finish(status=uploaded_file.status, upload_id=uploaded_file.id)
+            return self.accepted(uploaded_file)
+        
+        process_upload(uploaded_file, timings)
+        if uploaded_file.status == UploadedFile.STATUS_FAILED:
+            uploaded_file.file.delete(save=False)
+            uploaded_file.delete()
+            bump_dataset_version()
+            return Response({'error': uploaded_file.error}, status=500)
+        
+        schedule_after_upload(uploaded_file)
+        return Response(upload_result(uploaded_file))
+
+class UploadStatusView(APIView):
+    permission_classes = [AllowAny]
+    
+    def get(self, request, pk):
+        try:
+            uploaded_file = UploadedFile.objects.get(pk=pk)
+        except UploadedFile.DoesNotExist:
+            return Response({'error': 'Upload not found'}, status=404)
+        
+        return Response(UploadStatusSerializer(uploaded_file).data)
+
+class UploadResultView(APIView):
+    permission_classes = [AllowAny]
+    
+    def get(self, request, pk):
+        try:
+            uploaded_file = UploadedFile.objects.get(pk=pk)
+        except UploadedFile.DoesNotExist:
+            return Response({'error': 'Upload not found'}, status=404)
+        
+        if uploaded_file.status == UploadedFile.STATUS_FAILED:
+            return Response({'error': uploaded_file.error}, status=500)
+        if uploaded_file.status != UploadedFile.STATUS_DONE:
+            return Response(UploadStatusSerializer(uploaded_file).data, status=202)
+        
+        return Response(upload_result(uploaded_file))
+
+class EquipmentListView(APIView):
+    permission_classes = [AllowAny]
+    
+    def get(self, request, pk):
+        if not UploadedFile.objects.filter(pk=pk).exists():
+            return Response({'error': 'Upload not found'}, status=404)
+        
+        allowed = EquipmentDataSerializer.Meta.fields
+        fields = request.GET.get('fields')
+        fields = [name.strip() for name in fields.split(',') if name.strip()] if fields else allowed
+        unknown = [name for name in fields if name not in allowed]
+        if unknown:
+            return Response({'error': f"Unknown fields: {', '.join(unknown)}"}, status=400)
+        
+        # The cursor needs the id of every row, even when it isn't requested
+        columns = fields if 'id' in fields else ['id'] + fields
+        queryset = EquipmentData.objects.filter(upload_id=pk).values(*columns)
+        
+        paginator = EquipmentCursorPagination()
+        rows = paginator.paginate_queryset(queryset, request, view=self)
+        # Serialized from the values() dicts, without the model instances
+        serializer = EquipmentDataSerializer(rows, many=True, fields=fields)
+        return paginator.get_paginated_response(serializer.data)
+
+class AnomaliesView(APIView):
+    permission_classes = [AllowAny]
+    
+    def get(self, request):
+        metric = request.GET.get('metric') or None
+        method = request.GET.get('method') or None
+        if metric is not None and metric not in METRICS:
+            return Response({'error': f"metric must be one of: {', '.join(METRICS)}"}, status=400)
+        if method is not None and method not in METHODS:
+            return Response({'error': f"method must be one of: {', '.join(METHODS)}"}, status=400)
+        
+        uploads = UploadedFile.objects.filter(status=UploadedFile.STATUS_DONE)
+        upload_id = request.GET.get('upload_id')
+        if upload_id:
+            if not upload_id.isdigit():
+                return Response({'error': 'upload_id must be a positive integer'}, status=400)
+            uploads = uploads.filter(id=upload_id)
+            if not uploads.exists():
+                return Response({'error': 'Upload not found'}, status=404)
+        # anomaly_flags > 0 matches the partial index; the mask narrows it down
+        queryset = EquipmentData.objects.filter(upload__in=uploads, anomaly_flags__gt=0).alias(
+            matched=F('anomaly_flags').bitand(flag_mask(metric, method))
+        ).filter(matched__gt=0)
+        if request.GET.get('equipment_type'):
+            queryset = queryset.filter(equipment_type=request.GET['equipment_type'])
+        
+        paginator = EquipmentCursorPagination()
+        rows = paginator.paginate_queryset(queryset.values(
+            'id', 'upload_id', *EquipmentDataSerializer.Meta.fields[1:], 'anomaly_flags'
+        ), request, view=self)
+        for row in rows:
+            row['anomalies'] = describe_flags(row['anomaly_flags'])
+        return paginator.get_paginated_response(rows)
 
 class DataSummaryView(APIView):
     permission_classes = [AllowAny]
     
+    @cache_by_dataset_version('summary')
     def get(self, request):
         upload_id = request.GET.get('upload_id')
         
+        uploads = UploadedFile.objects.filter(status=UploadedFile.STATUS_DONE)
         if upload_id:
-            data = EquipmentData.objects.filter(upload_id=upload_id)
+            if not upload_id.isdigit():
+                return Response({'error': 'upload_id must be a positive integer'}, status=400)
+            uploads = uploads.filter(id=upload_id)
+        
+        if uploads.filter(summary__isnull=True).exists():
+            # Not materialized (yet): aggregate the rows in the database instead
+            summary = summarize_queryset(EquipmentData.objects.filter(upload__in=uploads))
         else:
-            data = EquipmentData.objects.all()
+            summary = SummaryAccumulator.from_summaries(
+                UploadSummary.objects.filter(upload__in=uploads)
+            ).as_dict()
+        
+        if not summary['total_count']:
+            return Response({'error': 'No data found'}, status=404)
         
-        if not data.exists():
+        return Response(summary)
+
+class HistogramView(APIView):
+    permission_classes = [AllowAny]
+    max_bins = 200
+    max_points = 5000
+    
+    def int_param(self, request, name, default, cap):
+        value = request.GET.get(name, '')
+        if not value:
+            return default
+        if not value.isdigit() or int(value) < 1:
+            raise ValueError(f'{name} must be a positive integer')
+        return min(int(value), cap)
+    
+    @cache_by_dataset_version('histogram')
+    def get(self, request):
+        try:
+            bins = self.int_param(request, 'bins', 20, self.max_bins)
+            points = self.int_param(request, 'points', 500, self.max_points)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        binning = request.GET.get('binning', 'fixed')
+        if binning not in BINNINGS:
+            return Response({'error': f"binning must be one of: {', '.join(BINNINGS)}"}, status=400)
+        by_type = request.GET.get('by_type', '').lower() in ('1', 'true', 'yes')
+        
+        uploads = UploadedFile.objects.filter(status=UploadedFile.STATUS_DONE)
+        upload_id = request.GET.get('upload_id')
+        if upload_id:
+            if not upload_id.isdigit():
+                return Response({'error': 'upload_id must be a positive integer'}, status=400)
+            uploads = uploads.filter(id=upload_id)
+            if not uploads.exists():
+                return Response({'error': 'Upload not found'}, status=404)
+        columns = ['equipment_type', 'flowrate', 'pressure', 'temperature']
+        frame = load_frame(uploads.order_by('id').values_list('id', flat=True), columns)
+        if not len(frame):
             return Response({'error': 'No data found'}, status=404)
         
-        df = pd.DataFrame(list(data.values()))
+        return Response(build_histograms(frame, bins, binning, by_type, points))
+
+class CompareView(APIView):
+    permission_classes = [AllowAny]
+    max_limit = 1000
+    
+    @cache_by_dataset_version('compare')
+    def get(self, request):
+        a, b = request.GET.get('a', ''), request.GET.get('b', '')
+        if not (a.isdigit() and b.isdigit()):
+            return Response({'error': 'Both a and b upload ids are required'}, status=400)
+        done = UploadedFile.objects.filter(status=UploadedFile.STATUS_DONE, id__in=[a, b])
+        if done.count() != len({a, b}):
+            return Response({'error': 'Upload not found'}, status=404)
         
-        summary = {
-            'total_count': len(df),
-            'avg_flowrate': float(df['flowrate'].mean()),
-            'avg_pressure': float(df['pressure'].mean()),
-            'avg_temperature': float(df['temperature'].mean()),
-            'type_distribution': df['equipment_type'].value_counts().to_dict()
-        }
+        limit = request.GET.get('limit', '100')
+        if not limit.isdigit():
+            return Response({'error': 'limit must be a non-negative integer'}, status=400)
         
-        return Response(summary)
+        result = compare_frames(load_frame([int(a)]), load_frame([int(b)]), min(int(limit), self.max_limit))
+        return Response({'a': int(a), 'b': int(b), **result})
+
+class TrendsView(APIView):
+    permission_classes = [AllowAny]
+    
+    @cache_by_dataset_version('trends')
+    def get(self, request):
+        bucket = request.GET.get('bucket', 'hour')
+        if bucket not in BUCKETS:
+            return Response({'error': f"bucket must be one of: {', '.join(BUCKETS)}"}, status=400)
+        window = request.GET.get('window', '1')
+        if not window.isdigit() or int(window) < 1:
+            return Response({'error': 'window must be a positive integer'}, status=400)
+        
+        filters = {name: request.GET[name] for name in ('equipment_name', 'equipment_type') if request.GET.get(name)}
+        for name in ('start', 'end'):
+            if request.GET.get(name):
+                value = parse_datetime(request.GET[name])
+                if value is None:
+                    return Response({'error': f'{name} must be an ISO 8601 datetime'}, status=400)
+                if timezone.is_naive(value):
+                    value = timezone.make_aware(value)
+                filters[name] = value
+        
+        uploads = UploadedFile.objects.filter(status=UploadedFile.STATUS_DONE)
+        upload_id = request.GET.get('upload_id')
+        if upload_id:
+            if not upload_id.isdigit():
+                return Response({'error': 'upload_id must be a positive integer'}, status=400)
+            uploads = uploads.filter(id=upload_id)
+            if not uploads.exists():
+                return Response({'error': 'Upload not found'}, status=404)
+        try:
+            series = trend_series(uploads.order_by('id').values_list('id', flat=True), bucket, int(window), filters)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+        
+        return Response({'bucket': bucket, 'window': int(window), 'series': series})
 
 class UploadHistoryView(APIView):
     permission_classes = [AllowAny]
     
+    @cache_by_dataset_version('history')
     def get(self, request):
         uploads = UploadedFile.objects.all().order_by('-uploaded_at')[:5]
         serializer = UploadedFileSerializer(uploads, many=True)
@@ -116,44 +319,47 @@ class GeneratePDFView(APIView):
     permission_classes = [AllowAny]
     
     def get(self, request):
-        buffer = io.BytesIO()
-        p = canvas.Canvas(buffer, pagesize=letter)
-        
-        p.setFont("Helvetica-Bold", 16)
-        p.drawString(100, 750, "Chemical Equipment Analysis Report")
-        p.setFont("Helvetica", 12)
-        p.drawString(100, 730, "Generated from Chemical Equipment Visualizer")
-        p.line(100, 720, 500, 720)
-        
-        data = EquipmentData.objects.all()
-        if data.exists():
-            df = pd.DataFrame(list(data.values()))
-            
-            p.setFont("Helvetica-Bold", 14)
-            p.drawString(100, 690, "Summary Statistics")
-            p.setFont("Helvetica", 12)
-            
-            p.drawString(100, 670, f"Total Equipment: {len(df)}")
-            p.drawString(100, 650, f"Average Flowrate: {df['flowrate'].mean():.2f}")
-            p.drawString(100, 630, f"Average Pressure: {df['pressure'].mean():.2f}")
-            p.drawString(100, 610, f"Average Temperature: {df['temperature'].mean():.2f}")
-            
-            p.setFont("Helvetica-Bold", 14)
-            p.drawString(100, 580, "Equipment List:")
-            p.setFont("Helvetica", 10)
-            
-            y = 560
-            for i, item in enumerate(data[:15]):
-                text = f"{i+1}. {item.equipment_name} ({item.equipment_type})"
-                p.drawString(100, y, text)
-                y -= 15
-        else:
-            p.drawString(100, 690, "No data available")
+        upload_id = request.GET.get('upload_id')
+        if upload_id and not (upload_id.isdigit() and UploadedFile.objects.filter(
+            id=upload_id, status=UploadedFile.STATUS_DONE
+        ).exists()):
+            return Response({'error': 'Upload not found'}, status=404)
+        
+        upload_id = int(upload_id) if upload_id else None
+        if request.GET.get('full', '').lower() in ('1', 'true', 'yes'):
+            return self.full_report(request, upload_id)
+        
+        # Normally pre-rendered by the worker; rendered here only if missing
+        path, key = get_report(upload_id)
+        etag = quote_etag(key)
+        last_modified = int(path.stat().st_mtime)
         
-        p.showPage()
-        p.save()
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            return response
         
-        buffer.seek(0)
-        response = HttpResponse(buffer, content_type='application/pdf')
+        response = FileResponse(open(path, 'rb'), content_type='application/pdf')
         response['Content-Disposition'] = 'attachment; filename="equipment_report.pdf"'
-        return response
\ No newline at end of file
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+    
+    def full_report(self, request, upload_id):
+        # Every row, paginated per type; streamed page by page as it renders
+        upload_ids = report_uploads(upload_id)
+        etag = quote_etag(report_key(upload_ids, upload_id, full=True))
+        
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            return response
+        
+        response = StreamingHttpResponse(render_full_report(upload_ids), content_type='application/pdf')
+        response['Content-Disposition'] = 'attachment; filename="equipment_report_full.pdf"'
+        response['ETag'] = etag
+        return response
+
+class MetricsView(APIView):
+    permission_classes = [AllowAny]
+    
+    def get(self, request):
+        return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
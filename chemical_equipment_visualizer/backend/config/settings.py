@@ -22,6 +22,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'analytics.middleware.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -88,6 +89,62 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Summary, history and PDF responses are cached per dataset version
+# (analytics.caching); the local-memory cache evicts least recently used.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'analytics': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'analytics-responses',
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 256},
+    },
+}
+
+# Rows read per chunk when streaming an uploaded CSV into the database
+INGEST_CHUNK_SIZE = 50000
+
+# Queue uploads for the process_uploads worker instead of ingesting inline;
+# clients can override per request with ?async=1 / ?async=0
+INGEST_ASYNC = False
+
+# Keep a memory-mappable Arrow copy of each upload under MEDIA_ROOT/snapshots
+# (needs pyarrow; without it readers query EquipmentData instead)
+SNAPSHOTS_ENABLED = True
+
+# Which uploads to keep (see analytics.retention); None disables a rule.
+# Applied after each upload on a background thread and by apply_retention.
+UPLOAD_RETENTION = {
+    'KEEP_LAST': 5,
+    'MAX_AGE_DAYS': None,
+    'MAX_TOTAL_ROWS': None,
+    'FAILED_MAX_AGE_HOURS': 24,
+    'BATCH_SIZE': 10000,
+    'RUN_AFTER_UPLOAD': True,
+}
+
+# Per-type outlier bounds used to flag rows at ingest (see analytics.anomalies)
+ANOMALY_DETECTION = {
+    'Z_THRESHOLD': 3.0,
+    'IQR_FACTOR': 1.5,
+    'MIN_GROUP_SIZE': 8,
+}
+
+# Per-request and per-stage timings (analytics.metrics) are logged as one
+# JSON object per line; /api/metrics/ serves the same numbers to Prometheus
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'analytics.metrics': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 # WITH AUTHENTICATION (Project requirement)
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
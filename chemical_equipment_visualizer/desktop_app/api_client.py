@@ -0,0 +1,230 @@
+import json
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "http://localhost:8000/api"
+
+# Background uploads of an analyzed file: the first retry after 15 s, then
+# twice as long each time up to 5 minutes, giving up after six retries
+SYNC_RETRY_MS = 15000
+SYNC_RETRY_CAP_MS = 300000
+SYNC_RETRIES = 6
+# Replies that mean the server, not the file, is the problem
+UNAVAILABLE = (502, 503, 504)
+
+
+def sync_retry_delay(attempt):
+    """Milliseconds to wait before retry number ``attempt + 1``; None once retries run out."""
+    if attempt >= SYNC_RETRIES:
+        return None
+    return min(SYNC_RETRY_MS * 2 ** attempt, SYNC_RETRY_CAP_MS)
+
+
+class Reply:
+    def __init__(self, status_code, headers, content, elapsed, from_cache=False, stale=False):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.elapsed = elapsed
+        # Served from the on-disk cache; stale when the server couldn't be asked
+        self.from_cache = from_cache
+        self.stale = stale
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class UploadBody:
+    """multipart/form-data body for one file, read block by block.
+
+    requests streams any object with read() and a length, so the file is
+    never loaded whole and every block is a chance to report progress or
+    stop a cancelled upload.
+    """
+
+    block_size = 64 * 1024
+
+    def __init__(self, path, task=None, field="file"):
+        self.path = path
+        self.task = task
+        boundary = uuid.uuid4().hex
+        file_name = os.path.basename(path).replace('"', "%22")
+        self.content_type = f"multipart/form-data; boundary={boundary}"
+        self.head = (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="{file_name}"\r\n'
+            "Content-Type: text/csv\r\n\r\n"
+        ).encode()
+        self.tail = f"\r\n--{boundary}--\r\n".encode()
+        self.length = len(self.head) + os.path.getsize(path) + len(self.tail)
+        self.sent = 0
+        self._blocks = self._read_blocks()
+        self._buffer = b""
+
+    def __len__(self):
+        return self.length
+
+    def _read_blocks(self):
+        yield self.head
+        with open(self.path, "rb") as f:
+            for block in iter(lambda: f.read(self.block_size), b""):
+                yield block
+        yield self.tail
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            block = next(self._blocks, None)
+            if block is None:
+                break
+            self._buffer += block
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+
+        self.sent += len(data)
+        if self.task is not None:
+            self.task.report(self.sent, self.length)
+        return data
+
+
+class ApiClient:
+    """The backend API over one pooled keep-alive session.
+
+    Both windows share this instead of calling requests directly. Calls
+    have timeouts; GETs are retried with exponential backoff on connection
+    errors and 502/503/504. Requests accept gzip, which a proxy in front of
+    the backend may apply; the backend itself sends responses uncompressed
+    so its ETags stay strong. The latency of every call is kept in
+    ``latencies`` and logged.
+
+    With a ``ResponseCache``, GETs revalidate the last good response with
+    If-None-Match / If-Modified-Since and fall back to it when the server
+    is down or failing.
+
+    The base URL comes from EQUIPMENT_API_URL when it is set.
+    """
+
+    def __init__(self, base_url=None, timeout=(3.05, 30), upload_timeout=(3.05, 600),
+                 retries=3, backoff=0.5, pool_size=4, cache=None):
+        self.base_url = (base_url or os.environ.get("EQUIPMENT_API_URL") or DEFAULT_BASE_URL).rstrip("/")
+        self.cache = cache
+        self.timeout = timeout
+        # The server answers an upload only once it is ingested
+        self.upload_timeout = upload_timeout
+        self.latencies = deque(maxlen=500)
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.headers["Accept-Encoding"] = "gzip"
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def url(self, path):
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def request(self, method, path, task=None, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        start = time.perf_counter()
+        # Streamed so large bodies (the PDF) report progress and can be cancelled
+        with self.session.request(method, self.url(path), stream=True, **kwargs) as response:
+            total = int(response.headers.get("Content-Length") or 0)
+            chunks = []
+            for chunk in response.iter_content(64 * 1024):
+                chunks.append(chunk)
+                if task is not None:
+                    # Bytes off the wire, which is what Content-Length counts when gzipped
+                    task.report(response.raw.tell(), total)
+            content = b"".join(chunks)
+        elapsed = time.perf_counter() - start
+
+        self.latencies.append((method, path, response.status_code, elapsed))
+        logger.info("%s %s -> %s in %.1f ms (%d bytes)", method, path, response.status_code, elapsed * 1000, len(content))
+        return Reply(response.status_code, response.headers, content, elapsed)
+
+    def cache_key(self, path, params=None):
+        params = {name: value for name, value in (params or {}).items() if value is not None}
+        return self.url(path) + ("?" + urlencode(sorted(params.items())) if params else "")
+
+    def cached(self, path, params=None):
+        """The cached reply for a GET, without asking the server; None if there is none."""
+        entry = self.cache.load(self.cache_key(path, params)) if self.cache is not None else None
+        if entry is None:
+            return None
+        meta, content = entry
+        return Reply(200, meta["headers"], content, 0.0, from_cache=True)
+
+    def get(self, path, task=None, params=None, use_cache=True, **kwargs):
+        if not use_cache or self.cache is None:
+            return self.request("GET", path, task, params=params, **kwargs)
+
+        key = self.cache_key(path, params)
+        entry = self.cache.load(key)
+        headers = dict(kwargs.pop("headers", None) or {})
+        if entry is not None:
+            meta, content = entry
+            if meta["etag"]:
+                headers["If-None-Match"] = meta["etag"]
+            if meta["last_modified"]:
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        try:
+            reply = self.request("GET", path, task, params=params, headers=headers, **kwargs)
+        except requests.RequestException:
+            if entry is None:
+                raise
+            logger.warning("GET %s failed, serving the cached copy", path)
+            return Reply(200, meta["headers"], content, 0.0, from_cache=True, stale=True)
+
+        if entry is not None and reply.status_code == 304:
+            return Reply(200, meta["headers"], content, reply.elapsed, from_cache=True)
+        if entry is not None and reply.status_code >= 500:
+            return Reply(200, meta["headers"], content, reply.elapsed, from_cache=True, stale=True)
+        if reply.status_code == 200:
+            self.cache.store(key, reply.headers, reply.content)
+        return reply
+
+    def upload(self, file_path, task=None):
+        # Not retried: the streamed body can't be sent a second time
+        body = UploadBody(file_path, task)
+        return self.request("POST", "upload/", task, data=body, timeout=self.upload_timeout,
+                            headers={"Content-Type": body.content_type})
+
+    def try_upload(self, file_path, task=None):
+        """``upload``, or None when the server can't be reached.
+
+        Other errors, a missing file say, are raised as usual: trying again
+        would not help them.
+        """
+        try:
+            return self.upload(file_path, task)
+        except (requests.ConnectionError, requests.Timeout):
+            return None
+
+    def history(self, task=None):
+        return self.get("history/", task)
+
+    def summary(self, upload_id=None, task=None):
+        return self.get("summary/", task, params={"upload_id": upload_id})
+
+    def pdf(self, upload_id=None, task=None):
+        return self.get("pdf/", task, params={"upload_id": upload_id})
+
+    def close(self):
+        self.session.close()
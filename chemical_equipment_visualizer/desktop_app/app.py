@@ -1,16 +1,22 @@
 import sys
-import requests
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-import numpy as np
+from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
+from api_client import UNAVAILABLE, ApiClient, sync_retry_delay
+from cache import ResponseCache
+from charts import ChartEngine
+from offline import analyze_csv, load_points
+from workers import TaskRunner
 
 class CSVUploader(QMainWindow):
     def __init__(self):
         super().__init__()
-        self.base_url = "http://localhost:8000/api"
+        self.api = ApiClient(cache=ResponseCache())
+        # Backend calls run here, off the GUI thread
+        self.tasks = TaskRunner(self)
         self.initUI()
         
     def initUI(self):
@@ -61,6 +67,17 @@ class CSVUploader(QMainWindow):
         btn_upload.setStyleSheet("padding: 10px; background-color: #28a745; color: white; font-weight: bold; border-radius: 4px;")
         upload_group_layout.addWidget(btn_upload)
         
+        # Offline analysis: same summary computed on this machine
+        offline_layout = QHBoxLayout()
+        btn_local = QPushButton("Analyze Locally")
+        btn_local.clicked.connect(self.analyze_locally)
+        btn_local.setStyleSheet("padding: 10px; background-color: #6c757d; color: white; font-weight: bold; border-radius: 4px;")
+        self.sync_check = QCheckBox("Upload to server in background")
+        self.sync_check.setChecked(True)
+        offline_layout.addWidget(btn_local, 1)
+        offline_layout.addWidget(self.sync_check)
+        upload_group_layout.addLayout(offline_layout)
+        
         # PDF Button
         btn_pdf = QPushButton("📄 Generate PDF Report")
         btn_pdf.clicked.connect(self.generate_pdf)
@@ -78,11 +95,16 @@ class CSVUploader(QMainWindow):
         
         # Chart section
         self.chart_group = QGroupBox("Visualizations")
-        chart_layout = QHBoxLayout()
+        chart_layout = QVBoxLayout()
         
-        # Matplotlib figure for charts
+        # Matplotlib figure for charts; axes are built once and updated in place
         self.figure = plt.figure(figsize=(12, 5))
         self.canvas = FigureCanvas(self.figure)
+        self.charts = ChartEngine(
+            self.figure, self.canvas, pie_cmap=plt.cm.Set3, bar_colors=['#36A2EB', '#FF6384', '#FFCE56'],
+            bold_titles=True, value_labels=True, ylabel='Value', grid=True
+        )
+        chart_layout.addWidget(NavigationToolbar(self.canvas, self))
         chart_layout.addWidget(self.canvas)
         self.chart_group.setLayout(chart_layout)
         upload_layout.addWidget(self.chart_group)
@@ -115,7 +137,15 @@ class CSVUploader(QMainWindow):
         
         main_layout.addWidget(tabs)
         
-        # Status bar
+        # Status bar, with progress of running uploads and downloads
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setMaximumWidth(200)
+        self.progress_bar.hide()
+        self.btn_cancel = QPushButton("Cancel")
+        self.btn_cancel.clicked.connect(lambda: self.tasks.cancel())
+        self.btn_cancel.hide()
+        self.statusBar().addPermanentWidget(self.progress_bar)
+        self.statusBar().addPermanentWidget(self.btn_cancel)
         self.statusBar().showMessage('Ready')
         
         # Load initial history
@@ -130,21 +160,46 @@ class CSVUploader(QMainWindow):
             self.file_label.setText(f"Selected: {file_path.split('/')[-1]}")
             self.statusBar().showMessage(f'File selected: {file_path}')
     
+    def start_progress(self):
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.show()
+        self.btn_cancel.show()
+    
+    def show_progress(self, done, total):
+        # A range of 0..0 is Qt's busy indicator, for bodies of unknown size
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+    
+    def stop_progress(self):
+        if not any(self.tasks.is_running(key) for key in ('upload', 'analyze', 'pdf')):
+            self.progress_bar.hide()
+            self.btn_cancel.hide()
+    
     def upload_file(self):
         if not hasattr(self, 'file_path'):
             QMessageBox.warning(self, "Warning", "Please select a CSV file first")
             return
-            
+        if self.tasks.is_running('upload'):
+            self.statusBar().showMessage('An upload is already in progress')
+            return
+        
+        # Upload file to backend
+        self.statusBar().showMessage('Uploading...')
+        self.start_progress()
+        self.tasks.submit(
+            'upload', self.api.upload, self.file_path,
+            on_result=self.upload_finished, on_error=self.request_failed,
+            on_progress=self.show_progress, on_done=self.stop_progress,
+            on_cancel=lambda: self.statusBar().showMessage('Upload cancelled')
+        )
+    
+    def upload_finished(self, response):
         try:
-            # Upload file to backend
-            with open(self.file_path, 'rb') as f:
-                files = {'file': f}
-                response = requests.post(f"{self.base_url}/upload/", files=files)
-                
             if response.status_code == 200:
                 data = response.json()
                 self.display_summary(data['summary'])
                 self.plot_charts(data['summary'])
+                self.load_points(self.file_path)
                 self.load_history()
                 QMessageBox.information(self, "Success", "File uploaded and analyzed successfully!")
                 self.statusBar().showMessage('Upload successful')
@@ -154,8 +209,71 @@ class CSVUploader(QMainWindow):
                 self.statusBar().showMessage('Upload failed')
                 
         except Exception as e:
-            QMessageBox.critical(self, "Error", f"An error occurred: {str(e)}")
-            self.statusBar().showMessage(f'Error: {str(e)}')
+            self.request_failed(str(e))
+    
+    def analyze_locally(self):
+        if not hasattr(self, 'file_path'):
+            QMessageBox.warning(self, "Warning", "Please select a CSV file first")
+            return
+        if self.tasks.is_running('analyze'):
+            self.statusBar().showMessage('A local analysis is already in progress')
+            return
+        
+        # Summary and charts without waiting for the server
+        file_path = self.file_path
+        self.statusBar().showMessage('Analyzing locally...')
+        self.start_progress()
+        self.tasks.submit(
+            'analyze', analyze_csv, file_path,
+            on_result=lambda result: self.analysis_finished(file_path, result), on_error=self.request_failed,
+            on_progress=self.show_progress, on_done=self.stop_progress,
+            on_cancel=lambda: self.statusBar().showMessage('Analysis cancelled')
+        )
+    
+    def analysis_finished(self, file_path, result):
+        self.display_summary(result['summary'])
+        self.plot_charts(result['summary'])
+        self.points_path = file_path
+        self.charts.show_points(*result['points'])
+        if self.sync_check.isChecked():
+            self.sync_upload(file_path)
+            self.statusBar().showMessage('Analyzed locally - uploading to the server in the background')
+        else:
+            self.statusBar().showMessage('Analyzed locally (not uploaded)')
+    
+    def sync_upload(self, file_path, attempt=0):
+        # No progress bar or dialogs: the local results are already on screen
+        self.tasks.submit(
+            ('sync', file_path), self.api.try_upload, file_path,
+            on_result=lambda response: self.sync_finished(file_path, response, attempt),
+            on_error=lambda error: self.statusBar().showMessage(f"Could not upload {file_path.split('/')[-1]}: {error}")
+        )
+    
+    def sync_finished(self, file_path, response, attempt=0):
+        file_name = file_path.split('/')[-1]
+        if response is None or response.status_code in UNAVAILABLE:
+            self.sync_failed(file_path, attempt)
+        elif response.status_code == 200:
+            self.statusBar().showMessage(f'{file_name} uploaded to the server')
+            self.load_history()
+        else:
+            # The server read the file and turned it down; retrying won't change that
+            error_msg = response.json().get('error', 'Unknown error')
+            self.statusBar().showMessage(f'Server rejected {file_name}: {error_msg}')
+    
+    def sync_failed(self, file_path, attempt):
+        # Server unreachable: retry with growing delays, then give up
+        file_name = file_path.split('/')[-1]
+        delay = sync_retry_delay(attempt)
+        if delay is None:
+            self.statusBar().showMessage(f'Server unreachable - gave up uploading {file_name}')
+            return
+        self.statusBar().showMessage(f'Server unreachable - will retry uploading {file_name} in {delay // 1000} s')
+        QTimer.singleShot(delay, lambda: self.sync_upload(file_path, attempt + 1))
+    
+    def request_failed(self, error):
+        QMessageBox.critical(self, "Error", f"An error occurred: {error}")
+        self.statusBar().showMessage(f'Error: {error}')
     
     def display_summary(self, summary):
         # Clear previous summary
@@ -199,40 +317,37 @@ class CSVUploader(QMainWindow):
         self.summary_group.show()
     
     def plot_charts(self, summary):
-        self.figure.clear()
-        
-        # Create subplots
-        ax1 = self.figure.add_subplot(121)
-        ax2 = self.figure.add_subplot(122)
-        
-        # Pie chart for type distribution
-        types = list(summary['type_distribution'].keys())
-        counts = list(summary['type_distribution'].values())
-        colors = plt.cm.Set3(np.linspace(0, 1, len(types)))
-        ax1.pie(counts, labels=types, autopct='%1.1f%%', startangle=90, colors=colors)
-        ax1.set_title('Equipment Type Distribution', fontweight='bold')
-        
-        # Bar chart for averages
-        metrics = ['Flowrate', 'Pressure', 'Temperature']
-        values = [summary['avg_flowrate'], summary['avg_pressure'], summary['avg_temperature']]
-        bars = ax2.bar(metrics, values, color=['#36A2EB', '#FF6384', '#FFCE56'])
-        ax2.set_title('Average Values', fontweight='bold')
-        ax2.set_ylabel('Value')
-        ax2.grid(True, alpha=0.3)
-        
-        # Add value labels on bars
-        for bar, value in zip(bars, values):
-            height = bar.get_height()
-            ax2.text(bar.get_x() + bar.get_width()/2., height,
-                    f'{value:.2f}', ha='center', va='bottom', fontweight='bold')
-        
-        self.figure.tight_layout()
-        self.canvas.draw()
+        # Pie and bars are reused: only wedge angles, bar heights and labels change
+        self.charts.update(summary)
         self.chart_group.show()
     
+    def load_points(self, file_path):
+        # Flowrate vs pressure for every row, read from the local copy of the file
+        self.points_path = file_path
+        self.tasks.submit(
+            ('points', file_path), load_points, file_path,
+            on_result=lambda points: self.show_points(file_path, points),
+            on_error=lambda error: self.statusBar().showMessage(f'Could not plot points: {error}')
+        )
+    
+    def show_points(self, file_path, points):
+        # A newer file may have been uploaded while this one was being read
+        if file_path == self.points_path:
+            self.charts.show_points(*points)
+    
     def load_history(self):
+        # Last known history from disk right away, revalidated in the background
+        cached = self.api.cached('history/')
+        if cached is not None and not self.tasks.is_running('history'):
+            self.show_history(cached)
+        # Clicks while a refresh is in flight share its result
+        self.tasks.submit(
+            'history', self.api.history,
+            on_result=self.show_history, on_error=self.history_failed
+        )
+    
+    def show_history(self, response):
         try:
-            response = requests.get(f"{self.base_url}/history/")
             if response.status_code == 200:
                 history = response.json()
                 self.history_table.setRowCount(len(history))
@@ -254,16 +369,31 @@ class CSVUploader(QMainWindow):
                     self.history_table.setItem(row, 2, date_item)
                 
                 self.history_table.resizeColumnsToContents()
-                self.statusBar().showMessage(f'Loaded {len(history)} history items')
+                if response.stale:
+                    self.statusBar().showMessage(f'Server unreachable - showing {len(history)} cached history items')
+                else:
+                    self.statusBar().showMessage(f'Loaded {len(history)} history items')
             else:
                 self.statusBar().showMessage('Failed to load history')
         except Exception as e:
-            QMessageBox.warning(self, "Error", f"Failed to load history: {str(e)}")
-            self.statusBar().showMessage('Error loading history')
+            self.history_failed(str(e))
+    
+    def history_failed(self, error):
+        QMessageBox.warning(self, "Error", f"Failed to load history: {error}")
+        self.statusBar().showMessage('Error loading history')
     
     def generate_pdf(self):
+        self.statusBar().showMessage('Generating PDF...')
+        self.start_progress()
+        self.tasks.submit(
+            'pdf', self.api.pdf,
+            on_result=self.save_pdf, on_error=self.pdf_failed,
+            on_progress=self.show_progress, on_done=self.stop_progress,
+            on_cancel=lambda: self.statusBar().showMessage('PDF download cancelled')
+        )
+    
+    def save_pdf(self, response):
         try:
-            response = requests.get(f"{self.base_url}/pdf/")
             if response.status_code == 200:
                 # Save PDF file
                 file_path, _ = QFileDialog.getSaveFileName(
@@ -272,14 +402,26 @@ class CSVUploader(QMainWindow):
                 if file_path:
                     with open(file_path, 'wb') as f:
                         f.write(response.content)
-                    QMessageBox.information(self, "Success", f"PDF saved to:\n{file_path}")
+                    if response.stale:
+                        QMessageBox.information(self, "Success", f"Server unreachable - saved the last generated PDF to:\n{file_path}")
+                    else:
+                        QMessageBox.information(self, "Success", f"PDF saved to:\n{file_path}")
                     self.statusBar().showMessage('PDF generated successfully')
             else:
                 QMessageBox.critical(self, "Error", "Failed to generate PDF")
                 self.statusBar().showMessage('PDF generation failed')
         except Exception as e:
-            QMessageBox.critical(self, "Error", f"PDF Error: {str(e)}")
-            self.statusBar().showMessage(f'Error: {str(e)}')
+            self.pdf_failed(str(e))
+    
+    def pdf_failed(self, error):
+        QMessageBox.critical(self, "Error", f"PDF Error: {error}")
+        self.statusBar().showMessage(f'Error: {error}')
+    
+    def closeEvent(self, event):
+        # Stop background requests before the window they report to goes away
+        self.tasks.shutdown()
+        self.api.close()
+        super().closeEvent(event)
 
 def main():
     app = QApplication(sys.argv)
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+
+def default_directory():
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(base, "chemical-equipment-visualizer")
+
+
+class ResponseCache:
+    """Last good response per URL, kept on disk between runs.
+
+    Each entry is a body file plus a small JSON file with the validators
+    (ETag, Last-Modified) to revalidate it with. Files are replaced
+    atomically, so pool threads can store while the GUI thread reads.
+    The least recently stored entries go once the cache outgrows
+    ``max_bytes``.
+    """
+
+    def __init__(self, directory=None, max_bytes=200 * 2 ** 20):
+        self.directory = directory or os.environ.get("EQUIPMENT_CACHE_DIR") or default_directory()
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, url, suffix):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.directory, key + suffix)
+
+    def _write(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def load(self, url):
+        """``(meta, content)`` of the entry for ``url``, or None."""
+        try:
+            with open(self._path(url, ".json"), "rb") as f:
+                meta = json.loads(f.read())
+            with open(self._path(url, ".body"), "rb") as f:
+                content = f.read()
+        except (OSError, ValueError):
+            return None
+        # The body of a half-replaced entry doesn't match its metadata
+        if meta.get("size") != len(content):
+            return None
+        return meta, content
+
+    def store(self, url, headers, content):
+        meta = {
+            "url": url,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "headers": {name: headers[name] for name in ("Content-Type", "Content-Disposition") if name in headers},
+            "size": len(content),
+            "stored_at": time.time(),
+        }
+        self._write(self._path(url, ".body"), content)
+        self._write(self._path(url, ".json"), json.dumps(meta).encode())
+        self.prune()
+
+    def prune(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".body"):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for stale in (path, path[:-len(".body")] + ".json"):
+                try:
+                    os.unlink(stale)
+                except OSError:
+                    pass
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith((".body", ".json")):
+                os.unlink(os.path.join(self.directory, name))
@@ -0,0 +1,211 @@
+import numpy as np
+from matplotlib.colors import LogNorm
+from matplotlib.patches import Wedge
+
+METRICS = ['Flowrate', 'Pressure', 'Temperature']
+
+
+class DensityView:
+    """Every row as a point, kept interactive at millions of rows.
+
+    While the view holds more than max_points rows they are binned into a
+    2-D histogram image (square-binned, like hexbin). Zoomed in far enough,
+    the rows in view are drawn as a plain scatter. Both artists are made
+    once; zooming or panning only replaces their data.
+    """
+
+    def __init__(self, ax, bins=150, max_points=20000, xlabel='Flowrate', ylabel='Pressure'):
+        self.ax = ax
+        self.bins = bins
+        self.max_points = max_points
+        self.x = np.empty(0, dtype='float32')
+        self.y = np.empty(0, dtype='float32')
+        self.updating = False
+
+        ax.set_title(f'{xlabel} vs {ylabel}')
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+        self.image = ax.imshow(
+            np.ma.masked_all((1, 1)), origin='lower', aspect='auto', interpolation='nearest',
+            cmap='viridis', norm=LogNorm(vmin=1, vmax=10), extent=(0, 1, 0, 1), visible=False
+        )
+        self.scatter = ax.scatter([], [], s=6, alpha=0.6, linewidths=0)
+        ax.callbacks.connect('xlim_changed', self.on_limits)
+        ax.callbacks.connect('ylim_changed', self.on_limits)
+
+    def set_points(self, x, y):
+        finite = np.isfinite(x) & np.isfinite(y)
+        self.x, self.y = x[finite], y[finite]
+        if len(self.x):
+            self.updating = True
+            self.ax.set_xlim(*self.padded(self.x))
+            self.ax.set_ylim(*self.padded(self.y))
+            self.updating = False
+        self.rebin()
+        self.ax.figure.canvas.draw_idle()
+
+    def padded(self, values):
+        low, high = float(values.min()), float(values.max())
+        margin = (high - low) * 0.02 or 1
+        return low - margin, high + margin
+
+    def on_limits(self, ax):
+        # set_points moves both limits itself and rebins once afterwards
+        if not self.updating:
+            self.rebin()
+
+    def rebin(self):
+        x0, x1 = sorted(self.ax.get_xlim())
+        y0, y1 = sorted(self.ax.get_ylim())
+        # Bin coordinates of every point; those in [0, bins) on both axes are in view
+        column = (self.x - x0) * (self.bins / ((x1 - x0) or 1))
+        row = (self.y - y0) * (self.bins / ((y1 - y0) or 1))
+        inside = (column >= 0) & (column < self.bins) & (row >= 0) & (row < self.bins)
+        count = int(np.count_nonzero(inside))
+
+        if count <= self.max_points:
+            self.scatter.set_offsets(np.column_stack([self.x[inside], self.y[inside]]))
+            self.scatter.set_visible(True)
+            self.image.set_visible(False)
+            return
+
+        # np.bincount over flat cell numbers is about ten times faster than np.histogram2d
+        cells = row[inside].astype(np.intp) * self.bins + column[inside].astype(np.intp)
+        counts = np.bincount(cells, minlength=self.bins * self.bins).reshape(self.bins, self.bins)
+        self.image.set_data(np.ma.masked_equal(counts, 0))
+        self.image.set_extent((x0, x1, y0, y1))
+        self.image.set_clim(1, max(counts.max(), 2))
+        self.image.set_visible(True)
+        self.scatter.set_visible(False)
+
+
+class ChartEngine:
+    """The summary charts of a window, created once and updated in place.
+
+    Showing another summary moves the pie wedges, resizes the bars and
+    changes their texts. Those artists are animated: they are drawn over
+    a cached background and blitted, so browsing datasets neither clears
+    the figure nor lays it out again. Only a bar axis that has to rescale
+    costs a full redraw.
+    """
+
+    def __init__(self, figure, canvas, pie_cmap=None, bar_colors=None, bold_titles=False,
+                 value_labels=False, ylabel=None, grid=False, density=True):
+        self.figure = figure
+        self.canvas = canvas
+        self.pie_cmap = pie_cmap
+        self.weight = 'bold' if bold_titles else 'normal'
+        columns = 3 if density else 2
+
+        self.ax_pie = figure.add_subplot(1, columns, 1)
+        self.ax_pie.set_title('Equipment Type Distribution', fontweight=self.weight)
+        self.ax_pie.set_xlim(-1.25, 1.25)
+        self.ax_pie.set_ylim(-1.25, 1.25)
+        self.ax_pie.set_aspect('equal')
+        self.ax_pie.axis('off')
+        self.wedges, self.pie_labels, self.pie_pcts = [], [], []
+
+        self.ax_bar = figure.add_subplot(1, columns, 2)
+        self.ax_bar.set_title('Average Values', fontweight=self.weight)
+        if ylabel:
+            self.ax_bar.set_ylabel(ylabel)
+        if grid:
+            self.ax_bar.grid(True, alpha=0.3)
+        self.bars = list(self.ax_bar.bar(METRICS, [0] * len(METRICS), color=bar_colors, animated=True))
+        self.bar_labels = [
+            self.ax_bar.text(bar.get_x() + bar.get_width() / 2., 0, '', ha='center', va='bottom',
+                             fontweight=self.weight, animated=True)
+            for bar in self.bars
+        ] if value_labels else []
+        self.ax_bar.set_ylim(0, 1)
+
+        self.density = DensityView(figure.add_subplot(1, columns, 3)) if density else None
+
+        # Laid out once; updates never move the axes
+        figure.tight_layout()
+        self.background = None
+        canvas.mpl_connect('draw_event', self.on_draw)
+
+    def animated_artists(self):
+        return self.wedges + self.pie_labels + self.pie_pcts + self.bars + self.bar_labels
+
+    def on_draw(self, event):
+        # A full draw skips animated artists: keep it as the background and add them on top
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self.draw_animated()
+
+    def draw_animated(self):
+        for artist in self.animated_artists():
+            if artist.get_visible():
+                self.figure.draw_artist(artist)
+
+    def blit(self):
+        if self.background is None:
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self.background)
+        self.draw_animated()
+        self.canvas.blit(self.figure.bbox)
+
+    def pie_colors(self, count):
+        if self.pie_cmap is not None:
+            return self.pie_cmap(np.linspace(0, 1, count))
+        return [f'C{i % 10}' for i in range(count)]
+
+    def update_pie(self, distribution):
+        types = list(distribution.keys())
+        counts = np.array(list(distribution.values()), dtype='float64')
+        total = counts.sum()
+
+        while len(self.wedges) < len(types):
+            self.wedges.append(self.ax_pie.add_patch(Wedge((0, 0), 1, 0, 0, clip_on=False, animated=True)))
+            self.pie_labels.append(self.ax_pie.text(0, 0, '', va='center', clip_on=False, animated=True))
+            self.pie_pcts.append(self.ax_pie.text(0, 0, '', ha='center', va='center', animated=True))
+
+        # Same geometry as ax.pie(..., startangle=90): counter-clockwise from the top
+        angles = 90 + 360 * np.concatenate([[0], np.cumsum(counts)]) / (total or 1)
+        colors = self.pie_colors(len(types))
+        for i, (wedge, label, pct) in enumerate(zip(self.wedges, self.pie_labels, self.pie_pcts)):
+            visible = i < len(types) and counts[i] > 0
+            for artist in (wedge, label, pct):
+                artist.set_visible(visible)
+            if not visible:
+                continue
+
+            wedge.set_theta1(angles[i])
+            wedge.set_theta2(angles[i + 1])
+            wedge.set_facecolor(colors[i])
+            middle = np.deg2rad((angles[i] + angles[i + 1]) / 2)
+            x, y = np.cos(middle), np.sin(middle)
+            label.set_position((1.1 * x, 1.1 * y))
+            label.set_horizontalalignment('left' if x > 0 else 'right')
+            label.set_text(types[i])
+            pct.set_position((0.6 * x, 0.6 * y))
+            pct.set_text(f'{100 * counts[i] / total:.1f}%')
+
+    def update_bars(self, values):
+        for bar, value in zip(self.bars, values):
+            bar.set_height(value)
+        for label, bar, value in zip(self.bar_labels, self.bars, values):
+            label.set_position((bar.get_x() + bar.get_width() / 2., value))
+            label.set_text(f'{value:.2f}')
+
+        # Rescale only when a bar leaves the axis or all of them look tiny in it
+        bottom, top = min(min(values), 0), max(max(values), 0)
+        low, high = self.ax_bar.get_ylim()
+        if top > high or bottom < low or (top > 0 and top < high / 3):
+            self.ax_bar.set_ylim(bottom * 1.15, top * 1.15 or 1)
+            return True
+        return False
+
+    def update(self, summary):
+        self.update_pie(summary['type_distribution'])
+        rescaled = self.update_bars([summary['avg_flowrate'], summary['avg_pressure'], summary['avg_temperature']])
+        if rescaled:
+            self.canvas.draw_idle()
+        else:
+            self.blit()
+
+    def show_points(self, x, y):
+        if self.density is not None:
+            self.density.set_points(x, y)
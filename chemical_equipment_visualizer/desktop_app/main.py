@@ -1,16 +1,21 @@
 import sys
-import requests
 from PyQt5.QtWidgets import *
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
-import numpy as np
+from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
+from api_client import UNAVAILABLE, ApiClient, sync_retry_delay
+from cache import ResponseCache
+from charts import ChartEngine
+from offline import analyze_csv, load_points
+from workers import TaskRunner
 
 class CSVUploader(QMainWindow):
     def __init__(self):
         super().__init__()
-        self.base_url = "http://localhost:8000/api"
+        self.api = ApiClient(cache=ResponseCache())
+        self.tasks = TaskRunner(self)
         self.initUI()
         
     def initUI(self):
@@ -62,6 +67,17 @@ class CSVUploader(QMainWindow):
         upload_btn.setStyleSheet("background: #28a745; color: white; font-weight: bold;")
         controls_layout.addWidget(upload_btn)
         
+        # Local analysis, optionally sent to the server afterwards
+        local_layout = QHBoxLayout()
+        local_btn = QPushButton("Analyze Locally")
+        local_btn.clicked.connect(self.analyze_locally)
+        local_btn.setStyleSheet("background: #6c757d; color: white;")
+        self.sync_check = QCheckBox("Upload in background")
+        self.sync_check.setChecked(True)
+        local_layout.addWidget(local_btn, 1)
+        local_layout.addWidget(self.sync_check)
+        controls_layout.addLayout(local_layout)
+        
         # CSV requirements
         req_label = QLabel("CSV must contain: Equipment Name, Type, Flowrate, Pressure, Temperature")
         req_label.setStyleSheet("color: #666; font-size: 12px;")
@@ -82,9 +98,11 @@ class CSVUploader(QMainWindow):
         
         # Charts Section
         self.chart_group = QGroupBox("Visualizations")
-        chart_layout = QHBoxLayout()
+        chart_layout = QVBoxLayout()
         self.figure = plt.figure(figsize=(10, 4))
         self.canvas = FigureCanvas(self.figure)
+        self.charts = ChartEngine(self.figure, self.canvas, bar_colors=['#007bff', '#28a745', '#ffc107'], ylabel='Value')
+        chart_layout.addWidget(NavigationToolbar(self.canvas, self))
         chart_layout.addWidget(self.canvas)
         self.chart_group.setLayout(chart_layout)
         layout.addWidget(self.chart_group)
@@ -99,7 +117,15 @@ class CSVUploader(QMainWindow):
         history_group.setLayout(history_layout)
         layout.addWidget(history_group)
         
-        # Status
+        # Status, with progress of running uploads and downloads
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setMaximumWidth(200)
+        self.progress_bar.hide()
+        self.cancel_btn = QPushButton("Cancel")
+        self.cancel_btn.clicked.connect(lambda: self.tasks.cancel())
+        self.cancel_btn.hide()
+        self.statusBar().addPermanentWidget(self.progress_bar)
+        self.statusBar().addPermanentWidget(self.cancel_btn)
         self.statusBar().showMessage('Ready')
         self.load_history()
     
@@ -109,27 +135,106 @@ class CSVUploader(QMainWindow):
             self.file_path = file_path
             self.file_label.setText(f"Selected: {file_path.split('/')[-1]}")
     
+    def start_progress(self):
+        self.progress_bar.setRange(0, 0)
+        self.progress_bar.show()
+        self.cancel_btn.show()
+    
+    def show_progress(self, done, total):
+        self.progress_bar.setRange(0, total)
+        self.progress_bar.setValue(done)
+    
+    def stop_progress(self):
+        if not any(self.tasks.is_running(key) for key in ('upload', 'analyze', 'pdf')):
+            self.progress_bar.hide()
+            self.cancel_btn.hide()
+    
     def upload_file(self):
         if not hasattr(self, 'file_path'):
             QMessageBox.warning(self, "Warning", "Please select a CSV file")
             return
-            
+        if self.tasks.is_running('upload'):
+            self.statusBar().showMessage('Upload already running')
+            return
+        
+        self.statusBar().showMessage('Uploading...')
+        self.start_progress()
+        self.tasks.submit(
+            'upload', self.api.upload, self.file_path,
+            on_result=self.upload_finished, on_error=self.show_error,
+            on_progress=self.show_progress, on_done=self.stop_progress,
+            on_cancel=lambda: self.statusBar().showMessage('Upload cancelled')
+        )
+    
+    def upload_finished(self, response):
         try:
-            with open(self.file_path, 'rb') as f:
-                files = {'file': f}
-                response = requests.post(f"{self.base_url}/upload/", files=files)
-                
             if response.status_code == 200:
                 data = response.json()
                 self.display_summary(data['summary'])
                 self.plot_charts(data['summary'])
+                self.load_points(self.file_path)
                 self.load_history()
                 self.statusBar().showMessage('Upload successful')
             else:
                 QMessageBox.critical(self, "Error", "Upload failed")
                 
         except Exception as e:
-            QMessageBox.critical(self, "Error", f"Error: {str(e)}")
+            self.show_error(str(e))
+    
+    def analyze_locally(self):
+        if not hasattr(self, 'file_path'):
+            QMessageBox.warning(self, "Warning", "Please select a CSV file")
+            return
+        if self.tasks.is_running('analyze'):
+            self.statusBar().showMessage('Analysis already running')
+            return
+        
+        file_path = self.file_path
+        self.statusBar().showMessage('Analyzing locally...')
+        self.start_progress()
+        self.tasks.submit(
+            'analyze', analyze_csv, file_path,
+            on_result=lambda result: self.analysis_finished(file_path, result), on_error=self.show_error,
+            on_progress=self.show_progress, on_done=self.stop_progress,
+            on_cancel=lambda: self.statusBar().showMessage('Analysis cancelled')
+        )
+    
+    def analysis_finished(self, file_path, result):
+        self.display_summary(result['summary'])
+        self.plot_charts(result['summary'])
+        self.points_path = file_path
+        self.charts.show_points(*result['points'])
+        if self.sync_check.isChecked():
+            self.sync_upload(file_path)
+        self.statusBar().showMessage('Analyzed locally')
+    
+    def sync_upload(self, file_path, attempt=0):
+        self.tasks.submit(
+            ('sync', file_path), self.api.try_upload, file_path,
+            on_result=lambda response: self.sync_finished(file_path, response, attempt),
+            on_error=lambda error: self.statusBar().showMessage(f'Background upload failed: {error}')
+        )
+    
+    def sync_finished(self, file_path, response, attempt=0):
+        if response is None or response.status_code in UNAVAILABLE:
+            self.sync_failed(file_path, attempt)
+        elif response.status_code == 200:
+            self.statusBar().showMessage('Uploaded in background')
+            self.load_history()
+        else:
+            self.statusBar().showMessage('Background upload failed')
+    
+    def sync_failed(self, file_path, attempt):
+        # Offline: try again later, less often each time
+        delay = sync_retry_delay(attempt)
+        if delay is None:
+            self.statusBar().showMessage('Server unreachable - upload abandoned')
+            return
+        self.statusBar().showMessage('Server unreachable - will retry upload')
+        QTimer.singleShot(delay, lambda: self.sync_upload(file_path, attempt + 1))
+    
+    def show_error(self, error):
+        QMessageBox.critical(self, "Error", f"Error: {error}")
     
     def display_summary(self, summary):
         for i in reversed(range(self.summary_layout.count())): 
@@ -165,29 +270,31 @@ class CSVUploader(QMainWindow):
         self.summary_group.show()
     
     def plot_charts(self, summary):
-        self.figure.clear()
-        
-        ax1 = self.figure.add_subplot(121)
-        ax2 = self.figure.add_subplot(122)
-        
-        types = list(summary['type_distribution'].keys())
-        counts = list(summary['type_distribution'].values())
-        ax1.pie(counts, labels=types, autopct='%1.1f%%', startangle=90)
-        ax1.set_title('Equipment Type Distribution')
-        
-        metrics = ['Flowrate', 'Pressure', 'Temperature']
-        values = [summary['avg_flowrate'], summary['avg_pressure'], summary['avg_temperature']]
-        bars = ax2.bar(metrics, values, color=['#007bff', '#28a745', '#ffc107'])
-        ax2.set_title('Average Values')
-        ax2.set_ylabel('Value')
-        
-        self.figure.tight_layout()
-        self.canvas.draw()
+        # Axes and artists are reused; only their data changes
+        self.charts.update(summary)
         self.chart_group.show()
     
+    def load_points(self, file_path):
+        self.points_path = file_path
+        self.tasks.submit(
+            ('points', file_path), load_points, file_path,
+            on_result=lambda points: self.show_points(file_path, points)
+        )
+    
+    def show_points(self, file_path, points):
+        # Skip points of a file that was replaced by a newer upload meanwhile
+        if file_path == self.points_path:
+            self.charts.show_points(*points)
+    
     def load_history(self):
+        # Show the last known history at once; the request below refreshes it
+        cached = self.api.cached('history/')
+        if cached is not None and not self.tasks.is_running('history'):
+            self.show_history(cached)
+        self.tasks.submit('history', self.api.history, on_result=self.show_history)
+    
+    def show_history(self, response):
         try:
-            response = requests.get(f"{self.base_url}/history/")
             if response.status_code == 200:
                 history = response.json()
                 self.history_list.clear()
@@ -197,18 +304,30 @@ class CSVUploader(QMainWindow):
             pass
     
     def generate_pdf(self):
+        self.start_progress()
+        self.tasks.submit(
+            'pdf', self.api.pdf,
+            on_result=self.save_pdf, on_error=self.show_error,
+            on_progress=self.show_progress, on_done=self.stop_progress
+        )
+    
+    def save_pdf(self, response):
         try:
-            response = requests.get(f"{self.base_url}/pdf/")
             if response.status_code == 200:
                 file_path, _ = QFileDialog.getSaveFileName(self, "Save PDF", "", "PDF (*.pdf)")
                 if file_path:
                     with open(file_path, 'wb') as f:
                         f.write(response.content)
-                    self.statusBar().showMessage('PDF saved')
+                    self.statusBar().showMessage('PDF saved (cached copy, server unreachable)' if response.stale else 'PDF saved')
             else:
                 QMessageBox.critical(self, "Error", "Failed to generate PDF")
         except Exception as e:
-            QMessageBox.critical(self, "Error", f"Error: {str(e)}")
+            self.show_error(str(e))
+    
+    def closeEvent(self, event):
+        self.tasks.shutdown()
+        self.api.close()
+        super().closeEvent(event)
 
 def main():
     app = QApplication(sys.argv)
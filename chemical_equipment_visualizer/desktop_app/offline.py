@@ -0,0 +1,195 @@
+import os
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+CHUNK_SIZE = 200000
+PREVIEW_ROWS = 5
+POINT_LIMIT = 4000000
+METRICS = ["flowrate", "pressure", "temperature"]
+
+
+# Headers read as the reading's time, matched by exact name
+TIMESTAMP_COLUMNS = {"timestamp", "datetime", "recorded_at", "date"}
+
+
+def map_columns(columns):
+    # Kept in step with analytics.ingest.map_columns on the server
+    column_mapping = {}
+    for col in columns:
+        col_lower = col.lower()
+        if "equip" in col_lower and "name" in col_lower:
+            column_mapping[col] = "Equipment Name"
+        elif "type" in col_lower:
+            column_mapping[col] = "Type"
+        elif "flow" in col_lower:
+            column_mapping[col] = "Flowrate"
+        elif "press" in col_lower:
+            column_mapping[col] = "Pressure"
+        elif "temp" in col_lower:
+            column_mapping[col] = "Temperature"
+        elif col_lower.strip().replace(" ", "_") in TIMESTAMP_COLUMNS and "Timestamp" not in column_mapping.values():
+            column_mapping[col] = "Timestamp"
+    return column_mapping
+
+
+def read_chunks(file, chunk_size=CHUNK_SIZE, usecols=None):
+    """Yield the CSV in chunks with the server's column mapping applied.
+
+    ``usecols`` names mapped columns to read; the others are skipped by the
+    parser, which is most of the time spent on a wide file.
+    """
+    header = [str(col).strip() for col in pd.read_csv(file, nrows=0).columns]
+    file.seek(0)
+    mapping = map_columns(header)
+    columns = [mapping.get(col, col) for col in header]
+    keep = [i for i, name in enumerate(columns) if usecols is None or name in usecols]
+    # Closed even when the caller stops early
+    with pd.read_csv(file, usecols=keep, chunksize=chunk_size) as reader:
+        for chunk in reader:
+            chunk.columns = [columns[i] for i in keep]
+            yield chunk
+
+
+def _column(chunk, name, default):
+    if name in chunk.columns:
+        return chunk[name]
+    return pd.Series(default, index=chunk.index)
+
+
+def _text(chunk, name):
+    return _column(chunk, name, "Unknown").fillna("Unknown").astype(str)
+
+
+def _number(chunk, name):
+    # Blank cells become 0 like a missing column; text is an error
+    values = _column(chunk, name, 0)
+    numbers = pd.to_numeric(values, errors="coerce")
+    bad = numbers.isna() & values.notna()
+    if values.dtype == object:
+        bad &= values.str.strip().ne("")
+    if bad.any():
+        raise ValueError(f"{name}: {values[bad].iloc[0]!r} is not a number")
+    return numbers.fillna(0).astype("float64")
+
+
+def normalize_chunk(chunk):
+    """The summary columns of a mapped chunk, coerced like the server does."""
+    return pd.DataFrame({
+        "equipment_type": _text(chunk, "Type"),
+        "flowrate": _number(chunk, "Flowrate"),
+        "pressure": _number(chunk, "Pressure"),
+        "temperature": _number(chunk, "Temperature"),
+    })
+
+
+class LocalSummary:
+    """Running count, sums and type counts over normalized chunks.
+
+    ``as_dict`` has the keys of the server's upload summary except
+    ``percentiles``, which needs the server's t-digest sketches.
+    """
+
+    def __init__(self):
+        self.total_count = 0
+        self.sums = dict.fromkeys(METRICS, 0.0)
+        self.type_counts = Counter()
+
+    def update(self, frame):
+        self.total_count += len(frame)
+        for metric in METRICS:
+            self.sums[metric] += float(frame[metric].to_numpy().sum())
+        self.type_counts.update(frame["equipment_type"].value_counts().to_dict())
+
+    def mean(self, metric):
+        if not self.total_count:
+            return 0
+        return self.sums[metric] / self.total_count
+
+    def as_dict(self):
+        return {
+            "total_count": self.total_count,
+            "avg_flowrate": self.mean("flowrate"),
+            "avg_pressure": self.mean("pressure"),
+            "avg_temperature": self.mean("temperature"),
+            "type_distribution": dict(self.type_counts.most_common()),
+        }
+
+
+class PointSample:
+    """x/y pairs of every ``stride``-th row, at most ``limit`` of them.
+
+    When the sample fills up every other pair is dropped and the stride
+    doubles, so memory stays bounded and the rows kept stay evenly spread
+    over the file.
+    """
+
+    def __init__(self, limit=POINT_LIMIT):
+        self.limit = limit
+        self.stride = 1
+        self.rows = 0
+        self.kept = 0
+        self.xs, self.ys = [], []
+
+    def update(self, x, y):
+        # Rows whose position in the whole file is a multiple of the stride
+        first = -self.rows % self.stride
+        self.xs.append(np.asarray(x, dtype="float32")[first::self.stride])
+        self.ys.append(np.asarray(y, dtype="float32")[first::self.stride])
+        self.rows += len(x)
+        self.kept += len(self.xs[-1])
+        if self.kept > self.limit:
+            x, y = self.arrays()
+            while len(x) > self.limit:
+                x, y = x[::2], y[::2]
+                self.stride *= 2
+            self.xs, self.ys, self.kept = [x], [y], len(x)
+
+    def arrays(self):
+        if not self.xs:
+            return np.empty(0, dtype="float32"), np.empty(0, dtype="float32")
+        return np.concatenate(self.xs), np.concatenate(self.ys)
+
+
+def analyze_csv(path, chunk_size=CHUNK_SIZE, task=None):
+    """Summarize a CSV on this machine, without the server.
+
+    Returns ``{'summary': ..., 'data': ...}`` like a synchronous upload,
+    plus ``points``, an evenly thinned (flowrate, pressure) sample for the
+    density view. Only one chunk and the sample are held in memory; bytes
+    read are reported to ``task``.
+    """
+    summary = LocalSummary()
+    sample = PointSample()
+    preview = []
+    size = os.path.getsize(path)
+    with open(path, "rb") as file:
+        for chunk in read_chunks(file, chunk_size):
+            if len(preview) < PREVIEW_ROWS:
+                head = chunk.head(PREVIEW_ROWS - len(preview))
+                preview.extend(head.astype(object).where(head.notna(), None).to_dict("records"))
+            frame = normalize_chunk(chunk)
+            summary.update(frame)
+            sample.update(frame["flowrate"], frame["pressure"])
+            if task is not None:
+                task.report(min(file.tell(), size), size)
+    return {"summary": summary.as_dict(), "data": preview, "points": sample.arrays()}
+
+
+def load_points(path, chunk_size=CHUNK_SIZE, task=None, limit=POINT_LIMIT):
+    """Flowrate and pressure as float32 arrays; unreadable values become NaN.
+
+    Every row up to ``limit``; past that, an evenly thinned sample of that
+    size, so memory stays bounded however large the file is.
+    """
+    sample = PointSample(limit)
+    with open(path, "rb") as file:
+        for chunk in read_chunks(file, chunk_size, usecols=("Flowrate", "Pressure")):
+            if task is not None:
+                task.check()
+            if "Flowrate" not in chunk.columns or "Pressure" not in chunk.columns:
+                break
+            sample.update(pd.to_numeric(chunk["Flowrate"], errors="coerce"),
+                          pd.to_numeric(chunk["Pressure"], errors="coerce"))
+    return sample.arrays()
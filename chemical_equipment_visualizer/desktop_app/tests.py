@@ -0,0 +1,590 @@
+import importlib.util
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import matplotlib
+matplotlib.use("Agg")
+import numpy as np
+import requests
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from PyQt5.QtCore import QCoreApplication, QEventLoop, QTimer
+
+from api_client import SYNC_RETRIES, ApiClient, Reply, UploadBody, sync_retry_delay
+from cache import ResponseCache
+from charts import ChartEngine, DensityView
+from offline import PointSample, analyze_csv, load_points, map_columns
+from workers import Cancelled, Task, TaskRunner
+
+app = QCoreApplication.instance() or QCoreApplication([])
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "backend")
+SAMPLE_CSV = os.path.join(BACKEND, os.pardir, "sample.csv")
+
+
+def wait_until(condition, timeout=5000):
+    """Run the event loop until condition() holds, so queued signals arrive."""
+    loop = QEventLoop()
+    timer = QTimer()
+    timer.timeout.connect(lambda: condition() and loop.quit())
+    timer.start(5)
+    QTimer.singleShot(timeout, loop.quit)
+    loop.exec_()
+    timer.stop()
+    if not condition():
+        raise AssertionError("timed out waiting for the event loop")
+
+
+class TempDirTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir, ignore_errors=True)
+
+    def write(self, name, data):
+        path = os.path.join(self.dir, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+
+class TaskTests(unittest.TestCase):
+
+    def run_task(self, task):
+        events = []
+        task.signals.result.connect(lambda value: events.append(("result", value)))
+        task.signals.error.connect(lambda message: events.append(("error", message)))
+        task.signals.cancelled.connect(lambda: events.append(("cancelled",)))
+        task.signals.done.connect(lambda: events.append(("done",)))
+        task.run()
+        return events
+
+    def test_result(self):
+        self.assertEqual(self.run_task(Task(lambda a, b, task: a + b, 1, b=2)), [("result", 3), ("done",)])
+
+    def test_error(self):
+        def fail(task):
+            raise ValueError("bad file")
+        self.assertEqual(self.run_task(Task(fail)), [("error", "bad file"), ("done",)])
+
+    def test_cancelled(self):
+        task = Task(lambda task: task.cancel() or "dropped")
+        # The result of a task cancelled while it ran is dropped
+        self.assertEqual(self.run_task(task), [("cancelled",), ("done",)])
+
+    def test_report_once_per_percent(self):
+        task = Task(lambda task: None)
+        progress = []
+        task.signals.progress.connect(lambda done, total: progress.append(done))
+        for done in range(0, 1001):
+            task.report(done, 1000)
+        self.assertEqual(progress, list(range(0, 1001, 10)))
+        task.cancel()
+        self.assertRaises(Cancelled, task.report, 1000, 1000)
+
+
+class TaskRunnerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.runner = TaskRunner()
+        self.addCleanup(self.runner.shutdown)
+
+    def test_same_key_coalesces(self):
+        release = threading.Event()
+        calls, results = [], []
+
+        def slow(task):
+            calls.append(1)
+            release.wait(5)
+            return "history"
+
+        first = self.runner.submit("history", slow, on_result=results.append)
+        second = self.runner.submit("history", slow, on_result=results.append)
+        self.assertIs(first, second)
+        self.assertTrue(self.runner.is_running("history"))
+
+        release.set()
+        wait_until(lambda: not self.runner.is_running("history"))
+        self.assertEqual((calls, results), ([1], ["history"]))
+
+    def test_cancel(self):
+        started, outcome = threading.Event(), []
+
+        def loop(task):
+            started.set()
+            while True:
+                task.check()
+
+        self.runner.submit("pdf", loop, on_cancel=lambda: outcome.append("cancelled"),
+                           on_done=lambda: outcome.append(self.runner.is_running("pdf")))
+        started.wait(5)
+        self.runner.cancel("pdf")
+        wait_until(lambda: len(outcome) == 2)
+        # done comes last and sees the task already forgotten
+        self.assertEqual(outcome, ["cancelled", False])
+
+
+class UploadBodyTests(TempDirTestCase):
+
+    def test_multipart_body(self):
+        data = os.urandom(200 * 1024)
+        path = self.write('equip"ment.csv', data)
+        body = UploadBody(path)
+        boundary = body.content_type.split("boundary=")[1]
+
+        parts = []
+        for size in (1, 1000, 64 * 1024, 100 * 1024):
+            parts.append(body.read(size))
+        parts.append(body.read())
+        sent = b"".join(parts)
+
+        self.assertEqual(len(sent), len(body))
+        self.assertEqual(body.read(10), b"")
+        head, rest = sent.split(b"\r\n\r\n", 1)
+        self.assertEqual(head.split(b"\r\n")[0], f"--{boundary}".encode())
+        self.assertIn(b'filename="equip%22ment.csv"', head)
+        self.assertEqual(rest, data + f"\r\n--{boundary}--\r\n".encode())
+
+    def test_progress_and_cancel(self):
+        path = self.write("big.csv", b"x" * (300 * 1024))
+        task = Task(lambda task: None)
+        progress = []
+        task.signals.progress.connect(lambda done, total: progress.append((done, total)))
+        body = UploadBody(path, task)
+
+        body.read(64 * 1024)
+        self.assertEqual(progress, [(64 * 1024, len(body))])
+        task.cancel()
+        self.assertRaises(Cancelled, body.read, 64 * 1024)
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Answers from the server's script: a list of (status, body[, headers]) per path."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.answer()
+
+    def do_POST(self):
+        self.answer(self.rfile.read(int(self.headers["Content-Length"])))
+
+    def answer(self, body=None):
+        server = self.server
+        server.seen.append((self.command, self.path, dict(self.headers), body, self.client_address))
+        script = server.script[self.path.split("?")[0]]
+        status, content, *headers = script.pop(0) if len(script) > 1 else script[0]
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers[0] if headers else {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class ApiClientTests(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.seen, self.server.script = [], {}
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.client = ApiClient(f"http://127.0.0.1:{self.server.server_port}/api/", backoff=0)
+        self.addCleanup(self.client.close)
+
+    def test_base_url(self):
+        with mock.patch.dict(os.environ, {"EQUIPMENT_API_URL": "http://example.test/api/"}):
+            self.assertEqual(ApiClient().url("/summary/"), "http://example.test/api/summary/")
+        with mock.patch.dict(os.environ, clear=True):
+            self.assertEqual(ApiClient().base_url, "http://localhost:8000/api")
+
+    def test_get(self):
+        self.server.script["/api/summary/"] = [(200, json.dumps({"total_count": 3}).encode())]
+        reply = self.client.summary(upload_id=7)
+
+        self.assertEqual((reply.status_code, reply.json()), (200, {"total_count": 3}))
+        method, path, headers = self.server.seen[0][:3]
+        self.assertEqual((method, path), ("GET", "/api/summary/?upload_id=7"))
+        self.assertEqual(headers["Accept-Encoding"], "gzip")
+        self.assertEqual(self.client.latencies[-1][:3], ("GET", "summary/", 200))
+
+    def test_get_retried(self):
+        self.server.script["/api/history/"] = [(503, b""), (502, b""), (200, b"[]")]
+        reply = self.client.history()
+        self.assertEqual((reply.status_code, reply.json()), (200, []))
+        self.assertEqual(len(self.server.seen), 3)
+
+    def test_keep_alive(self):
+        self.server.script["/api/history/"] = [(200, b"[]")]
+        for _ in range(3):
+            self.client.history()
+        # Every request reused the first connection
+        self.assertEqual(len({seen[4] for seen in self.server.seen}), 1)
+
+    def test_upload_not_retried(self):
+        data = b"Equipment Name,Type\n" * 10000
+        path = self.write("equipment.csv", data)
+        self.server.script["/api/upload/"] = [(503, b"{}"), (200, b"{}")]
+        task = Task(lambda task: None)
+        progress = []
+        task.signals.progress.connect(lambda done, total: progress.append(done))
+
+        reply = self.client.upload(path, task=task)
+        self.assertEqual(reply.status_code, 503)
+        self.assertEqual(len(self.server.seen), 1)
+        body = self.server.seen[0][3]
+        self.assertIn(data, body)
+        # The body's progress, then the reply's
+        self.assertIn(len(body), progress)
+
+    def test_try_upload(self):
+        path = self.write("equipment.csv", b"Equipment Name,Type\n")
+        self.server.script["/api/upload/"] = [(400, b"{}")]
+        self.assertEqual(self.client.try_upload(path).status_code, 400)
+
+        # Nothing listens on the port any more
+        offline = ApiClient(self.client.base_url, retries=0)
+        self.addCleanup(offline.close)
+        self.server.shutdown()
+        self.server.server_close()
+        self.assertIsNone(offline.try_upload(path))
+        # Not a network problem, so not swallowed for a retry
+        with self.assertRaises(OSError):
+            self.client.try_upload(os.path.join(self.dir, "missing.csv"))
+
+
+class SyncRetryTests(unittest.TestCase):
+    """Background uploads from the analysis window, with the server mocked out."""
+
+    def setUp(self):
+        import app
+        self.window = mock.Mock()
+        self.sync_finished = lambda *args: app.CSVUploader.sync_finished(self.window, *args)
+        self.window.sync_failed = lambda *args: app.CSVUploader.sync_failed(self.window, *args)
+        patcher = mock.patch.object(app, "QTimer")
+        self.timer = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_delays(self):
+        delays = []
+        while (delay := sync_retry_delay(len(delays))) is not None:
+            delays.append(delay)
+        self.assertEqual(delays, [15000, 30000, 60000, 120000, 240000, 300000])
+
+    def test_unreachable_is_retried_with_backoff(self):
+        for attempt, response in enumerate([None, Reply(503, {}, b"", 0)]):
+            self.sync_finished("/data/equipment.csv", response, attempt)
+            delay, retry = self.timer.singleShot.call_args.args
+            self.assertEqual(delay, sync_retry_delay(attempt))
+            retry()
+            self.window.sync_upload.assert_called_with("/data/equipment.csv", attempt + 1)
+
+    def test_gives_up(self):
+        self.sync_finished("/data/equipment.csv", None, SYNC_RETRIES)
+        self.timer.singleShot.assert_not_called()
+        self.assertIn("gave up", self.window.statusBar().showMessage.call_args.args[0])
+
+    def test_rejected_is_not_retried(self):
+        self.sync_finished("/data/equipment.csv", Reply(400, {}, b'{"error": "No rows"}', 0))
+        self.timer.singleShot.assert_not_called()
+        self.assertEqual(self.window.statusBar().showMessage.call_args.args[0],
+                         "Server rejected equipment.csv: No rows")
+
+
+class ResponseCacheTests(TempDirTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.cache = ResponseCache(self.dir, max_bytes=250)
+
+    def test_store_and_load(self):
+        headers = {"ETag": '"v1"', "Content-Type": "application/json", "Vary": "Accept"}
+        self.cache.store("http://server/api/summary/?upload_id=1", headers, b"{}")
+        meta, content = self.cache.load("http://server/api/summary/?upload_id=1")
+
+        self.assertEqual(content, b"{}")
+        self.assertEqual((meta["etag"], meta["last_modified"]), ('"v1"', None))
+        self.assertEqual(meta["headers"], {"Content-Type": "application/json"})
+        self.assertIsNone(self.cache.load("http://server/api/summary/?upload_id=2"))
+
+    def test_mismatched_body_ignored(self):
+        self.cache.store("a", {}, b"complete")
+        with open(self.cache._path("a", ".body"), "wb") as f:
+            f.write(b"half")
+        self.assertIsNone(self.cache.load("a"))
+
+    def test_prune_oldest_first(self):
+        for position, url in enumerate("abc"):
+            self.cache.store(url, {}, url.encode() * 100)
+            # Distinct mtimes, without sleeping
+            os.utime(self.cache._path(url, ".body"), (position, position))
+        self.cache.prune()
+        self.assertEqual([url for url in "abc" if self.cache.load(url)], ["b", "c"])
+        self.assertEqual(sorted(os.listdir(self.dir)), sorted(
+            os.path.basename(self.cache._path(url, suffix)) for url in "bc" for suffix in (".body", ".json")
+        ))
+
+
+class CachedApiClientTests(ApiClientTests):
+
+    def setUp(self):
+        super().setUp()
+        self.client.cache = ResponseCache(os.path.join(self.dir, "cache"))
+
+    def test_revalidated_with_etag(self):
+        self.server.script["/api/history/"] = [
+            (200, b"[1]", {"ETag": '"v1"', "Last-Modified": "Sat, 01 Jun 2024 10:00:00 GMT"}),
+            (304, b""),
+        ]
+        self.assertIsNone(self.client.cached("history/"))
+        first = self.client.history()
+        second = self.client.history()
+
+        self.assertFalse(first.from_cache)
+        self.assertEqual((second.status_code, second.json(), second.from_cache, second.stale), (200, [1], True, False))
+        headers = self.server.seen[1][2]
+        self.assertEqual(headers["If-None-Match"], '"v1"')
+        self.assertEqual(headers["If-Modified-Since"], "Sat, 01 Jun 2024 10:00:00 GMT")
+        self.assertEqual(self.client.cached("history/").json(), [1])
+
+    def test_params_are_separate_entries(self):
+        self.server.script["/api/summary/"] = [(200, b"all", {"ETag": '"a"'}), (200, b"one", {"ETag": '"b"'})]
+        self.client.summary()
+        self.client.summary(upload_id=3)
+        self.assertEqual(self.client.cached("summary/").content, b"all")
+        self.assertEqual(self.client.cached("summary/", {"upload_id": 3}).content, b"one")
+
+    def test_stale_on_server_error(self):
+        self.server.script["/api/pdf/"] = [(200, b"%PDF", {"ETag": '"v1"'}), (503, b"")]
+        self.client.pdf()
+        reply = self.client.pdf()
+        self.assertEqual((reply.content, reply.from_cache, reply.stale), (b"%PDF", True, True))
+
+    def test_stale_when_unreachable(self):
+        self.server.script["/api/history/"] = [(200, b"[1]")]
+        self.client.history()
+        self.server.shutdown()
+        self.server.server_close()
+        self.client.session.close()
+
+        with self.assertLogs("api_client", "WARNING"):
+            reply = self.client.history()
+        self.assertEqual((reply.json(), reply.stale), ([1], True))
+        with self.assertRaises(requests.ConnectionError):
+            self.client.summary()
+
+    def test_errors_not_stored(self):
+        self.server.script["/api/summary/"] = [(404, b"{}")]
+        self.assertEqual(self.client.summary().status_code, 404)
+        self.assertIsNone(self.client.cached("summary/"))
+
+
+class PointSampleTests(TempDirTestCase):
+
+    def test_every_row_under_the_limit(self):
+        sample = PointSample(limit=100)
+        for start in range(0, 90, 30):
+            sample.update(np.arange(start, start + 30), -np.arange(start, start + 30))
+        x, y = sample.arrays()
+        self.assertEqual(x.tolist(), list(range(90)))
+        self.assertEqual(y.tolist(), [-value for value in range(90)])
+
+    def test_thinned_evenly_past_the_limit(self):
+        sample = PointSample(limit=100)
+        # Uneven chunk sizes, so the stride has to carry over between chunks
+        for start, size in ((0, 70), (70, 333), (403, 1), (404, 596)):
+            sample.update(np.arange(start, start + size), np.zeros(size))
+        x, _ = sample.arrays()
+        self.assertLessEqual(len(x), 100)
+        self.assertEqual(sample.stride, 16)
+        self.assertEqual(x.tolist(), list(range(0, 1000, 16)))
+
+    def test_load_points(self):
+        path = self.write("equipment.csv", (
+            "Equipment Name,Equipment Type,Flow Rate,Pressure (bar),Temp\n"
+            + "".join(f"P{i},Pump,{i},{i / 10},80\n" for i in range(1000))
+            + "P-bad,Pump,n/a,1,80\n"
+        ).encode())
+        x, y = load_points(path, chunk_size=64)
+        self.assertEqual(len(x), 1001)
+        self.assertEqual(x.dtype, np.float32)
+        np.testing.assert_allclose(y[:1000], np.arange(1000) / 10, rtol=1e-6)
+        self.assertTrue(np.isnan(x[-1]))
+
+        x, y = load_points(path, chunk_size=64, limit=300)
+        self.assertLessEqual(len(x), 300)
+        self.assertEqual(x[:3].tolist(), [0, 4, 8])
+
+    def test_load_points_without_columns(self):
+        path = self.write("other.csv", b"Name,Type\nP1,Pump\n")
+        self.assertEqual([len(values) for values in load_points(path)], [0, 0])
+
+
+class DensityViewTests(unittest.TestCase):
+
+    def setUp(self):
+        figure = Figure()
+        FigureCanvasAgg(figure)
+        self.view = DensityView(figure.add_subplot(), bins=50, max_points=1000)
+        rng = np.random.default_rng(0)
+        self.x = rng.normal(100, 10, 50000).astype("float32")
+        self.y = rng.normal(5, 1, 50000).astype("float32")
+
+    def test_image_when_crowded(self):
+        self.view.set_points(self.x, self.y)
+        self.assertTrue(self.view.image.get_visible())
+        self.assertFalse(self.view.scatter.get_visible())
+        counts = self.view.image.get_array()
+        # Every point is in view after set_points and lands in one cell
+        self.assertEqual(int(counts.sum()), len(self.x))
+        self.assertEqual(counts.shape, (50, 50))
+
+    def test_scatter_when_zoomed_in(self):
+        self.view.set_points(self.x, self.y)
+        self.view.ax.set_xlim(99, 101)
+        self.view.ax.set_ylim(4.9, 5.1)
+        self.assertTrue(self.view.scatter.get_visible())
+        self.assertFalse(self.view.image.get_visible())
+        inside = (self.x >= 99) & (self.x < 101) & (self.y >= 4.9) & (self.y < 5.1)
+        self.assertEqual(len(self.view.scatter.get_offsets()), int(inside.sum()))
+
+        self.view.ax.set_xlim(0, 200)
+        self.assertTrue(self.view.image.get_visible())
+
+    def test_non_finite_dropped(self):
+        self.view.set_points(np.array([1, np.nan, 3], dtype="float32"), np.array([1, 2, np.inf], dtype="float32"))
+        self.assertEqual(self.view.scatter.get_offsets().tolist(), [[1, 1]])
+
+
+class ChartEngineTests(unittest.TestCase):
+
+    def setUp(self):
+        figure = Figure()
+        self.canvas = FigureCanvasAgg(figure)
+        self.engine = ChartEngine(figure, self.canvas, value_labels=True)
+        self.canvas.draw()
+
+    def summary(self, distribution, flowrate=100, pressure=5, temperature=80):
+        return {"type_distribution": distribution, "avg_flowrate": flowrate,
+                "avg_pressure": pressure, "avg_temperature": temperature}
+
+    def test_updates_in_place(self):
+        self.engine.update(self.summary({"Pump": 3, "Valve": 1}))
+        wedges, bars = list(self.engine.wedges), list(self.engine.bars)
+        axes = list(self.engine.figure.axes)
+
+        self.engine.update(self.summary({"Pump": 1}, flowrate=110))
+        self.assertEqual(self.engine.wedges, wedges)
+        self.assertEqual(self.engine.bars, bars)
+        self.assertEqual(self.engine.figure.axes, axes)
+        self.assertEqual([wedge.get_visible() for wedge in wedges], [True, False])
+        self.assertEqual((wedges[0].theta1, wedges[0].theta2), (90, 450))
+        self.assertEqual(self.engine.bar_labels[0].get_text(), "110.00")
+
+    def test_pie_angles(self):
+        self.engine.update(self.summary({"Pump": 3, "Valve": 1}))
+        angles = [(wedge.theta1, wedge.theta2) for wedge in self.engine.wedges]
+        self.assertEqual(angles, [(90, 360), (360, 450)])
+        self.assertEqual([pct.get_text() for pct in self.engine.pie_pcts], ["75.0%", "25.0%"])
+
+    def test_rescale_only_when_needed(self):
+        self.assertTrue(self.engine.update_bars([100, 5, 80]))
+        top = self.engine.ax_bar.get_ylim()[1]
+        self.assertFalse(self.engine.update_bars([90, 6, 70]))
+        self.assertEqual(self.engine.ax_bar.get_ylim()[1], top)
+        # Taller than the axis, then too small to read in it
+        self.assertTrue(self.engine.update_bars([200, 5, 80]))
+        self.assertTrue(self.engine.update_bars([10, 1, 8]))
+
+
+@unittest.skipUnless(importlib.util.find_spec("django"), "needs the backend's requirements")
+class AnalyzeCsvTests(TempDirTestCase):
+    """The local summary against the server's own ingest code on the same file."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        if BACKEND not in sys.path:
+            sys.path.insert(0, BACKEND)
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+        import django
+        django.setup()
+
+    def server_result(self, path, chunk_size):
+        from analytics.ingest import normalize_chunk, preview_records, read_chunks
+        from analytics.summaries import SummaryAccumulator
+
+        accumulator, preview = SummaryAccumulator(), []
+        with open(path, "rb") as file:
+            for chunk in read_chunks(file, chunk_size):
+                if len(preview) < 5:
+                    preview.extend(preview_records(chunk)[:5 - len(preview)])
+                accumulator.update(normalize_chunk(chunk))
+        return accumulator.as_dict(), preview
+
+    def assertMatchesServer(self, path, chunk_size=200000):
+        local = analyze_csv(path, chunk_size=chunk_size)
+        summary, preview = self.server_result(path, chunk_size)
+
+        expected = {key: value for key, value in summary.items() if key != "percentiles"}
+        self.assertEqual(local["summary"].keys(), expected.keys())
+        self.assertEqual(local["summary"]["total_count"], expected["total_count"])
+        self.assertEqual(list(local["summary"]["type_distribution"].items()),
+                         list(expected["type_distribution"].items()))
+        for metric in ("flowrate", "pressure", "temperature"):
+            self.assertAlmostEqual(local["summary"][f"avg_{metric}"], expected[f"avg_{metric}"], places=9)
+        self.assertEqual(local["data"], preview)
+        return local
+
+    def test_sample_csv(self):
+        self.assertMatchesServer(SAMPLE_CSV)
+
+    def test_column_mapping_matches_server(self):
+        from analytics.ingest import map_columns as server_map_columns
+
+        headers = ["Equipment Name", "Equip Type", "Flow", "Press", "Temp C", "Runtime",
+                   "Update Count", "Recorded At", "Timestamp", "Date"]
+        self.assertEqual(map_columns(headers), server_map_columns(headers))
+        self.assertEqual(map_columns(headers)["Recorded At"], "Timestamp")
+        self.assertNotIn("Runtime", map_columns(headers))
+
+    def test_messy_file_in_chunks(self):
+        rng = np.random.default_rng(5)
+        types = rng.choice(["Pump", "Valve", "Heat Exchanger"], 5000, p=[0.5, 0.3, 0.2])
+        values = rng.normal([120, 5, 90], [20, 1, 10], size=(5000, 3)).round(3)
+        lines = ["Site, TEMPERATURE_C ,EQUIPMENT NAME,Equipment Type,Flow Rate (m3/h),Pressure (bar),Notes"]
+        lines += [f"North,{t},U-{i},{kind},{f},{p}," for i, (kind, (f, p, t)) in enumerate(zip(types, values))]
+        path = self.write("messy.csv", ("\n".join(lines) + "\n").encode())
+
+        local = self.assertMatchesServer(path, chunk_size=777)
+        x, y = local["points"]
+        np.testing.assert_allclose(x, values[:, 0].astype("float32"))
+        np.testing.assert_allclose(y, values[:, 1].astype("float32"))
+
+    def test_blank_cells(self):
+        lines = ["Equipment Name,Type,Flowrate,Pressure,Temperature", "P-1,Pump,1.5,2,3", ",,,,", "P-3,Pump,4, ,6"]
+        path = self.write("blanks.csv", ("\n".join(lines) + "\n").encode())
+        local = self.assertMatchesServer(path, chunk_size=2)
+        self.assertEqual(local["summary"]["type_distribution"], {"Pump": 2, "Unknown": 1})
+
+        path = self.write("text.csv", b"Type,Flowrate\nPump,oops\n")
+        with self.assertRaisesRegex(ValueError, "Flowrate"):
+            analyze_csv(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+
+class Cancelled(Exception):
+    pass
+
+
+class TaskSignals(QObject):
+    progress = pyqtSignal(int, int)   # done, total
+    result = pyqtSignal(object)
+    error = pyqtSignal(str)
+    cancelled = pyqtSignal()
+    done = pyqtSignal()               # always last, whatever the outcome
+
+
+class Task(QRunnable):
+    """Runs fn(*args, task=task) on a pool thread and reports back through signals.
+
+    Cancellation is cooperative: fn calls task.check() (or task.report())
+    between blocks of work. A request already waiting on the server can't
+    be interrupted, but its result is dropped once the task is cancelled.
+    """
+
+    def __init__(self, fn, *args, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = TaskSignals()
+        self.is_cancelled = False
+        self._reported = -1
+
+    def cancel(self):
+        self.is_cancelled = True
+
+    def check(self):
+        if self.is_cancelled:
+            raise Cancelled()
+
+    def report(self, done, total):
+        self.check()
+        # One signal per percent is plenty for a progress bar
+        percent = done * 100 // total if total else 0
+        if percent != self._reported or done == total:
+            self._reported = percent
+            self.signals.progress.emit(done, total)
+
+    def run(self):
+        try:
+            self.check()
+            result = self.fn(*self.args, task=self, **self.kwargs)
+            self.check()
+        except Cancelled:
+            self.signals.cancelled.emit()
+        except Exception as e:
+            self.signals.error.emit(str(e))
+        else:
+            self.signals.result.emit(result)
+        finally:
+            self.signals.done.emit()
+
+
+class TaskRunner(QObject):
+    """Keyed background tasks for a window.
+
+    Submitting a key that is still running returns the running task
+    instead of starting another, so repeated clicks on e.g. "Refresh
+    History" collapse into one request.
+    """
+
+    def __init__(self, parent=None, max_threads=4):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self.tasks = {}
+
+    def submit(self, key, fn, *args, on_result=None, on_error=None, on_progress=None, on_cancel=None,
+               on_done=None, **kwargs):
+        if key in self.tasks:
+            return self.tasks[key]
+
+        task = Task(fn, *args, **kwargs)
+        # Forget the task before on_done runs, so on_done sees it finished
+        task.signals.done.connect(lambda: self.tasks.pop(key, None))
+        for signal, slot in ((task.signals.result, on_result), (task.signals.error, on_error),
+                             (task.signals.progress, on_progress), (task.signals.cancelled, on_cancel),
+                             (task.signals.done, on_done)):
+            if slot is not None:
+                signal.connect(slot)
+
+        self.tasks[key] = task
+        self.pool.start(task)
+        return task
+
+    def is_running(self, key):
+        return key in self.tasks
+
+    def cancel(self, key=None):
+        for name, task in list(self.tasks.items()):
+            if key is None or name == key:
+                task.cancel()
+
+    def shutdown(self, timeout=3000):
+        self.cancel()
+        self.pool.waitForDone(timeout)